@@ -0,0 +1,65 @@
+"""
+Measures how long importing parts of the library takes in a fresh
+interpreter, and which modules each import pulls in.
+
+    python benchmarks/bench_import.py
+    python benchmarks/bench_import.py --num-repeats 10
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+DEFAULT_STATEMENTS = [
+    "from rl_utils.envs import create_vectorized_envs",
+    "from rl_utils.envs.vec_env import ShmemVecEnv",
+    "from rl_utils.envs.pointmass import PointMassEnv",
+    "import torch",
+    "import gym",
+]
+
+TIME_IMPORT = """
+import json, sys, time
+start = time.perf_counter()
+exec({statement!r})
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    "elapsed": elapsed,
+    "torch": "torch" in sys.modules,
+    "gym": "gym" in sys.modules,
+}}))
+"""
+
+
+def time_import(statement, num_repeats):
+    times = []
+    for _ in range(num_repeats):
+        out = subprocess.run(
+            [sys.executable, "-c", TIME_IMPORT.format(statement=statement)],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        times.append(result["elapsed"])
+    return statistics.median(times), result["torch"], result["gym"]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--statements", type=str, nargs="+", default=DEFAULT_STATEMENTS)
+    parser.add_argument("--num-repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'statement':>50} {'median ms':>10} {'torch':>6} {'gym':>6}")
+    for statement in args.statements:
+        elapsed, has_torch, has_gym = time_import(statement, args.num_repeats)
+        print(
+            f"{statement:>50} {elapsed * 1000:10.1f} {str(has_torch):>6} {str(has_gym):>6}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Measures the env steps per second of the PointMass envs across batch sizes.
+
+    python benchmarks/bench_pointmass.py --batch-sizes 1 1000 1000000
+    python benchmarks/bench_pointmass.py --compile-step
+"""
+
+import argparse
+import time
+
+import torch
+
+from rl_utils.envs import create_vectorized_envs
+from rl_utils.envs.pointmass import PointMassObstacleParams, SquareObstacle
+
+
+def time_env(env_id, batch_size, args):
+    kwargs = {}
+    if env_id == "PointMassObstacle-v0":
+        kwargs["params"] = PointMassObstacleParams(
+            square_obstacles=[
+                SquareObstacle((x, y), 0.2, 0.2, 30.0)
+                for x in (-0.75, 0.75)
+                for y in (-0.75, 0.75)
+            ]
+        )
+    envs = create_vectorized_envs(
+        env_id,
+        batch_size,
+        batched_info=not args.unbatched_info,
+        compile_step=args.compile_step,
+        **kwargs,
+    )
+    actions = torch.rand(batch_size, 2) * 2 - 1
+    envs.reset()
+    for _ in range(args.num_warmup_steps):
+        envs.step(actions)
+
+    start = time.perf_counter()
+    for _ in range(args.num_steps):
+        envs.step(actions)
+    return batch_size * args.num_steps / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--batch-sizes",
+        type=int,
+        nargs="+",
+        default=[1, 10, 100, 1_000, 10_000, 100_000, 1_000_000],
+    )
+    parser.add_argument(
+        "--env-ids",
+        type=str,
+        nargs="+",
+        default=["PointMass-v0", "PointMassObstacle-v0"],
+    )
+    parser.add_argument("--num-steps", type=int, default=100)
+    parser.add_argument("--num-warmup-steps", type=int, default=10)
+    parser.add_argument("--compile-step", action="store_true")
+    parser.add_argument(
+        "--unbatched-info",
+        action="store_true",
+        help="Return a list of info dicts instead of a dict of tensors.",
+    )
+    args = parser.parse_args()
+
+    print(f"{'env':>22} {'batch size':>12} {'steps/sec':>14}")
+    for env_id in args.env_ids:
+        for batch_size in args.batch_sizes:
+            steps_per_sec = time_env(env_id, batch_size, args)
+            print(f"{env_id:>22} {batch_size:>12} {steps_per_sec:14.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Compares the per-step latency of the ShmemVecEnv worker transports on an
+environment that does no work, so the time is all synchronization overhead.
+
+    python benchmarks/bench_transport.py --num-envs 8 --num-steps 5000
+"""
+
+import argparse
+import time
+
+import gym
+import numpy as np
+from gym import spaces
+
+from rl_utils.envs.vec_env import ShmemVecEnv
+
+
+class NoopEnv(gym.Env):
+    observation_space = spaces.Box(low=-1.0, high=1.0, shape=(4,), dtype=np.float32)
+    action_space = spaces.Discrete(2)
+
+    def reset(self):
+        return np.zeros(4, dtype=np.float32)
+
+    def step(self, action):
+        return np.zeros(4, dtype=np.float32), 0.0, False, {}
+
+
+def time_transport(transport, args):
+    envs = ShmemVecEnv(
+        [NoopEnv for _ in range(args.num_envs)],
+        context=args.context,
+        envs_per_worker=args.envs_per_worker,
+        transport=transport,
+    )
+    actions = np.zeros(args.num_envs, dtype=np.int64)
+    envs.reset()
+    for _ in range(args.num_warmup_steps):
+        envs.step(actions)
+
+    step_times = np.zeros(args.num_steps)
+    for i in range(args.num_steps):
+        start = time.perf_counter()
+        envs.step(actions)
+        step_times[i] = time.perf_counter() - start
+    envs.close()
+    return step_times * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-envs", type=int, default=8)
+    parser.add_argument("--envs-per-worker", type=int, default=1)
+    parser.add_argument("--num-steps", type=int, default=5000)
+    parser.add_argument("--num-warmup-steps", type=int, default=200)
+    parser.add_argument("--context", type=str, default="spawn")
+    args = parser.parse_args()
+
+    print(f"{'transport':>10} {'mean us':>10} {'p50 us':>10} {'p99 us':>10}")
+    for transport in ["pipe", "shmem"]:
+        step_us = time_transport(transport, args)
+        print(
+            f"{transport:>10} {step_us.mean():10.1f} {np.percentile(step_us, 50):10.1f} {np.percentile(step_us, 99):10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Fixtures to run the `vec_env_bench` benchmarks under pytest. The benchmarks
+are skipped unless `--run-benchmarks` is passed.
+
+    python -m pytest benchmarks --run-benchmarks --bench-json bench.json
+"""
+
+import pytest
+from vec_env_bench import run_isolated, write_results
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--run-benchmarks", action="store_true", help="Run the benchmarks."
+    )
+    parser.addoption(
+        "--bench-json",
+        default=None,
+        help="Write the results of all benchmarks to this JSON file.",
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--run-benchmarks"):
+        return
+    skip = pytest.mark.skip(reason="needs --run-benchmarks")
+    for item in items:
+        if "vec_env_benchmark" in getattr(item, "fixturenames", ()):
+            item.add_marker(skip)
+
+
+@pytest.fixture(scope="session")
+def _bench_results(request):
+    results = []
+    yield results
+    path = request.config.getoption("--bench-json")
+    if path is not None and len(results) > 0:
+        write_results(path, results)
+
+
+@pytest.fixture
+def vec_env_benchmark(_bench_results, record_property):
+    """
+    Call with a `BenchConfig` to run it in a fresh interpreter. Returns the
+    result dict, which is also collected into the `--bench-json` output.
+    """
+
+    def run(config):
+        result = run_isolated(config)
+        _bench_results.append(result)
+        record_property("steps_per_sec", result["steps_per_sec"])
+        record_property("latency_us", result["latency_us"])
+        return result
+
+    return run
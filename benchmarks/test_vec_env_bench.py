@@ -0,0 +1,34 @@
+import pytest
+from vec_env_bench import OBS_CONFIGS, BenchConfig
+
+
+@pytest.mark.parametrize("obs_config", list(OBS_CONFIGS.keys()))
+@pytest.mark.parametrize("backend", ["dummy", "subproc", "shmem"])
+def test_vec_env(vec_env_benchmark, backend, obs_config):
+    result = vec_env_benchmark(
+        BenchConfig(backend=backend, obs_config=obs_config, **OBS_CONFIGS[obs_config])
+    )
+    assert result["steps_per_sec"] > 0
+
+
+@pytest.mark.parametrize("obs_config", ["vector", "image"])
+@pytest.mark.parametrize("frame_stack", [None, 4])
+def test_wrapper_stack(vec_env_benchmark, obs_config, frame_stack):
+    result = vec_env_benchmark(
+        BenchConfig(
+            backend="wrapped",
+            obs_config=obs_config,
+            frame_stack=frame_stack,
+            **OBS_CONFIGS[obs_config],
+        )
+    )
+    assert result["steps_per_sec"] > 0
+
+
+@pytest.mark.parametrize("step_cost_us", [100.0, 1000.0])
+@pytest.mark.parametrize("backend", ["dummy", "shmem"])
+def test_step_cost(vec_env_benchmark, backend, step_cost_us):
+    result = vec_env_benchmark(
+        BenchConfig(backend=backend, step_cost_us=step_cost_us, num_steps=200)
+    )
+    assert result["steps_per_sec"] > 0
@@ -0,0 +1,405 @@
+"""
+Benchmarks the `VecEnv` backends and the wrapper stack of
+`create_vectorized_envs` on synthetic envs. Reports steps per second, step
+latency percentiles and peak RSS, and writes the results as JSON so runs of
+different versions can be compared.
+
+    python benchmarks/vec_env_bench.py --output bench.json
+    python benchmarks/vec_env_bench.py --backends shmem wrapped --obs-configs image
+    python benchmarks/vec_env_bench.py --output new.json --compare bench.json
+
+Every benchmark runs in a fresh interpreter so its peak RSS is not mixed up
+with the benchmarks before it. The same benchmarks run under pytest with
+`python -m pytest benchmarks --run-benchmarks --bench-json bench.json`.
+"""
+
+import argparse
+import dataclasses
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import gym
+import numpy as np
+from gym import spaces
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BACKENDS = ["dummy", "subproc", "shmem", "wrapped"]
+
+# Observation settings of the synthetic env by name.
+OBS_CONFIGS = {
+    "vector": {"obs_shape": (64,), "obs_dtype": "float32"},
+    "image": {"obs_shape": (84, 84, 3), "obs_dtype": "uint8"},
+    "dict": {"obs_shape": (64,), "obs_dtype": "float32", "dict_keys": ["a", "b"]},
+}
+
+
+@dataclass(frozen=True)
+class BenchConfig:
+    """
+    :param backend: "dummy", "subproc" or "shmem" for the bare `VecEnv`, or
+        "wrapped" for the stack `create_vectorized_envs` builds around
+        `ShmemVecEnv` (`VecMonitor`, `VecPyTorch` and, with `frame_stack`,
+        `VecPyTorchFrameStack`).
+    :param dict_keys: If not empty, observations are a dict with an array of
+        `obs_shape` under each key.
+    :param step_cost_us: How long each env step busy-waits, to stand in for
+        the simulation cost.
+    :param episode_length: Steps until the synthetic env is done.
+    """
+
+    backend: str
+    obs_config: str = "vector"
+    num_envs: int = 8
+    envs_per_worker: int = 1
+    obs_shape: Tuple[int, ...] = (64,)
+    obs_dtype: str = "float32"
+    dict_keys: List[str] = field(default_factory=list)
+    step_cost_us: float = 0.0
+    episode_length: int = 100
+    frame_stack: Optional[int] = None
+    num_steps: int = 1000
+    num_warmup_steps: int = 100
+    context: str = "spawn"
+
+    @property
+    def name(self) -> str:
+        name = f"{self.backend}-{self.obs_config}-n{self.num_envs}"
+        if self.envs_per_worker != 1:
+            name += f"-epw{self.envs_per_worker}"
+        if self.step_cost_us != 0:
+            name += f"-cost{self.step_cost_us:g}us"
+        if self.frame_stack is not None:
+            name += f"-stack{self.frame_stack}"
+        return name
+
+
+class SyntheticEnv(gym.Env):
+    """
+    A gym env with configurable observations and step cost. Observations are
+    generated once so a step only costs `step_cost_us` plus the overhead of
+    returning the observation.
+    """
+
+    def __init__(
+        self, obs_shape, obs_dtype, dict_keys=(), step_cost_us=0.0, episode_length=100
+    ):
+        dtype = np.dtype(obs_dtype)
+        if np.issubdtype(dtype, np.integer):
+            box = spaces.Box(0, 255, obs_shape, dtype=dtype)
+        else:
+            box = spaces.Box(-1.0, 1.0, obs_shape, dtype=dtype)
+        if len(dict_keys) == 0:
+            self.observation_space = box
+        else:
+            self.observation_space = spaces.Dict({k: box for k in dict_keys})
+        self.action_space = spaces.Box(-1.0, 1.0, (2,), dtype=np.float32)
+        self._obs = self.observation_space.sample()
+        self._step_cost = step_cost_us / 1e6
+        self._episode_length = episode_length
+        self._step_idx = 0
+
+    def seed(self, seed=None):
+        self.observation_space.seed(seed)
+        self.action_space.seed(seed)
+        return [seed]
+
+    def reset(self):
+        self._step_idx = 0
+        return self._obs
+
+    def step(self, action):
+        if self._step_cost > 0:
+            end = time.perf_counter() + self._step_cost
+            while time.perf_counter() < end:
+                pass
+        self._step_idx += 1
+        return self._obs, 0.0, self._step_idx >= self._episode_length, {}
+
+
+def _make_synthetic_env(config: BenchConfig, seed: int = 0) -> SyntheticEnv:
+    env = SyntheticEnv(
+        config.obs_shape,
+        config.obs_dtype,
+        config.dict_keys,
+        config.step_cost_us,
+        config.episode_length,
+    )
+    env.seed(seed)
+    return env
+
+
+def _create_envs(config: BenchConfig):
+    from functools import partial
+
+    from rl_utils.envs import create_vectorized_envs
+    from rl_utils.envs.vec_env import DummyVecEnv, ShmemVecEnv, SubprocVecEnv
+
+    if config.backend == "wrapped":
+        return create_vectorized_envs(
+            "Synthetic-v0",
+            config.num_envs,
+            create_env_fn=partial(_make_synthetic_env, config),
+            vec_env_type="shmem",
+            context_mode=config.context,
+            envs_per_worker=config.envs_per_worker,
+            num_frame_stack=config.frame_stack,
+        )
+
+    env_fns = [
+        partial(_make_synthetic_env, config, seed=i) for i in range(config.num_envs)
+    ]
+    if config.backend == "dummy":
+        return DummyVecEnv(env_fns)
+    if config.backend == "subproc":
+        return SubprocVecEnv(
+            env_fns, context=config.context, envs_per_worker=config.envs_per_worker
+        )
+    if config.backend == "shmem":
+        return ShmemVecEnv(
+            env_fns, context=config.context, envs_per_worker=config.envs_per_worker
+        )
+    raise ValueError(f"Unrecognized backend {config.backend}")
+
+
+def _max_rss_mb(who) -> float:
+    max_rss = resource.getrusage(who).ru_maxrss
+    # Linux reports kilobytes and macOS bytes.
+    if sys.platform == "darwin":
+        max_rss /= 1024
+    return max_rss / 1024
+
+
+def _peak_worker_rss_mb(envs) -> Optional[float]:
+    """
+    The largest peak RSS of the worker processes, read from /proc while they
+    are still running. None without workers or on platforms without /proc.
+    """
+    while not hasattr(envs, "procs") and not hasattr(envs, "ps"):
+        if not hasattr(envs, "venv"):
+            return None
+        envs = envs.venv
+    peaks = []
+    for proc in getattr(envs, "procs", None) or envs.ps:
+        try:
+            with open(f"/proc/{proc.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        peaks.append(int(line.split()[1]) / 1024)
+        except OSError:
+            return None
+    return max(peaks, default=None)
+
+
+def run_benchmark(config: BenchConfig) -> Dict[str, Any]:
+    """
+    Runs the benchmark in this process. The peak RSS values are the peaks of
+    the whole process, so use `run_isolated` to compare them across configs.
+    """
+    envs = _create_envs(config)
+    if config.backend == "wrapped":
+        import torch
+
+        actions = torch.zeros((config.num_envs, 2))
+    else:
+        actions = np.zeros((config.num_envs, 2), dtype=np.float32)
+
+    envs.reset()
+    for _ in range(config.num_warmup_steps):
+        envs.step(actions)
+
+    step_times = np.zeros(config.num_steps)
+    start = time.perf_counter()
+    for i in range(config.num_steps):
+        step_start = time.perf_counter()
+        envs.step(actions)
+        step_times[i] = time.perf_counter() - step_start
+    elapsed = time.perf_counter() - start
+    peak_worker_rss_mb = _peak_worker_rss_mb(envs)
+    envs.close()
+
+    step_us = step_times * 1e6
+    return {
+        "name": config.name,
+        "config": dataclasses.asdict(config),
+        "steps_per_sec": config.num_envs * config.num_steps / elapsed,
+        "latency_us": {
+            "mean": float(step_us.mean()),
+            "p50": float(np.percentile(step_us, 50)),
+            "p90": float(np.percentile(step_us, 90)),
+            "p99": float(np.percentile(step_us, 99)),
+            "max": float(step_us.max()),
+        },
+        "peak_rss_mb": _max_rss_mb(resource.RUSAGE_SELF),
+        "peak_worker_rss_mb": peak_worker_rss_mb,
+    }
+
+
+def run_isolated(config: BenchConfig) -> Dict[str, Any]:
+    """
+    Runs the benchmark in a fresh interpreter.
+    """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [REPO_ROOT] + [p for p in env.get("PYTHONPATH", "").split(os.pathsep) if p]
+    )
+    proc = subprocess.run(
+        [
+            sys.executable,
+            os.path.abspath(__file__),
+            "--run-one",
+            json.dumps(dataclasses.asdict(config)),
+        ],
+        capture_output=True,
+        text=True,
+        env=env,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Benchmark {config.name} failed:\n{proc.stderr}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def get_metadata() -> Dict[str, Any]:
+    metadata = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.node(),
+        "num_cpus": os.cpu_count(),
+    }
+    import torch
+
+    for module in [np, torch, gym]:
+        metadata[module.__name__] = module.__version__
+    try:
+        metadata["git_commit"] = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=REPO_ROOT,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        metadata["git_commit"] = None
+    return metadata
+
+
+def write_results(path: str, results: List[Dict[str, Any]]) -> None:
+    with open(path, "w") as f:
+        json.dump({"metadata": get_metadata(), "results": results}, f, indent=2)
+
+
+def compare_results(
+    results: List[Dict[str, Any]], baseline_path: str, tolerance: float
+) -> List[str]:
+    """
+    :returns: The names of the benchmarks whose steps per second dropped by
+        more than `tolerance` relative to the baseline JSON.
+    """
+    with open(baseline_path) as f:
+        baseline = {r["name"]: r for r in json.load(f)["results"]}
+    regressions = []
+    print(f"{'benchmark':>40} {'baseline':>12} {'current':>12} {'change':>8}")
+    for result in results:
+        if result["name"] not in baseline:
+            continue
+        old = baseline[result["name"]]["steps_per_sec"]
+        new = result["steps_per_sec"]
+        change = new / old - 1
+        flag = ""
+        if change < -tolerance:
+            regressions.append(result["name"])
+            flag = " REGRESSION"
+        print(f"{result['name']:>40} {old:12.0f} {new:12.0f} {change:+8.1%}{flag}")
+    return regressions
+
+
+def get_suite(args) -> List[BenchConfig]:
+    configs = []
+    for backend in args.backends:
+        for obs_config in args.obs_configs:
+            if backend == "wrapped" and obs_config == "dict":
+                # VecPyTorchFrameStack does not support dict observations.
+                continue
+            for step_cost_us in args.step_costs_us:
+                configs.append(
+                    BenchConfig(
+                        backend=backend,
+                        obs_config=obs_config,
+                        num_envs=args.num_envs,
+                        envs_per_worker=args.envs_per_worker,
+                        step_cost_us=step_cost_us,
+                        frame_stack=args.frame_stack if backend == "wrapped" else None,
+                        num_steps=args.num_steps,
+                        num_warmup_steps=args.num_warmup_steps,
+                        context=args.context,
+                        **OBS_CONFIGS[obs_config],
+                    )
+                )
+    return configs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", type=str, nargs="+", default=BACKENDS)
+    parser.add_argument(
+        "--obs-configs", type=str, nargs="+", default=list(OBS_CONFIGS.keys())
+    )
+    parser.add_argument("--step-costs-us", type=float, nargs="+", default=[0.0])
+    parser.add_argument("--num-envs", type=int, default=8)
+    parser.add_argument("--envs-per-worker", type=int, default=1)
+    parser.add_argument("--frame-stack", type=int, default=4)
+    parser.add_argument("--num-steps", type=int, default=1000)
+    parser.add_argument("--num-warmup-steps", type=int, default=100)
+    parser.add_argument("--context", type=str, default="spawn")
+    parser.add_argument("--output", type=str, default=None)
+    parser.add_argument(
+        "--compare", type=str, default=None, help="A JSON file of a previous run."
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="The allowed relative drop in steps per second when comparing.",
+    )
+    parser.add_argument("--run-one", type=str, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one is not None:
+        config = json.loads(args.run_one)
+        config["obs_shape"] = tuple(config["obs_shape"])
+        print(json.dumps(run_benchmark(BenchConfig(**config))))
+        return
+
+    results = []
+    print(
+        f"{'benchmark':>40} {'steps/sec':>12} {'p50 us':>10} {'p99 us':>10} {'rss MB':>8} {'worker MB':>10}"
+    )
+    for config in get_suite(args):
+        result = run_isolated(config)
+        results.append(result)
+        latency = result["latency_us"]
+        worker_rss = result["peak_worker_rss_mb"]
+        worker_rss = "-" if worker_rss is None else f"{worker_rss:.1f}"
+        print(
+            f"{result['name']:>40} {result['steps_per_sec']:12.0f} {latency['p50']:10.1f} {latency['p99']:10.1f} {result['peak_rss_mb']:8.1f} {worker_rss:>10}"
+        )
+
+    if args.output is not None:
+        write_results(args.output, results)
+    if args.compare is not None:
+        regressions = compare_results(results, args.compare, args.tolerance)
+        if len(regressions) > 0:
+            print(f"{len(regressions)} benchmarks regressed: {regressions}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,7 @@ import pickle
 import random
 import time
 from collections import OrderedDict, defaultdict
+from collections.abc import Sequence
 from typing import Any, Callable, Dict, List, Tuple
 
 import gym
@@ -186,6 +187,102 @@ def obs_to_dict(obs):
     return {None: obs}
 
 
+def infer_info_schema(
+    infos: List[Dict[str, Any]], ignore_keys: Tuple[str] = ()
+) -> Dict[str, Tuple[Tuple[int], np.dtype]]:
+    """
+    Finds the info keys that can be stored as columns of shape `(num_envs,
+    *shape)`. These are keys with numeric scalar or array values that have the
+    same shape in every info that contains them. Nested dicts, other types and
+    keys containing a "." are left out.
+
+    :returns: A dict from key to the `(shape, dtype)` of one value.
+    """
+    schema = {}
+    skip_keys = set(ignore_keys)
+    for info in infos:
+        for k, v in info.items():
+            if k in skip_keys:
+                continue
+            if isinstance(v, (bool, int, float, np.generic, np.ndarray)):
+                v = np.asarray(v)
+            if (
+                "." in k
+                or not isinstance(v, np.ndarray)
+                or v.dtype.kind not in "biuf"
+                or (k in schema and schema[k][0] != v.shape)
+            ):
+                skip_keys.add(k)
+                schema.pop(k, None)
+                continue
+            dtype = v.dtype if k not in schema else np.result_type(schema[k][1], v)
+            schema[k] = (v.shape, dtype)
+    return schema
+
+
+def _set_nested(d: Dict[str, Any], key: str, value: Any) -> None:
+    *parents, name = key.split(".")
+    for parent in parents:
+        d = d.setdefault(parent, {})
+    d[name] = value
+
+
+class ColumnarInfos(Sequence):
+    """
+    The infos of a vectorized step stored as columns of shape `(num_envs,
+    ...)`, plus a dict per env for the keys that do not fit a column. Indexing
+    builds the info dict of an env on first access, so code that expects a
+    list of dicts still works. Keys of columns containing a "." are nested, so
+    the column "episode.reward" shows up as `info["episode"]["reward"]`.
+
+    Changes to the built dicts are not reflected in the columns.
+
+    :param columns: Dict from key to an array of shape `(num_envs, ...)`.
+    :param present: Dict from key to a bool array of shape `(num_envs,)` of the
+        envs that have a value in the column.
+    :param extra_infos: The info dict of each env with the remaining keys.
+    """
+
+    def __init__(
+        self,
+        columns: Dict[str, np.ndarray],
+        present: Dict[str, np.ndarray],
+        extra_infos: List[Dict[str, Any]],
+    ):
+        self.columns = columns
+        self.present = present
+        self.extra_infos = list(extra_infos)
+        self._infos = [None for _ in self.extra_infos]
+
+    def set_column(self, key: str, values: np.ndarray, present: np.ndarray) -> None:
+        """
+        Add a column, also adding it to the info dicts that were already built.
+        """
+        self.columns[key] = values
+        self.present[key] = present
+        for idx, info in enumerate(self._infos):
+            if info is not None and present[idx]:
+                _set_nested(info, key, values[idx])
+
+    def __len__(self):
+        return len(self.extra_infos)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if self._infos[idx] is None:
+            info = {}
+            for k, col in self.columns.items():
+                if self.present[k][idx]:
+                    _set_nested(info, k, col[idx])
+            info.update(self.extra_infos[idx])
+            self._infos[idx] = info
+        return self._infos[idx]
+
+    def __setitem__(self, idx, info):
+        self._infos[idx] = info
+
+
 def reshape_obs_space(obs_space: spaces.Box, new_shape: Tuple[int]) -> spaces.Box:
     assert isinstance(obs_space, spaces.Box)
     return spaces.Box(
@@ -211,44 +308,78 @@ def update_obs_space(cur_space, update_obs_space):
 
 class StackHelper:
     """
-    A helper for stacking observations.
+    A helper for stacking observations. With `n_procs` the stack is kept on
+    `device` in a ring buffer of `2 * n_stack` frames where every frame is
+    written twice, `n_stack` frames apart, so the current stack is always a
+    contiguous slice and an update only writes the newest frame.
     """
 
     def __init__(self, ob_shape, n_stack, device, n_procs=None):
         self.input_dim = ob_shape[0]
+        self.n_stack = n_stack
         self.n_procs = n_procs
         self.real_shape = (n_stack * self.input_dim, *ob_shape[1:])
+        # Stacked final observations of the envs that finished in the last
+        # `update_obs` and the env indices they belong to.
+        self.final_obs = None
+        self.final_obs_env_ids = None
         if self.n_procs is not None:
-            self.stacked_obs = torch.zeros((n_procs, *self.real_shape))
+            self._frames = torch.zeros(
+                (n_procs, 2 * n_stack * self.input_dim, *ob_shape[1:])
+            )
             if device is not None:
-                self.stacked_obs = self.stacked_obs.to(device)
+                self._frames = self._frames.to(device)
+            self._idx = 0
         else:
             self.stacked_obs = np.zeros(self.real_shape)
 
+    def _get_stack(self):
+        start = (self._idx + 1) * self.input_dim
+        return self._frames[:, start : start + self.real_shape[0]]
+
+    def _write_frame(self, obs):
+        self._idx = (self._idx + 1) % self.n_stack
+        d = self.input_dim
+        for start in (self._idx * d, (self._idx + self.n_stack) * d):
+            self._frames[:, start : start + d] = obs
+
     def update_obs(self, obs, dones=None, infos=None):
         """
         - obs: torch.tensor
+
+        With `n_procs`, the "final_obs" of the finished envs in `infos` are
+        replaced by their stacked final observations. These are views into
+        `self.final_obs`, which is replaced on the next call.
         """
         if self.n_procs is not None:
-            self.stacked_obs[:, : -self.input_dim] = self.stacked_obs[
-                :, self.input_dim :
-            ].clone()
-            for i, new in enumerate(dones):
-                if new:
-                    self.stacked_obs[i] = 0
-            self.stacked_obs[:, -self.input_dim :] = obs
-
-            # Update info so the final observation frame stack has the final
-            # observation as the final frame in the stack.
-            for i in range(len(infos)):
-                if "final_obs" in infos[i]:
-                    new_final = torch.zeros(*self.stacked_obs.shape[1:])
-                    new_final[:-1] = self.stacked_obs[i][1:]
-                    new_final[-1] = torch.tensor(infos[i]["final_obs"]).to(
-                        self.stacked_obs.device
-                    )
-                    infos[i]["final_obs"] = new_final
-            return self.stacked_obs.clone(), infos
+            device = self._frames.device
+            env_ids = []
+            final_frames = []
+            for i, info in enumerate(infos):
+                if "final_obs" in info:
+                    env_ids.append(i)
+                    final_frames.append(info["final_obs"])
+            if len(env_ids) > 0:
+                # The final observation is the final frame of the stack before
+                # the reset.
+                final_frames = torch.as_tensor(
+                    np.stack(final_frames), dtype=self._frames.dtype, device=device
+                )
+                self.final_obs = torch.cat(
+                    [self._get_stack()[env_ids, self.input_dim :], final_frames],
+                    dim=1,
+                )
+                self.final_obs_env_ids = env_ids
+                for i, final_obs in zip(env_ids, self.final_obs):
+                    infos[i]["final_obs"] = final_obs
+            else:
+                self.final_obs = None
+                self.final_obs_env_ids = None
+
+            dones = torch.as_tensor(dones, dtype=torch.bool, device=device)
+            self._frames[dones] = 0
+            self._write_frame(obs)
+            return self._get_stack().clone(), infos
         else:
             self.stacked_obs[: -self.input_dim] = self.stacked_obs[
                 self.input_dim :
@@ -259,12 +390,9 @@ class StackHelper:
 
     def reset(self, obs):
         if self.n_procs is not None:
-            if torch.backends.cudnn.deterministic:
-                self.stacked_obs = torch.zeros(self.stacked_obs.shape)
-            else:
-                self.stacked_obs.zero_()
-            self.stacked_obs[:, -self.input_dim :] = obs
-            return self.stacked_obs.clone()
+            self._frames.zero_()
+            self._write_frame(obs)
+            return self._get_stack().clone()
         else:
             self.stacked_obs = np.zeros(self.stacked_obs.shape)
             self.stacked_obs[-self.input_dim :] = obs
@@ -1,4 +1,12 @@
 from .env_creator import create_vectorized_envs
-from .vec_env.vec_env import VecEnv
 
 __all__ = ["VecEnv", "create_vectorized_envs"]
+
+
+def __getattr__(name):
+    # Imported lazily since the vec envs pull in torch and gym.
+    if name == "VecEnv":
+        from .vec_env.vec_env import VecEnv
+
+        return VecEnv
+    raise AttributeError(f"module {__name__} has no attribute {name}")
@@ -0,0 +1,14 @@
+from .acrobot import BatchedAcrobotEnv
+from .base import BatchedClassicControlEnv
+from .cartpole import BatchedCartPoleEnv
+from .mountain_car import BatchedMountainCarContinuousEnv, BatchedMountainCarEnv
+from .pendulum import BatchedPendulumEnv
+
+__all__ = [
+    "BatchedClassicControlEnv",
+    "BatchedCartPoleEnv",
+    "BatchedPendulumEnv",
+    "BatchedMountainCarEnv",
+    "BatchedMountainCarContinuousEnv",
+    "BatchedAcrobotEnv",
+]
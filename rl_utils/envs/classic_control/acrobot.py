@@ -0,0 +1,140 @@
+import math
+from typing import Optional
+
+import numpy as np
+import torch
+from gym import spaces
+
+from rl_utils.envs.classic_control.base import BatchedClassicControlEnv
+
+
+def wrap(x: torch.Tensor, m: float, M: float) -> torch.Tensor:
+    """
+    Wraps `x` into [m, M] by whole periods of `M - m`. Values already in the
+    range are unchanged.
+    """
+    diff = M - m
+    x = torch.where(x > M, x - diff * torch.ceil((x - M) / diff), x)
+    return torch.where(x < m, x + diff * torch.ceil((m - x) / diff), x)
+
+
+class BatchedAcrobotEnv(BatchedClassicControlEnv):
+    """
+    Batched version of gym's `Acrobot-v1` with the "book" dynamics and no
+    torque noise. The state is (theta1, theta2, dtheta1, dtheta2).
+    """
+
+    max_episode_steps = 500
+
+    dt = 0.2
+    LINK_LENGTH_1 = 1.0
+    LINK_MASS_1 = 1.0
+    LINK_MASS_2 = 1.0
+    LINK_COM_POS_1 = 0.5
+    LINK_COM_POS_2 = 0.5
+    LINK_MOI = 1.0
+    MAX_VEL_1 = 4 * math.pi
+    MAX_VEL_2 = 9 * math.pi
+    AVAIL_TORQUE = [-1.0, 0.0, +1]
+
+    def __init__(
+        self,
+        num_envs: int,
+        device: Optional[torch.device] = None,
+        seed: Optional[int] = None,
+        dtype: torch.dtype = torch.float32,
+        batched_info: bool = False,
+        **kwargs,
+    ):
+        high = np.array(
+            [1.0, 1.0, 1.0, 1.0, self.MAX_VEL_1, self.MAX_VEL_2], dtype=np.float32
+        )
+        super().__init__(
+            num_envs,
+            spaces.Box(-high, high, dtype=np.float32),
+            spaces.Discrete(3),
+            state_dim=4,
+            device=device,
+            seed=seed,
+            dtype=dtype,
+            batched_info=batched_info,
+        )
+        self._avail_torque = torch.tensor(
+            self.AVAIL_TORQUE, dtype=dtype, device=self._device
+        )
+
+    def _sample_init_states(self, n):
+        return self._uniform(-0.1, 0.1, (n, 4))
+
+    def _get_obs(self, state):
+        theta1, theta2, dtheta1, dtheta2 = state.unbind(-1)
+        return torch.stack(
+            [
+                torch.cos(theta1),
+                torch.sin(theta1),
+                torch.cos(theta2),
+                torch.sin(theta2),
+                dtheta1,
+                dtheta2,
+            ],
+            dim=-1,
+        )
+
+    def _dsdt(self, s: torch.Tensor, a: torch.Tensor) -> torch.Tensor:
+        m1 = self.LINK_MASS_1
+        m2 = self.LINK_MASS_2
+        l1 = self.LINK_LENGTH_1
+        lc1 = self.LINK_COM_POS_1
+        lc2 = self.LINK_COM_POS_2
+        I1 = self.LINK_MOI
+        I2 = self.LINK_MOI
+        g = 9.8
+        theta1, theta2, dtheta1, dtheta2 = s.unbind(-1)
+        d1 = (
+            m1 * lc1**2
+            + m2 * (l1**2 + lc2**2 + 2 * l1 * lc2 * torch.cos(theta2))
+            + I1
+            + I2
+        )
+        d2 = m2 * (lc2**2 + l1 * lc2 * torch.cos(theta2)) + I2
+        phi2 = m2 * lc2 * g * torch.cos(theta1 + theta2 - math.pi / 2.0)
+        phi1 = (
+            -m2 * l1 * lc2 * dtheta2**2 * torch.sin(theta2)
+            - 2 * m2 * l1 * lc2 * dtheta2 * dtheta1 * torch.sin(theta2)
+            + (m1 * lc1 + m2 * l1) * g * torch.cos(theta1 - math.pi / 2)
+            + phi2
+        )
+        ddtheta2 = (
+            a + d2 / d1 * phi1 - m2 * l1 * lc2 * dtheta1**2 * torch.sin(theta2) - phi2
+        ) / (m2 * lc2**2 + I2 - d2**2 / d1)
+        ddtheta1 = -(d2 * ddtheta2 + phi1) / d1
+        return torch.stack([dtheta1, dtheta2, ddtheta1, ddtheta2], dim=-1)
+
+    def _rk4(self, s: torch.Tensor, a: torch.Tensor) -> torch.Tensor:
+        """
+        A single 4th order Runge-Kutta step of length `dt`.
+        """
+        dt2 = self.dt / 2.0
+        k1 = self._dsdt(s, a)
+        k2 = self._dsdt(s + dt2 * k1, a)
+        k3 = self._dsdt(s + dt2 * k2, a)
+        k4 = self._dsdt(s + self.dt * k3, a)
+        return s + self.dt / 6.0 * (k1 + 2 * k2 + 2 * k3 + k4)
+
+    def _step_states(self, state, actions):
+        torque = self._avail_torque[self._discrete_actions(actions)]
+        ns = self._rk4(state, torque)
+        state = torch.stack(
+            [
+                wrap(ns[:, 0], -math.pi, math.pi),
+                wrap(ns[:, 1], -math.pi, math.pi),
+                ns[:, 2].clamp(-self.MAX_VEL_1, self.MAX_VEL_1),
+                ns[:, 3].clamp(-self.MAX_VEL_2, self.MAX_VEL_2),
+            ],
+            dim=-1,
+        )
+        terminated = (
+            -torch.cos(state[:, 0]) - torch.cos(state[:, 1] + state[:, 0]) > 1.0
+        )
+        reward = terminated.to(self._dtype) - 1.0
+        return state, reward, terminated
@@ -0,0 +1,158 @@
+from abc import abstractmethod
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import torch
+from gym import spaces
+
+from rl_utils.envs.vec_env.timing import timed
+from rl_utils.envs.vec_env.vec_env import FINAL_OBS_KEY, VecEnv
+
+
+class BatchedClassicControlEnv(VecEnv):
+    """
+    Base for the batched versions of the gym classic control envs. The state of
+    every env is a row of `self.state` and all envs are stepped with the same
+    tensor ops. Finished envs are reset automatically, like in the other
+    `VecEnv`s, with the last observation of the episode under `FINAL_OBS_KEY`
+    in the info.
+
+    Subclasses define the spaces, `max_episode_steps` and the dynamics.
+    Observations are float32 tensors on `device`, rewards are of shape (N, 1)
+    and dones are a bool tensor on the CPU.
+
+    :param dtype: The dtype of the state. Use `torch.float64` to match the
+        gym implementations, which integrate in NumPy doubles.
+    :param batched_info: If True, `step` returns the info as a single dict
+        instead of a dict per env, like `PointMassEnv`. On steps where an
+        episode ends, it has the "episode" reward and length, the final
+        observation and "bad_transition" as tensors over all envs, which are
+        only meaningful for the envs that are done.
+    """
+
+    max_episode_steps: int
+
+    def __init__(
+        self,
+        num_envs: int,
+        observation_space: spaces.Space,
+        action_space: spaces.Space,
+        state_dim: int,
+        device: Optional[torch.device] = None,
+        seed: Optional[int] = None,
+        dtype: torch.dtype = torch.float32,
+        batched_info: bool = False,
+    ):
+        if device is None:
+            device = torch.device("cpu")
+        self._device = torch.device(device)
+        self._dtype = dtype
+        self._batched_info = batched_info
+        self._generator = torch.Generator(device=self._device)
+        if seed is None:
+            self._generator.seed()
+        else:
+            self._generator.manual_seed(seed)
+            observation_space.seed(seed)
+            action_space.seed(seed)
+
+        self.state = torch.zeros(
+            (num_envs, state_dim), dtype=dtype, device=self._device
+        )
+        self._ep_steps = torch.zeros(num_envs, dtype=torch.long, device=self._device)
+        self._ep_returns = torch.zeros(num_envs, dtype=dtype, device=self._device)
+        self._actions = None
+        super().__init__(num_envs, observation_space, action_space)
+
+    @abstractmethod
+    def _sample_init_states(self, n: int) -> torch.Tensor:
+        """
+        :returns: `n` initial states of shape (n, state_dim).
+        """
+
+    @abstractmethod
+    def _step_states(
+        self, state: torch.Tensor, actions: torch.Tensor
+    ) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        """
+        :param actions: The actions as passed to `step`, already on the device.
+        :returns: The next state, the reward of shape (N,) and whether each env
+            reached a terminal state.
+        """
+
+    def _get_obs(self, state: torch.Tensor) -> torch.Tensor:
+        return state
+
+    def _uniform(self, low, high, shape) -> torch.Tensor:
+        return (
+            torch.rand(
+                shape, generator=self._generator, dtype=self._dtype, device=self._device
+            )
+            * (high - low)
+            + low
+        )
+
+    def reset(self):
+        self.state = self._sample_init_states(self.num_envs)
+        self._ep_steps.zero_()
+        self._ep_returns.zero_()
+        return self._get_obs(self.state).float()
+
+    def step_async(self, actions):
+        self._actions = actions
+
+    @timed("step_wait")
+    def step_wait(self):
+        actions = torch.as_tensor(self._actions, device=self._device)
+        self._actions = None
+        self.state, reward, terminated = self._step_states(self.state, actions)
+        self._ep_steps += 1
+        self._ep_returns += reward
+        truncated = self._ep_steps >= self.max_episode_steps
+        dones = terminated | truncated
+        obs = self._get_obs(self.state).float()
+
+        infos: Union[Dict[str, Any], List[Dict[str, Any]]]
+        if self._batched_info:
+            infos = {}
+        else:
+            infos = [{} for _ in range(self.num_envs)]
+        if dones.any():
+            done_ids = torch.nonzero(dones).view(-1)
+            if self._batched_info:
+                infos["episode"] = {
+                    "reward": self._ep_returns.clone(),
+                    "length": self._ep_steps.clone(),
+                }
+                infos[FINAL_OBS_KEY] = obs.clone()
+                infos["bad_transition"] = truncated
+            else:
+                final_obs = obs[done_ids]
+                for j, (i, ep_return, ep_len, is_truncated) in enumerate(
+                    zip(
+                        done_ids.tolist(),
+                        self._ep_returns[done_ids].tolist(),
+                        self._ep_steps[done_ids].tolist(),
+                        truncated[done_ids].tolist(),
+                    )
+                ):
+                    infos[i]["episode"] = {"reward": ep_return, "length": ep_len}
+                    infos[i][FINAL_OBS_KEY] = final_obs[j]
+                    if is_truncated:
+                        # Same as `TimeLimitMask` for the gym envs.
+                        infos[i]["bad_transition"] = True
+
+            self.state[done_ids] = self._sample_init_states(len(done_ids))
+            self._ep_steps[done_ids] = 0
+            self._ep_returns[done_ids] = 0
+            obs[done_ids] = self._get_obs(self.state[done_ids]).float()
+
+        return obs, reward.float().view(-1, 1), dones.cpu(), infos
+
+    def _discrete_actions(self, actions: torch.Tensor) -> torch.Tensor:
+        """
+        Discrete actions may come in as (N,) or (N, 1), of any dtype.
+        """
+        return actions.view(self.num_envs).long()
+
+    def _continuous_actions(self, actions: torch.Tensor) -> torch.Tensor:
+        return actions.view(self.num_envs, -1).to(self._dtype)
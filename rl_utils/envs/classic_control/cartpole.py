@@ -0,0 +1,91 @@
+import math
+from typing import Optional
+
+import numpy as np
+import torch
+from gym import spaces
+
+from rl_utils.envs.classic_control.base import BatchedClassicControlEnv
+
+
+class BatchedCartPoleEnv(BatchedClassicControlEnv):
+    """
+    Batched version of gym's `CartPole-v1`. The state is
+    (x, x_dot, theta, theta_dot).
+    """
+
+    max_episode_steps = 500
+
+    gravity = 9.8
+    masscart = 1.0
+    masspole = 0.1
+    total_mass = masspole + masscart
+    length = 0.5
+    polemass_length = masspole * length
+    force_mag = 10.0
+    tau = 0.02
+    theta_threshold_radians = 12 * 2 * math.pi / 360
+    x_threshold = 2.4
+
+    def __init__(
+        self,
+        num_envs: int,
+        device: Optional[torch.device] = None,
+        seed: Optional[int] = None,
+        dtype: torch.dtype = torch.float32,
+        batched_info: bool = False,
+        **kwargs,
+    ):
+        high = np.array(
+            [
+                self.x_threshold * 2,
+                np.finfo(np.float32).max,
+                self.theta_threshold_radians * 2,
+                np.finfo(np.float32).max,
+            ],
+            dtype=np.float32,
+        )
+        super().__init__(
+            num_envs,
+            spaces.Box(-high, high, dtype=np.float32),
+            spaces.Discrete(2),
+            state_dim=4,
+            device=device,
+            seed=seed,
+            dtype=dtype,
+            batched_info=batched_info,
+        )
+
+    def _sample_init_states(self, n):
+        return self._uniform(-0.05, 0.05, (n, 4))
+
+    def _step_states(self, state, actions):
+        x, x_dot, theta, theta_dot = state.unbind(-1)
+        force = torch.where(
+            self._discrete_actions(actions) == 1, self.force_mag, -self.force_mag
+        ).to(self._dtype)
+        costheta = torch.cos(theta)
+        sintheta = torch.sin(theta)
+
+        temp = (
+            force + self.polemass_length * theta_dot**2 * sintheta
+        ) / self.total_mass
+        thetaacc = (self.gravity * sintheta - costheta * temp) / (
+            self.length * (4.0 / 3.0 - self.masspole * costheta**2 / self.total_mass)
+        )
+        xacc = temp - self.polemass_length * thetaacc * costheta / self.total_mass
+
+        state = torch.stack(
+            [
+                x + self.tau * x_dot,
+                x_dot + self.tau * xacc,
+                theta + self.tau * theta_dot,
+                theta_dot + self.tau * thetaacc,
+            ],
+            dim=-1,
+        )
+        terminated = (state[:, 0].abs() > self.x_threshold) | (
+            state[:, 2].abs() > self.theta_threshold_radians
+        )
+        reward = torch.ones(self.num_envs, dtype=self._dtype, device=self._device)
+        return state, reward, terminated
@@ -0,0 +1,130 @@
+from typing import Optional
+
+import numpy as np
+import torch
+from gym import spaces
+
+from rl_utils.envs.classic_control.base import BatchedClassicControlEnv
+
+
+class _BatchedMountainCarBase(BatchedClassicControlEnv):
+    """
+    The state is (position, velocity).
+    """
+
+    min_position = -1.2
+    max_position = 0.6
+    max_speed = 0.07
+    goal_position = 0.5
+    goal_velocity = 0.0
+
+    def __init__(self, num_envs, action_space, device, seed, dtype, batched_info):
+        low = np.array([self.min_position, -self.max_speed], dtype=np.float32)
+        high = np.array([self.max_position, self.max_speed], dtype=np.float32)
+        super().__init__(
+            num_envs,
+            spaces.Box(low, high, dtype=np.float32),
+            action_space,
+            state_dim=2,
+            device=device,
+            seed=seed,
+            dtype=dtype,
+            batched_info=batched_info,
+        )
+
+    def _sample_init_states(self, n):
+        position = self._uniform(-0.6, -0.4, (n,))
+        return torch.stack([position, torch.zeros_like(position)], dim=-1)
+
+    def _move(self, state, force):
+        """
+        :returns: The next state and whether each env reached the goal.
+        """
+        position, velocity = state.unbind(-1)
+        velocity = velocity + force - 0.0025 * torch.cos(3 * position)
+        velocity = velocity.clamp(-self.max_speed, self.max_speed)
+        position = (position + velocity).clamp(self.min_position, self.max_position)
+        velocity = torch.where(
+            (position == self.min_position) & (velocity < 0),
+            torch.zeros_like(velocity),
+            velocity,
+        )
+        terminated = (position >= self.goal_position) & (velocity >= self.goal_velocity)
+        return torch.stack([position, velocity], dim=-1), terminated
+
+
+class BatchedMountainCarEnv(_BatchedMountainCarBase):
+    """
+    Batched version of gym's `MountainCar-v0`.
+    """
+
+    max_episode_steps = 200
+
+    force = 0.001
+
+    def __init__(
+        self,
+        num_envs: int,
+        device: Optional[torch.device] = None,
+        seed: Optional[int] = None,
+        dtype: torch.dtype = torch.float32,
+        goal_velocity: float = 0.0,
+        batched_info: bool = False,
+        **kwargs,
+    ):
+        self.goal_velocity = goal_velocity
+        super().__init__(
+            num_envs, spaces.Discrete(3), device, seed, dtype, batched_info
+        )
+
+    def _step_states(self, state, actions):
+        force = (self._discrete_actions(actions) - 1).to(self._dtype) * self.force
+        state, terminated = self._move(state, force)
+        reward = torch.full(
+            (self.num_envs,), -1.0, dtype=self._dtype, device=self._device
+        )
+        return state, reward, terminated
+
+
+class BatchedMountainCarContinuousEnv(_BatchedMountainCarBase):
+    """
+    Batched version of gym's `MountainCarContinuous-v0`.
+    """
+
+    max_episode_steps = 999
+
+    min_action = -1.0
+    max_action = 1.0
+    power = 0.0015
+
+    def __init__(
+        self,
+        num_envs: int,
+        device: Optional[torch.device] = None,
+        seed: Optional[int] = None,
+        dtype: torch.dtype = torch.float32,
+        goal_velocity: float = 0.0,
+        batched_info: bool = False,
+        **kwargs,
+    ):
+        # The goal is lower than in the discrete version.
+        self.goal_position = 0.45
+        self.goal_velocity = goal_velocity
+        super().__init__(
+            num_envs,
+            spaces.Box(
+                low=self.min_action, high=self.max_action, shape=(1,), dtype=np.float32
+            ),
+            device,
+            seed,
+            dtype,
+            batched_info,
+        )
+
+    def _step_states(self, state, actions):
+        action = self._continuous_actions(actions)[:, 0]
+        force = action.clamp(self.min_action, self.max_action) * self.power
+        state, terminated = self._move(state, force)
+        # The action penalty uses the unclipped action, like gym.
+        reward = 100.0 * terminated.to(self._dtype) - 0.1 * action**2
+        return state, reward, terminated
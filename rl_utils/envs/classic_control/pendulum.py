@@ -0,0 +1,81 @@
+import math
+from typing import Optional
+
+import numpy as np
+import torch
+from gym import spaces
+
+from rl_utils.envs.classic_control.base import BatchedClassicControlEnv
+
+
+def angle_normalize(x: torch.Tensor) -> torch.Tensor:
+    return ((x + math.pi) % (2 * math.pi)) - math.pi
+
+
+class BatchedPendulumEnv(BatchedClassicControlEnv):
+    """
+    Batched version of gym's `Pendulum-v1`. The state is (theta, theta_dot)
+    and the observation is (cos(theta), sin(theta), theta_dot).
+    """
+
+    max_episode_steps = 200
+
+    max_speed = 8.0
+    max_torque = 2.0
+    dt = 0.05
+    m = 1.0
+    l = 1.0  # noqa: E741
+
+    def __init__(
+        self,
+        num_envs: int,
+        device: Optional[torch.device] = None,
+        seed: Optional[int] = None,
+        dtype: torch.dtype = torch.float32,
+        batched_info: bool = False,
+        g: float = 10.0,
+        **kwargs,
+    ):
+        self.g = g
+        high = np.array([1.0, 1.0, self.max_speed], dtype=np.float32)
+        super().__init__(
+            num_envs,
+            spaces.Box(-high, high, dtype=np.float32),
+            spaces.Box(
+                low=-self.max_torque, high=self.max_torque, shape=(1,), dtype=np.float32
+            ),
+            state_dim=2,
+            device=device,
+            seed=seed,
+            dtype=dtype,
+            batched_info=batched_info,
+        )
+
+    def _sample_init_states(self, n):
+        high = torch.tensor([math.pi, 1.0], dtype=self._dtype, device=self._device)
+        return self._uniform(-high, high, (n, 2))
+
+    def _get_obs(self, state):
+        th, thdot = state.unbind(-1)
+        return torch.stack([torch.cos(th), torch.sin(th), thdot], dim=-1)
+
+    def _step_states(self, state, actions):
+        th, thdot = state.unbind(-1)
+        u = self._continuous_actions(actions)[:, 0].clamp(
+            -self.max_torque, self.max_torque
+        )
+        costs = angle_normalize(th) ** 2 + 0.1 * thdot**2 + 0.001 * u**2
+
+        newthdot = (
+            thdot
+            + (
+                3 * self.g / (2 * self.l) * torch.sin(th)
+                + 3.0 / (self.m * self.l**2) * u
+            )
+            * self.dt
+        )
+        newthdot = newthdot.clamp(-self.max_speed, self.max_speed)
+        newth = th + newthdot * self.dt
+
+        terminated = torch.zeros(self.num_envs, dtype=torch.bool, device=self._device)
+        return torch.stack([newth, newthdot], dim=-1), -costs, terminated
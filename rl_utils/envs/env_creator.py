@@ -1,20 +1,14 @@
 from functools import partial
-from typing import Callable, Optional
+from typing import TYPE_CHECKING, Callable, List, Optional, Union
 
-import gym
-import torch
-
-import rl_utils.envs.pointmass  # noqa: F401
 from rl_utils.envs.registry import full_env_registry
-from rl_utils.envs.vec_env.dummy_vec_env import DummyVecEnv
-from rl_utils.envs.vec_env.shmem_vec_env import ShmemVecEnv
-from rl_utils.envs.vec_env.vec_env import VecEnv
-from rl_utils.envs.vec_env.vec_env_wrappers import (
-    VecEnvClipActions,
-    VecEnvPermuteFrames,
-)
-from rl_utils.envs.vec_env.vec_monitor import VecMonitor
-from rl_utils.envs.wrappers import TimeLimitMask, VecPyTorch, VecPyTorchFrameStack
+
+# torch, gym and the `VecEnv`s are only imported when envs are created, so
+# importing this module stays cheap.
+if TYPE_CHECKING:
+    import torch
+
+    from rl_utils.envs.vec_env.vec_env import VecEnv
 
 
 def create_vectorized_envs(
@@ -22,21 +16,55 @@ def create_vectorized_envs(
     num_envs: int,
     seed: int = 0,
     *,
-    device: Optional[torch.device] = None,
+    device: Optional["torch.device"] = None,
     context_mode: str = "spawn",
     create_env_fn: Optional[Callable[[int], None]] = None,
     force_multi_proc: bool = False,
     num_frame_stack: Optional[int] = None,
     clip_actions: bool = False,
     permute_frames: bool = False,
+    envs_per_worker: int = 1,
+    vec_env_type: Optional[str] = None,
+    worker_cpus: Optional[Union[str, List[List[int]]]] = None,
+    worker_num_threads: Optional[int] = None,
     **kwargs,
-) -> VecEnv:
+) -> "VecEnv":
+    """
+    :param vec_env_type: Which `VecEnv` steps the environments. One of "dummy",
+        "thread", "shmem", "subproc" or "auto". By default `ShmemVecEnv` is
+        used when there is more than one environment or `force_multi_proc` is
+        set and `DummyVecEnv` otherwise. "auto" times a few steps of the env in
+        this process and picks the backend, number of workers and
+        `envs_per_worker` with `choose_vec_env`. The timings are cached on
+        disk per `env_id`, `create_env_fn` and machine.
+    :param worker_cpus: For the process based `VecEnv`s, the CPUs each worker
+        is pinned to or "auto". See `get_worker_resources` for the defaults,
+        which pin workers when running under Slurm.
+    :param worker_num_threads: For the process based `VecEnv`s, caps the
+        torch/OpenMP/MKL threads of each worker.
+    """
     found_full_env_cls = full_env_registry.search_env(env_id)
     if found_full_env_cls is not None:
         # print(f"Found {found_full_env_cls} for env {env_id}")
         return found_full_env_cls(num_envs=num_envs, seed=seed, device=device, **kwargs)
 
+    import torch
+
+    from rl_utils.envs.vec_env.auto_select import choose_vec_env, get_env_fn_key
+    from rl_utils.envs.vec_env.dummy_vec_env import DummyVecEnv
+    from rl_utils.envs.vec_env.shmem_vec_env import ShmemVecEnv
+    from rl_utils.envs.vec_env.subproc_vec_env import SubprocVecEnv
+    from rl_utils.envs.vec_env.thread_vec_env import ThreadVecEnv
+    from rl_utils.envs.vec_env.vec_env_wrappers import (
+        VecEnvClipActions,
+        VecEnvPermuteFrames,
+    )
+    from rl_utils.envs.vec_env.vec_monitor import VecMonitor
+    from rl_utils.envs.wrappers import TimeLimitMask, VecPyTorch, VecPyTorchFrameStack
+
     def full_create_env(rank):
+        import gym
+
         full_seed = seed + rank
         if create_env_fn is None:
             env = gym.make(env_id)
@@ -51,10 +79,45 @@ def create_vectorized_envs(
 
     envs = [partial(full_create_env, rank=i) for i in range(num_envs)]
 
-    if num_envs > 1 or force_multi_proc:
-        envs = ShmemVecEnv(envs, context=context_mode)
-    else:
+    if vec_env_type is None:
+        if num_envs > 1 or force_multi_proc:
+            vec_env_type = "shmem"
+        else:
+            vec_env_type = "dummy"
+    num_threads = None
+    if vec_env_type == "auto":
+        cache_name = env_id
+        if create_env_fn is not None:
+            cache_name += f"_{get_env_fn_key(create_env_fn)}"
+        choice = choose_vec_env(
+            partial(full_create_env, rank=0), num_envs, cache_name=cache_name
+        )
+        vec_env_type = choice.vec_env_type
+        envs_per_worker = choice.envs_per_worker
+        num_threads = choice.num_workers
+
+    if vec_env_type == "shmem":
+        envs = ShmemVecEnv(
+            envs,
+            context=context_mode,
+            envs_per_worker=envs_per_worker,
+            worker_cpus=worker_cpus,
+            worker_num_threads=worker_num_threads,
+        )
+    elif vec_env_type == "subproc":
+        envs = SubprocVecEnv(
+            envs,
+            context=context_mode,
+            envs_per_worker=envs_per_worker,
+            worker_cpus=worker_cpus,
+            worker_num_threads=worker_num_threads,
+        )
+    elif vec_env_type == "thread":
+        envs = ThreadVecEnv(envs, num_threads=num_threads)
+    elif vec_env_type == "dummy":
         envs = DummyVecEnv(envs)
+    else:
+        raise ValueError(f"Unrecognized vec_env_type {vec_env_type}")
 
     if device is None:
         device = torch.device("cpu")
@@ -1,5 +1,6 @@
 from .pointmass_env import PointMassEnv, PointMassParams
 from .pointmass_obstacle import (
+    CircleObstacle,
     PointMassObstacleEnv,
     PointMassObstacleParams,
     SquareObstacle,
@@ -11,4 +12,5 @@ __all__ = [
     "PointMassObstacleEnv",
     "PointMassObstacleParams",
     "SquareObstacle",
+    "CircleObstacle",
 ]
@@ -1,12 +1,11 @@
 from dataclasses import dataclass
-from typing import Callable, Optional
+from typing import Any, Callable, Dict, List, Optional, Union
 
 import numpy as np
 import torch
 from gym import spaces
 from torch.distributions import Uniform
 
-from rl_utils.envs.registry import full_env_registry
 from rl_utils.envs.vec_env.vec_env import FINAL_OBS_KEY, VecEnv
 
 
@@ -18,6 +17,9 @@ class PointMassParams:
     :param clip_bounds: Clip the agent to be within [-position_limit, position_limit]^2 ?
     :param clip_actions: Clip the actions to be within -1 to 1.
     :param ep_horizon: The length of the episode.
+    :param min_ep_horizon: If set, the horizon of every episode is sampled
+        uniformly from [min_ep_horizon, ep_horizon] so the envs in the batch
+        finish at different steps.
     :param custom_reward: A function that takes as input the current position,
         previous position, and action  and outputs a reward value. All are PyTorch
         tensors of shape (N,) where N is the number of environments.
@@ -30,6 +32,7 @@ class PointMassParams:
     clip_bounds: bool = True
     clip_actions: bool = True
     ep_horizon: int = 5
+    min_ep_horizon: Optional[int] = None
     num_train_regions: int = 4
     start_state_noise: float = np.pi / 20
     dt: float = 0.2
@@ -46,7 +49,6 @@ class PointMassParams:
     ] = None
 
 
-@full_env_registry.register_env("PointMass-v0")
 class PointMassEnv(VecEnv):
     def __init__(
         self,
@@ -55,8 +57,33 @@ class PointMassEnv(VecEnv):
         device: Optional[torch.device] = None,
         set_eval: bool = False,
         seed: Optional[int] = None,
+        batched_info: bool = False,
+        compile_step: Union[bool, Dict[str, Any]] = False,
         **kwargs,
     ):
+        """
+        :param batched_info: If True, `step` returns the info as a single dict
+            of tensors with a leading dimension of `num_envs` instead of a list
+            of dicts. The "episode" values and the final observation are only
+            included on steps where an episode ends, and are only meaningful
+            for the envs that are done.
+        :param compile_step: If True, the tensor math of a step (the dynamics,
+            reward, episode stats and dones) is fused with `torch.compile`.
+            The first steps are slow while it compiles. A dict is passed as
+            keyword arguments to `torch.compile`. Needs torch>=2.0.
+        """
+        self._batched_info = batched_info
+        self._backgrounds: Dict[int, torch.Tensor] = {}
+        if not compile_step and not isinstance(compile_step, dict):
+            self._step_fn = self._step_kernel
+        elif not hasattr(torch, "compile"):
+            raise ValueError(
+                f"compile_step needs torch>=2.0 for torch.compile, got torch {torch.__version__}"
+            )
+        elif isinstance(compile_step, dict):
+            self._step_fn = torch.compile(self._step_kernel, **compile_step)
+        else:
+            self._step_fn = torch.compile(self._step_kernel)
         if params is None:
             params = PointMassParams()
         if device is None:
@@ -66,10 +93,14 @@ class PointMassEnv(VecEnv):
 
         self._device = device
         self._goal = torch.tensor([0.0, 0.0]).to(self._device)
-        self._ep_step = 0
         self._prev_dist_idx = -1
 
-        self._ep_rewards = []
+        # Per env episode step counters, horizons and running episode stats.
+        self._ep_steps = torch.zeros(num_envs, dtype=torch.long, device=device)
+        self._ep_horizons = torch.full_like(self._ep_steps, params.ep_horizon)
+        self._ep_returns = torch.zeros(num_envs, device=device)
+        self._ep_max_action_mags = torch.zeros(num_envs, device=device)
+        self._ep_sum_action_mags = torch.zeros(num_envs, device=device)
         obs_space = spaces.Box(low=-1.0, high=1.0, shape=(2,), seed=seed)
         ac_space = spaces.Box(low=-1.0, high=1.0, shape=(2,), seed=seed)
 
@@ -122,93 +153,188 @@ class PointMassEnv(VecEnv):
         return new_pos
 
     def step(self, action):
-        self.cur_pos = self.forward(self.cur_pos, action)
-        self._ep_step += 1
-        self._store_actions.append(action)
-
-        is_done = self._ep_step >= self._params.ep_horizon
-        reward = self._get_reward(action)
-        self._ep_rewards.append(reward)
-
-        all_is_done = torch.tensor(
-            [is_done for _ in range(self._batch_size)], dtype=torch.bool
+        (
+            self.cur_pos,
+            reward,
+            dones,
+            dist_to_goal,
+            self._ep_steps,
+            self._ep_returns,
+            self._ep_max_action_mags,
+            self._ep_sum_action_mags,
+        ) = self._step_fn(
+            self.cur_pos,
+            action.to(self._device),
+            self._ep_steps,
+            self._ep_horizons,
+            self._ep_returns,
+            self._ep_max_action_mags,
+            self._ep_sum_action_mags,
         )
-        dist_to_goal = torch.linalg.norm(
-            self._goal - self.cur_pos, dim=-1, keepdims=True
+        info = self._get_info(dist_to_goal)
+
+        if dones.any():
+            info["episode"] = {
+                "r": self._ep_returns.clone(),
+                "max_action_magnitude": self._ep_max_action_mags.clone(),
+                "avg_action_magnitude": self._ep_sum_action_mags / self._ep_steps,
+            }
+            info[FINAL_OBS_KEY] = self._get_obs()
+            self._reset_envs(dones)
+
+        if not self._batched_info:
+            info = self._unbatch_info(info, dones.tolist())
+        return (self._get_obs(), reward, dones.cpu(), info)
+
+    def _step_kernel(
+        self,
+        cur_pos,
+        action,
+        ep_steps,
+        ep_horizons,
+        ep_returns,
+        ep_max_action_mags,
+        ep_sum_action_mags,
+    ):
+        """
+        The tensor math of a step without side effects, so it can be compiled.
+        Returns the new position, reward, dones, distance to the goal and the
+        updated episode stats.
+        """
+        new_pos = self.forward(cur_pos, action)
+        reward = self._get_reward(new_pos, cur_pos, action)
+        ep_steps = ep_steps + 1
+        ep_returns = ep_returns + reward.view(-1)
+        action_mags = torch.linalg.norm(action, dim=-1)
+        ep_max_action_mags = torch.maximum(ep_max_action_mags, action_mags)
+        ep_sum_action_mags = ep_sum_action_mags + action_mags
+        dones = ep_steps >= ep_horizons
+        dist_to_goal = torch.linalg.norm(self._goal - new_pos, dim=-1)
+        return (
+            new_pos,
+            reward,
+            dones,
+            dist_to_goal,
+            ep_steps,
+            ep_returns,
+            ep_max_action_mags,
+            ep_sum_action_mags,
         )
 
-        all_info = [
-            {"dist_to_goal": dist_to_goal[i].item()} for i in range(self._batch_size)
-        ]
-        all_info = self._add_to_info(all_info)
-
-        if is_done:
-            store_actions = torch.stack(self._store_actions, dim=1)
-            action_magnitudes = torch.linalg.norm(store_actions, dim=-1)
-            final_obs = self._get_obs()
-            for i in range(self._batch_size):
-                all_info[i]["episode"] = {
-                    "r": torch.stack(self._ep_rewards).sum(0)[i].item(),
-                    "max_action_magnitude": action_magnitudes[i].max().item(),
-                    "avg_action_magnitude": action_magnitudes[i].mean().item(),
-                }
-                all_info[i][FINAL_OBS_KEY] = final_obs[i]
-            self.reset()
-
-        return (self._get_obs(), reward, all_is_done, all_info)
-
-    def get_images(self, mode=None, img_dim=64, **kwargs) -> np.ndarray:
-        def convert_coordinate(coord):
-            # Normalize position to [0,1]
-            norm_pos = (coord + self._params.position_limit) / (
-                2 * self._params.position_limit
-            )
-
-            # Convert position to image space
-            return (norm_pos * img_dim).to(torch.long)
-
-        def write_to_img(img, pos, size, color):
-            lower_x = max(pos[0] - size, 0)
-            upper_x = min(pos[0] + size, img_dim)
-
-            lower_y = max(pos[1] - size, 0)
-            upper_y = min(pos[1] + size, img_dim)
-
-            img[lower_x:upper_x, lower_y:upper_y] = color
-            return img
+    def _get_info(self, dist_to_goal: torch.Tensor) -> Dict[str, Any]:
+        """
+        :param dist_to_goal: Of shape (N,).
+        :returns: The info of the step as a dict of tensors of shape (N, ...).
+        """
+        return {"dist_to_goal": dist_to_goal}
+
+    def _unbatch_info(
+        self, info: Dict[str, Any], dones: List[bool]
+    ) -> List[Dict[str, Any]]:
+        """
+        Split an info dict of tensors into a dict per env. Scalars are
+        converted to Python numbers with one transfer per key. The "episode"
+        values and the final observation only go to the envs that are done.
+        """
+        all_info = [{} for _ in range(self._batch_size)]
+        for k, v in info.items():
+            if isinstance(v, dict):
+                values = self._unbatch_info(v, dones)
+            elif v.dim() == 1:
+                values = v.tolist()
+            else:
+                values = v
+            only_done = k in ("episode", FINAL_OBS_KEY)
+            for env_info, value, done in zip(all_info, values, dones):
+                if done or not only_done:
+                    env_info[k] = value
+        return all_info
 
-        agent_pos = convert_coordinate(self.cur_pos)
-        goal_pos = convert_coordinate(self._goal)
+    def get_images(
+        self, mode=None, img_dim=64, as_tensor=False, **kwargs
+    ) -> Union[np.ndarray, torch.Tensor]:
+        """
+        Draws all the envs at once by scattering into a batch of images.
+
+        :param as_tensor: If True, return a uint8 tensor on the env device
+            instead of a numpy array.
+        :returns: Images of shape (N, img_dim, img_dim, 3).
+        """
+        agent_pos = self._to_pixel_coords(self.cur_pos, img_dim)
+        goal_pos = self._to_pixel_coords(self._goal.view(1, 2), img_dim)
         entity_size = img_dim // 32
 
-        img = np.full((self._batch_size, img_dim, img_dim, 3), 255, dtype=np.uint8)
-        agent_color = [8, 143, 143]
-        goal_color = [224, 17, 95]
+        # Pad the images so squares at the edges can be drawn without
+        # clipping each one. The padding is cropped at the end.
+        pad = 2 * entity_size
+        img = torch.empty(
+            (self._batch_size, img_dim + 2 * pad, img_dim + 2 * pad, 3),
+            dtype=torch.uint8,
+            device=self._device,
+        )
+        crop = slice(pad, pad + img_dim)
+        img[:, crop, crop] = self._get_background(img_dim)
 
-        for env_i in range(self._batch_size):
-            img[env_i] = write_to_img(
-                img[env_i], agent_pos[env_i], entity_size, agent_color
-            )
-            img[env_i] = write_to_img(img[env_i], goal_pos, entity_size, goal_color)
+        self._draw_squares(img, agent_pos, entity_size, [8, 143, 143])
+        self._draw_squares(img, goal_pos, entity_size, [224, 17, 95])
 
-        return img
+        img = img[:, crop, crop].contiguous()
+        if as_tensor:
+            return img
+        return img.cpu().numpy()
 
-    def _add_to_info(self, all_info):
-        return all_info
+    def _to_pixel_coords(self, pos, img_dim):
+        # Normalize position to [0,1] and convert to image space.
+        norm_pos = (pos + self._params.position_limit) / (
+            2 * self._params.position_limit
+        )
+        return (norm_pos * img_dim).to(torch.long)
+
+    def _draw_squares(self, img, pixel_pos, size, color):
+        """
+        Draw a square of `color` covering `[pos - size, pos + size)` for every
+        env.
+
+        :param img: Images of shape (N, H, W, 3) padded by `2 * size` pixels on
+            each side.
+        :param pixel_pos: Of shape (N, 2) or (1, 2) for the same square in
+            every image.
+        """
+        if size == 0:
+            return
+        img_dim = img.shape[1] - 4 * size
+        # Squares entirely outside the image are moved into the padding.
+        start = pixel_pos.clamp(-size, img_dim + size) + size
+        # Of shape (N, 2, 2 * size).
+        idxs = start.unsqueeze(-1) + torch.arange(2 * size, device=img.device)
+        env_idxs = torch.arange(img.shape[0], device=img.device).view(-1, 1, 1)
+        img[env_idxs, idxs[:, 0, :, None], idxs[:, 1, None, :]] = torch.tensor(
+            color, dtype=torch.uint8, device=img.device
+        )
 
-    def _get_dist(self):
-        return torch.linalg.norm(self._goal - self.cur_pos, dim=-1, keepdims=True)
+    def _get_background(self, img_dim: int) -> torch.Tensor:
+        """
+        The image of the parts of the scene that do not move, cached per
+        `img_dim`.
+        """
+        if img_dim not in self._backgrounds:
+            self._backgrounds[img_dim] = self._draw_background(img_dim)
+        return self._backgrounds[img_dim]
+
+    def _draw_background(self, img_dim: int) -> torch.Tensor:
+        return torch.full(
+            (img_dim, img_dim, 3), 255, dtype=torch.uint8, device=self._device
+        )
 
-    def _get_reward(self, action):
+    def _get_reward(self, cur_pos, prev_pos, action):
         if self._params.custom_reward is None:
             dist_to_goal = torch.linalg.norm(
-                self._goal - self.cur_pos, dim=-1, keepdims=True
+                self._goal - cur_pos, dim=-1, keepdims=True
             )
 
             reward = -self._params.reward_dist_pen * dist_to_goal
         else:
-            reward = self._params.custom_reward(self.cur_pos, self._prev_pos, action)
-        self._prev_pos = self.cur_pos.detach().clone()
+            reward = self._params.custom_reward(cur_pos, prev_pos, action)
         return reward  # noqa: R504
 
     def get_regions(self, offset, spread):
@@ -253,13 +379,32 @@ class PointMassEnv(VecEnv):
 
     def reset(self):
         self.cur_pos = self._sample_start(self._batch_size, self._goal)
-        self._ep_step = 0
-        self._ep_rewards = []
-        self._prev_pos = self.cur_pos.detach().clone()
-        self._store_actions = []
+        self._reset_ep_stats(torch.arange(self._batch_size, device=self._device))
 
         return self._get_obs()
 
+    def _reset_envs(self, dones: torch.BoolTensor) -> None:
+        """
+        Reset only the envs where `dones` is True, in place.
+        """
+        env_ids = torch.nonzero(dones).view(-1)
+        new_pos = self._sample_start(env_ids.shape[0], self._goal)
+        self.cur_pos[env_ids] = new_pos
+        self._reset_ep_stats(env_ids)
+
+    def _reset_ep_stats(self, env_ids: torch.LongTensor) -> None:
+        self._ep_steps[env_ids] = 0
+        self._ep_returns[env_ids] = 0.0
+        self._ep_max_action_mags[env_ids] = 0.0
+        self._ep_sum_action_mags[env_ids] = 0.0
+        if self._params.min_ep_horizon is not None:
+            self._ep_horizons[env_ids] = torch.randint(
+                self._params.min_ep_horizon,
+                self._params.ep_horizon + 1,
+                env_ids.shape,
+                device=self._device,
+            )
+
     def _get_obs(self):
         return self.cur_pos.clone()
 
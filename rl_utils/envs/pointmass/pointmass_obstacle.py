@@ -4,8 +4,8 @@ from typing import List, Optional, Tuple
 import numpy as np
 import torch
 
+from rl_utils.common.core_utils import CacheHelper
 from rl_utils.envs.pointmass.pointmass_env import PointMassEnv, PointMassParams
-from rl_utils.envs.registry import full_env_registry
 
 
 @dataclass(frozen=True)
@@ -23,13 +23,35 @@ class SquareObstacle:
     rot_deg: float
 
 
+@dataclass(frozen=True)
+class CircleObstacle:
+    """
+    * x,y position of the CENTER of the circle.
+    * Circle radius
+    """
+
+    xy: Tuple[float, float]
+    radius: float
+
+
 @dataclass(frozen=True)
 class PointMassObstacleParams(PointMassParams):
+    """
+    :param collision_grid_size: If set, the signed distance to the square
+        obstacles is precomputed on a grid of this many points per side over
+        [-position_limit, position_limit]^2 and collision checks look up the
+        grid instead of testing every obstacle. The grid is cached on disk.
+    :param collision_grid_bilinear: Bilinearly interpolate the signed distance
+        between grid points instead of using the nearest grid point.
+    """
+
     goal_thresh: float = 0.05
     square_obstacles: List[SquareObstacle] = field(default_factory=list)
+    circle_obstacles: List[CircleObstacle] = field(default_factory=list)
+    collision_grid_size: Optional[int] = None
+    collision_grid_bilinear: bool = False
 
 
-@full_env_registry.register_env("PointMassObstacle-v0")
 class PointMassObstacleEnv(PointMassEnv):
     def __init__(
         self,
@@ -43,9 +65,10 @@ class PointMassObstacleEnv(PointMassEnv):
         if params is None:
             params = PointMassObstacleParams()
         super().__init__(num_envs, params, device, set_eval, seed, **kwargs)
-        self._circle_obs = []
-        self._square_obs_T = []
 
+        # Stacked obstacle transforms of shape (num_obstacles, 3, 3), their
+        # inverses and the half width and height of each square.
+        square_obs_T = []
         for obs in self._params.square_obstacles:
             rot = obs.rot_deg * (np.pi / 180.0)
 
@@ -67,20 +90,78 @@ class PointMassObstacleEnv(PointMassEnv):
                 device=self._device,
                 dtype=torch.float,
             )
+            square_obs_T.append(trans_T @ rot_T)
+        if len(square_obs_T) > 0:
+            self._square_obs_T = torch.stack(square_obs_T)
+        else:
+            self._square_obs_T = torch.zeros((0, 3, 3), device=self._device)
+        self._square_obs_inv_T = torch.linalg.inv(self._square_obs_T)
+        self._square_obs_half_size = torch.tensor(
+            [[obs.width / 2, obs.height / 2] for obs in self._params.square_obstacles],
+            device=self._device,
+            dtype=torch.float,
+        ).view(-1, 2)
 
-            self._square_obs_T.append(
-                (
-                    trans_T @ rot_T,
-                    obs.width,
-                    obs.height,
-                )
+        self._circle_obs_pos = torch.tensor(
+            [obs.xy for obs in self._params.circle_obstacles],
+            device=self._device,
+            dtype=torch.float,
+        ).view(-1, 2)
+        self._circle_obs_radius = torch.tensor(
+            [obs.radius for obs in self._params.circle_obstacles],
+            device=self._device,
+            dtype=torch.float,
+        )
+
+        if self._params.collision_grid_size is not None:
+            self._sdf_grid = self._load_sdf_grid().to(self._device)
+        else:
+            self._sdf_grid = None
+
+    def _load_sdf_grid(self) -> torch.Tensor:
+        """
+        Load the signed distance grid from the cache, or compute and cache it.
+        The cache is keyed by everything the grid depends on.
+        """
+        grid_size = self._params.collision_grid_size
+        limit = self._params.position_limit
+        cache = CacheHelper(
+            f"{self._params.square_obstacles}_{limit}_{grid_size}",
+            rel_dir="pointmass_sdf",
+        )
+        grid = cache.load()
+        if grid is None:
+            coords = torch.linspace(-limit, limit, grid_size, device=self._device)
+            points = torch.stack(
+                torch.meshgrid(coords, coords, indexing="ij"), dim=-1
+            ).view(-1, 2)
+            grid = self.get_obstacle_sdf(points).view(grid_size, grid_size).cpu()
+            cache.save(grid)
+        return grid
+
+    def _draw_background(self, img_dim):
+        img = super()._draw_background(img_dim)
+        # Test the center of every pixel.
+        pixel_centers = (
+            (torch.arange(img_dim, device=self._device) + 0.5) / img_dim * 2 - 1
+        ) * self._params.position_limit
+        points = torch.stack(
+            torch.meshgrid(pixel_centers, pixel_centers, indexing="ij"), dim=-1
+        ).view(-1, 2)
+        inside = self.is_inside_obstacle(points)
+        if self._circle_obs_radius.shape[0] > 0:
+            circle_dists = torch.linalg.norm(
+                points.unsqueeze(1) - self._circle_obs_pos, dim=-1
             )
+            inside |= (circle_dists < self._circle_obs_radius).any(-1)
+        obstacle_color = torch.tensor([128, 128, 128], dtype=torch.uint8)
+        img[inside.view(img_dim, img_dim)] = obstacle_color.to(self._device)
+        return img
 
-    def _add_to_info(self, all_info):
-        dists = self._get_dist()
-        for i in range(self._batch_size):
-            all_info[i]["at_goal"] = dists[i].item() < self._params.goal_thresh
-        return all_info
+    def _get_info(self, dist_to_goal):
+        info = super()._get_info(dist_to_goal)
+        info["at_goal"] = dist_to_goal < self._params.goal_thresh
+        return info
 
     def forward(self, cur_pos, action):
         action = action.to(self._device)
@@ -94,14 +175,8 @@ class PointMassObstacleEnv(PointMassEnv):
                 self._params.position_limit,
             )
 
-        for ob_pos, ob_radius in self._circle_obs:
-            local_pos = new_pos - ob_pos
-            local_dist = torch.linalg.norm(local_pos, dim=-1)
-            coll_idxs = torch.nonzero(local_dist < ob_radius)
-
-            norm_pos = (local_pos / local_dist.view(-1, 1)) * ob_radius
-            adjusted_pos = ob_pos + norm_pos
-            new_pos[coll_idxs] = adjusted_pos[coll_idxs]
+        if self._circle_obs_radius.shape[0] > 0:
+            new_pos = self._push_out_of_circles(new_pos)
 
         inside_obstacle = self.is_inside_obstacle(new_pos)
 
@@ -114,22 +189,87 @@ class PointMassObstacleEnv(PointMassEnv):
         :param pos: A tensor of shape (N, 2).
         :returns: Tensor of shape (N,) indicating if the points were inside the obstacle.
         """
-
-        homo_pos = torch.cat(
-            [pos, torch.ones(pos.shape[0], 1, device=self._device)], dim=-1
+        if self._sdf_grid is not None:
+            return self._lookup_sdf_grid(pos) < 0
+        # Of shape (N, num_obstacles, 2).
+        local_pos = (
+            torch.einsum("mij,nj->nmi", self._square_obs_inv_T[:, :2, :2], pos)
+            + self._square_obs_inv_T[:, :2, 2]
         )
-        inside_any_box = torch.zeros(
-            pos.shape[0], device=self._device, dtype=torch.bool
-        )
-        for obs_T, xlen, ylen in self._square_obs_T:
-            local_pos = torch.linalg.inv(obs_T) @ homo_pos.T
+        inside_box = (local_pos.abs() < self._square_obs_half_size).all(-1)
+        return inside_box.any(-1)
 
-            inside_x = torch.logical_and(
-                local_pos[0] < (xlen / 2), local_pos[0] > -(xlen / 2)
-            )
-            inside_y = torch.logical_and(
-                local_pos[1] < (ylen / 2), local_pos[1] > -(ylen / 2)
+    def get_obstacle_sdf(
+        self, pos: torch.Tensor, chunk_size: int = 2**24
+    ) -> torch.Tensor:
+        """
+        The signed distance from each point to the closest square obstacle,
+        which is negative inside an obstacle.
+
+        :param pos: A tensor of shape (N, 2).
+        :param chunk_size: Bounds the N * num_obstacles elements computed at
+            once.
+        :returns: Tensor of shape (N,).
+        """
+        num_obstacles = self._square_obs_inv_T.shape[0]
+        if num_obstacles == 0:
+            return torch.full((pos.shape[0],), float("inf"), device=pos.device)
+        sdfs = []
+        for chunk in torch.split(pos, max(chunk_size // num_obstacles, 1)):
+            local_pos = (
+                torch.einsum("mij,nj->nmi", self._square_obs_inv_T[:, :2, :2], chunk)
+                + self._square_obs_inv_T[:, :2, 2]
             )
-            inside_box = torch.logical_and(inside_x, inside_y)
-            inside_any_box |= inside_box
-        return inside_any_box
+            q = local_pos.abs() - self._square_obs_half_size
+            outside_dist = torch.linalg.norm(q.clamp(min=0.0), dim=-1)
+            inside_dist = q.max(-1).values.clamp(max=0.0)
+            sdfs.append((outside_dist + inside_dist).min(-1).values)
+        return torch.cat(sdfs)
+
+    def _lookup_sdf_grid(self, pos: torch.Tensor) -> torch.Tensor:
+        """
+        :param pos: A tensor of shape (N, 2).
+        :returns: The signed distance from the grid, of shape (N,).
+        """
+        grid_size = self._sdf_grid.shape[0]
+        limit = self._params.position_limit
+        # Position in units of grid points.
+        grid_pos = (pos + limit) / (2 * limit) * (grid_size - 1)
+        if not self._params.collision_grid_bilinear:
+            idx = grid_pos.round().long().clamp(0, grid_size - 1)
+            return self._sdf_grid[idx[:, 0], idx[:, 1]]
+
+        idx = grid_pos.floor().long().clamp(0, grid_size - 2)
+        frac = (grid_pos - idx).clamp(0.0, 1.0)
+        x0, y0 = idx[:, 0], idx[:, 1]
+        fx, fy = frac[:, 0], frac[:, 1]
+        grid = self._sdf_grid
+        return (
+            grid[x0, y0] * (1 - fx) * (1 - fy)
+            + grid[x0 + 1, y0] * fx * (1 - fy)
+            + grid[x0, y0 + 1] * (1 - fx) * fy
+            + grid[x0 + 1, y0 + 1] * fx * fy
+        )
+
+    def _push_out_of_circles(self, pos: torch.Tensor) -> torch.Tensor:
+        """
+        Move points inside a circle obstacle onto the edge of that circle. A
+        point inside several circles is moved out of the first one.
+
+        :param pos: A tensor of shape (N, 2).
+        """
+        # Of shape (N, num_circles, 2).
+        local_pos = pos.unsqueeze(1) - self._circle_obs_pos
+        local_dist = torch.linalg.norm(local_pos, dim=-1)
+        inside = local_dist < self._circle_obs_radius
+        circle_idx = inside.to(torch.uint8).argmax(-1)
+
+        env_idx = torch.arange(pos.shape[0], device=pos.device)
+        radius = self._circle_obs_radius[circle_idx].view(-1, 1)
+        norm_pos = (
+            local_pos[env_idx, circle_idx]
+            / local_dist[env_idx, circle_idx].view(-1, 1)
+            * radius
+        )
+        adjusted_pos = self._circle_obs_pos[circle_idx] + norm_pos
+        return torch.where(inside.any(-1, keepdim=True), adjusted_pos, pos)
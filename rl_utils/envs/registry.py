@@ -1,9 +1,39 @@
-from typing import Dict, Optional, Type
+import importlib
+from typing import Dict, Optional, Type, Union
+
+# Packages can register envs without being imported by declaring entry points
+# in this group, named by the env id and pointing to "module:Class".
+ENTRY_POINT_GROUP = "rl_utils.envs"
+
+
+def load_entry_point(entry_point: str) -> Type:
+    """
+    Imports the class of a "module:Class" string.
+    """
+    module_name, _, attr_name = entry_point.partition(":")
+    if attr_name == "":
+        raise ValueError(f"Entry point {entry_point} is not of the form module:Class")
+    obj = importlib.import_module(module_name)
+    for attr in attr_name.split("."):
+        obj = getattr(obj, attr)
+    return obj
 
 
 class EnvRegistry:
-    def __init__(self):
-        self._envs: Dict[str, Type] = {}
+    """
+    Maps env ids to `VecEnv` classes that create all the environments of a
+    batch at once. Envs can be registered as classes, or as "module:Class"
+    entry points that are only imported when the env is first looked up.
+    """
+
+    def __init__(self, entry_point_group: Optional[str] = None):
+        """
+        :param entry_point_group: Also look up envs in the package entry points
+            of this group. They are read on the first call to `search_env`.
+        """
+        self._envs: Dict[str, Union[Type, str]] = {}
+        self._entry_point_group = entry_point_group
+        self._loaded_package_entry_points = entry_point_group is None
 
     def register_env(self, register_name: str):
         def wrap(to_register_cls: Type):
@@ -12,8 +42,45 @@ class EnvRegistry:
 
         return wrap
 
+    def register_entry_point(self, register_name: str, entry_point: str) -> None:
+        """
+        :param entry_point: A "module:Class" string. The module is imported on
+            the first `search_env` for `register_name`.
+        """
+        self._envs[register_name] = entry_point
+
     def search_env(self, name: str) -> Optional[Type]:
-        return self._envs.get(name, None)
+        if name not in self._envs and not self._loaded_package_entry_points:
+            self._load_package_entry_points()
+        env_cls = self._envs.get(name, None)
+        if isinstance(env_cls, str):
+            env_cls = load_entry_point(env_cls)
+            self._envs[name] = env_cls
+        return env_cls
+
+    def _load_package_entry_points(self) -> None:
+        from importlib.metadata import entry_points
+
+        self._loaded_package_entry_points = True
+        all_entry_points = entry_points()
+        if hasattr(all_entry_points, "select"):
+            group = all_entry_points.select(group=self._entry_point_group)
+        else:
+            group = all_entry_points.get(self._entry_point_group, [])
+        for entry_point in group:
+            # Envs registered in code take precedence.
+            self._envs.setdefault(entry_point.name, entry_point.value)
+
 
+full_env_registry = EnvRegistry(ENTRY_POINT_GROUP)
 
-full_env_registry = EnvRegistry()
+for _name, _entry_point in {
+    "PointMass-v0": "rl_utils.envs.pointmass:PointMassEnv",
+    "PointMassObstacle-v0": "rl_utils.envs.pointmass:PointMassObstacleEnv",
+    "BatchedCartPole-v1": "rl_utils.envs.classic_control:BatchedCartPoleEnv",
+    "BatchedPendulum-v1": "rl_utils.envs.classic_control:BatchedPendulumEnv",
+    "BatchedMountainCar-v0": "rl_utils.envs.classic_control:BatchedMountainCarEnv",
+    "BatchedMountainCarContinuous-v0": "rl_utils.envs.classic_control:BatchedMountainCarContinuousEnv",
+    "BatchedAcrobot-v1": "rl_utils.envs.classic_control:BatchedAcrobotEnv",
+}.items():
+    full_env_registry.register_entry_point(_name, _entry_point)
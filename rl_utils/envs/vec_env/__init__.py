@@ -1,6 +1,8 @@
+from .auto_select import VecEnvChoice, choose_vec_env
 from .dummy_vec_env import DummyVecEnv
 from .shmem_vec_env import ShmemVecEnv
 from .subproc_vec_env import SubprocVecEnv
+from .thread_vec_env import ThreadVecEnv
 from .vec_env import (
     AlreadySteppingError,
     CloudpickleWrapper,
@@ -9,8 +11,8 @@ from .vec_env import (
     VecEnvObservationWrapper,
     VecEnvWrapper,
 )
-from .vec_frame_stack import VecFrameStack
-from .vec_monitor import VecMonitor
+from .vec_frame_stack import LazyFrames, VecFrameStack
+from .vec_monitor import VecMonitor, get_episode_summary
 
 __all__ = [
     "AlreadySteppingError",
@@ -22,6 +24,11 @@ __all__ = [
     "DummyVecEnv",
     "ShmemVecEnv",
     "SubprocVecEnv",
+    "ThreadVecEnv",
+    "LazyFrames",
     "VecFrameStack",
     "VecMonitor",
+    "get_episode_summary",
+    "VecEnvChoice",
+    "choose_vec_env",
 ]
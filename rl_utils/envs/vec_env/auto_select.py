@@ -0,0 +1,206 @@
+"""
+Picks the `VecEnv` backend for an environment from how long its steps take.
+"""
+
+import functools
+import math
+import platform
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+from rl_utils.common.core_utils import CacheHelper
+
+from .vec_env import get_available_cpus
+
+# Rough fixed costs of one batch step, in seconds, measured with a trivial env.
+# A `ShmemVecEnv` step pays for the command/ack round trip, once per step and
+# once per worker, and for copying each env result into the shared buffers.
+PROCESS_STEP_OVERHEAD = 1e-4
+PROCESS_WORKER_OVERHEAD = 2e-5
+PROCESS_ENV_OVERHEAD = 1e-5
+# A `ThreadVecEnv` step pays for dispatching the chunks to the thread pool.
+THREAD_STEP_OVERHEAD = 3e-5
+THREAD_WORKER_OVERHEAD = 1e-5
+
+
+@dataclass(frozen=True)
+class VecEnvChoice:
+    """
+    :param vec_env_type: One of "dummy", "thread" or "shmem".
+    :param num_workers: The number of threads or worker processes.
+    :param envs_per_worker: How many envs each worker steps.
+    :param est_step_time: The estimated seconds per batch step.
+    """
+
+    vec_env_type: str
+    num_workers: int
+    envs_per_worker: int
+    est_step_time: float
+
+
+def _step_env(env, num_steps, max_time):
+    """
+    Steps `env` with random actions, resetting finished episodes.
+
+    :returns: The number of steps taken.
+    """
+    start = time.perf_counter()
+    for i in range(num_steps):
+        out = env.step(env.action_space.sample())
+        # Handles both the old 4-tuple and the new 5-tuple step API.
+        if out[2] or (len(out) == 5 and out[3]):
+            env.reset()
+        if time.perf_counter() - start > max_time:
+            return i + 1
+    return num_steps
+
+
+def time_env(
+    env_fn: Callable,
+    num_threads: int = 1,
+    num_steps: int = 100,
+    max_time: float = 1.0,
+) -> Dict[str, float]:
+    """
+    Times the steps of the env in this process.
+
+    :param num_threads: If more than 1, also step that many envs at once on
+        threads to measure how much of the step releases the GIL.
+    :param max_time: Stop each measurement early after this many seconds.
+    :returns: A dict with "env_step_time", the seconds per step of one env,
+        and "thread_parallel_fraction", the fraction of the step time that
+        ran in parallel on threads (0 for code that holds the GIL).
+    """
+    envs = [env_fn() for _ in range(num_threads)]
+    for env in envs:
+        env.reset()
+    # Warm up caches and lazy initialization before timing.
+    _step_env(envs[0], max(1, num_steps // 10), max_time)
+
+    start = time.perf_counter()
+    steps = _step_env(envs[0], num_steps, max_time)
+    env_step_time = (time.perf_counter() - start) / steps
+
+    parallel_fraction = 0.0
+    if num_threads > 1:
+        threads = [
+            threading.Thread(target=_step_env, args=(env, steps, max_time))
+            for env in envs
+        ]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        speedup = num_threads * steps * env_step_time / elapsed
+        speedup = min(max(speedup, 1.0), num_threads)
+        # Amdahl's law solved for the parallel fraction.
+        parallel_fraction = (1 - 1 / speedup) / (1 - 1 / num_threads)
+
+    for env in envs:
+        env.close()
+    return {
+        "env_step_time": env_step_time,
+        "thread_parallel_fraction": parallel_fraction,
+    }
+
+
+def estimate_vec_env_choices(
+    num_envs: int,
+    num_cpus: int,
+    env_step_time: float,
+    thread_parallel_fraction: float = 0.0,
+) -> Dict[str, VecEnvChoice]:
+    """
+    Estimates the seconds per batch step of each backend, using at most one
+    worker per CPU.
+
+    :returns: The `VecEnvChoice` of each backend, by `vec_env_type`.
+    """
+    num_workers = max(1, min(num_cpus, num_envs))
+    envs_per_worker = math.ceil(num_envs / num_workers)
+    # Use as few workers as possible for the same number of envs per worker.
+    num_workers = math.ceil(num_envs / envs_per_worker)
+
+    dummy_time = num_envs * env_step_time
+    f = thread_parallel_fraction
+    thread_time = (
+        num_envs * env_step_time * ((1 - f) + f / num_workers)
+        + THREAD_STEP_OVERHEAD
+        + THREAD_WORKER_OVERHEAD * num_workers
+    )
+    process_time = (
+        envs_per_worker * (env_step_time + PROCESS_ENV_OVERHEAD)
+        + PROCESS_STEP_OVERHEAD
+        + PROCESS_WORKER_OVERHEAD * num_workers
+    )
+    return {
+        "dummy": VecEnvChoice("dummy", 1, num_envs, dummy_time),
+        "thread": VecEnvChoice("thread", num_workers, envs_per_worker, thread_time),
+        "shmem": VecEnvChoice("shmem", num_workers, envs_per_worker, process_time),
+    }
+
+
+def get_machine_key() -> str:
+    return f"{platform.node()}_{platform.machine()}_{len(get_available_cpus())}"
+
+
+def get_env_fn_key(env_fn: Callable) -> str:
+    """
+    Describes `env_fn` for a `choose_vec_env` cache name: the qualified name of
+    the function and, for a `functools.partial`, the reprs of the bound
+    arguments. Arguments without a stable repr give a new key in every
+    process, so their timings are never reused.
+    """
+    if isinstance(env_fn, functools.partial):
+        kwargs = sorted(env_fn.keywords.items())
+        return f"{get_env_fn_key(env_fn.func)}({env_fn.args!r}, {kwargs!r})"
+    name = getattr(env_fn, "__qualname__", type(env_fn).__qualname__)
+    return f"{getattr(env_fn, '__module__', '')}.{name}"
+
+
+def choose_vec_env(
+    env_fn: Callable,
+    num_envs: int,
+    cache_name: Optional[str] = None,
+    num_cpus: Optional[int] = None,
+    num_timing_steps: int = 100,
+    verbose: bool = False,
+) -> VecEnvChoice:
+    """
+    Picks the backend with the lowest estimated time per batch step for
+    `num_envs` copies of the env from `env_fn`. Cheap envs are stepped in
+    this process, envs that release the GIL on threads and expensive envs
+    on worker processes.
+
+    :param cache_name: If set, the env timings are cached on disk under this
+        name and the current machine, so later calls skip the timing. The name
+        must identify everything that changes how long a step takes, such as
+        the env id and the arguments the env is created with. See
+        `get_env_fn_key`.
+    :param num_cpus: Defaults to the CPUs this process may run on.
+    """
+    if num_cpus is None:
+        num_cpus = len(get_available_cpus())
+    num_threads = min(num_cpus, num_envs, 4)
+
+    cache = None
+    timings = None
+    if cache_name is not None:
+        cache = CacheHelper(
+            f"{cache_name}_{get_machine_key()}_{num_threads}", rel_dir="vec_env_timings"
+        )
+        timings = cache.load()
+    if timings is None:
+        timings = time_env(env_fn, num_threads, num_timing_steps)
+        if cache is not None:
+            cache.save(timings)
+
+    choices = estimate_vec_env_choices(num_envs, num_cpus, **timings)
+    choice = min(choices.values(), key=lambda c: c.est_step_time)
+    if verbose:
+        print(f"Picked {choice} with env timings {timings}")
+    return choice
@@ -4,6 +4,7 @@ import numpy as np
 
 from rl_utils.common.core_utils import copy_obs_dict, dict_to_obs, obs_space_info
 
+from .timing import timed
 from .vec_env import VecEnv
 
 
@@ -15,11 +16,15 @@ class DummyVecEnv(VecEnv):
     avoids communication overhead)
     """
 
-    def __init__(self, env_fns):
+    def __init__(self, env_fns, double_buffer=False):
         """
         Arguments:
 
         env_fns: iterable of callables      functions that build environments
+        double_buffer: if True, alternate between two sets of output buffers
+            and return them without copying. The arrays returned by a step stay
+            valid while the next step is written, and are overwritten by the
+            step after that.
         """
         self.envs = [fn() for fn in env_fns]
         env = self.envs[0]
@@ -27,13 +32,20 @@ class DummyVecEnv(VecEnv):
         obs_space = env.observation_space
         self.keys, shapes, dtypes = obs_space_info(obs_space)
 
-        self.buf_obs = {
-            k: np.zeros((self.num_envs,) + tuple(shapes[k]), dtype=dtypes[k])
-            for k in self.keys
-        }
-        self.buf_dones = np.zeros((self.num_envs,), dtype=bool)
-        self.buf_rews = np.zeros((self.num_envs,), dtype=np.float32)
-        self.buf_infos = [{} for _ in range(self.num_envs)]
+        def make_buffers():
+            buf_obs = {
+                k: np.zeros((self.num_envs,) + tuple(shapes[k]), dtype=dtypes[k])
+                for k in self.keys
+            }
+            buf_rews = np.zeros((self.num_envs,), dtype=np.float32)
+            buf_dones = np.zeros((self.num_envs,), dtype=bool)
+            buf_infos = [{} for _ in range(self.num_envs)]
+            return buf_obs, buf_rews, buf_dones, buf_infos
+
+        self.double_buffer = double_buffer
+        self._buffers = [make_buffers() for _ in range(2 if double_buffer else 1)]
+        self._buf_idx = 0
+        self.buf_obs, self.buf_rews, self.buf_dones, self.buf_infos = self._buffers[0]
         self.actions = None
         self.spec = self.envs[0].spec
 
@@ -55,22 +67,39 @@ class DummyVecEnv(VecEnv):
             )
             self.actions = [actions]
 
+    @timed("step_wait")
     def step_wait(self):
+        self._swap_buffers()
+        with self._time("env_step"):
+            for e in range(self.num_envs):
+                self._step_env(e)
+        with self._time("copy_results"):
+            return self._step_result()
+
+    def reset(self):
+        self._swap_buffers()
         for e in range(self.num_envs):
-            action = self.actions[e]
-            # if isinstance(self.envs[e].action_space, spaces.Discrete):
-            #    action = int(action)
-
-            obs, self.buf_rews[e], self.buf_dones[e], self.buf_infos[e] = self.envs[
-                e
-            ].step(action)
-            if self.buf_dones[e]:
-                final_obs = obs
-                if isinstance(obs, dict) and "observation" in obs:
-                    final_obs = obs["observation"]
-                self.buf_infos[e]["final_obs"] = final_obs
-                obs = self.envs[e].reset()
-            self._save_obs(e, obs)
+            self._reset_env(e)
+        return self._obs_from_buf()
+
+    def _swap_buffers(self):
+        """
+        With `double_buffer`, write the next step into the other set of
+        buffers so the caller keeps the arrays of the previous step.
+        """
+        if not self.double_buffer:
+            return
+        self._buf_idx = 1 - self._buf_idx
+        (
+            self.buf_obs,
+            self.buf_rews,
+            self.buf_dones,
+            self.buf_infos,
+        ) = self._buffers[self._buf_idx]
+
+    def _step_result(self):
+        if self.double_buffer:
+            return self._obs_from_buf(), self.buf_rews, self.buf_dones, self.buf_infos
         return (
             self._obs_from_buf(),
             np.copy(self.buf_rews),
@@ -78,11 +107,25 @@ class DummyVecEnv(VecEnv):
             self.buf_infos.copy(),
         )
 
-    def reset(self):
-        for e in range(self.num_envs):
+    def _step_env(self, e):
+        action = self.actions[e]
+        # if isinstance(self.envs[e].action_space, spaces.Discrete):
+        #    action = int(action)
+
+        obs, self.buf_rews[e], self.buf_dones[e], self.buf_infos[e] = self.envs[e].step(
+            action
+        )
+        if self.buf_dones[e]:
+            final_obs = obs
+            if isinstance(obs, dict) and "observation" in obs:
+                final_obs = obs["observation"]
+            self.buf_infos[e]["final_obs"] = final_obs
             obs = self.envs[e].reset()
-            self._save_obs(e, obs)
-        return self._obs_from_buf()
+        self._save_obs(e, obs)
+
+    def _reset_env(self, e):
+        obs = self.envs[e].reset()
+        self._save_obs(e, obs)
 
     def _save_obs(self, e, obs):
         for k in self.keys:
@@ -92,6 +135,9 @@ class DummyVecEnv(VecEnv):
                 self.buf_obs[k][e] = obs[k]
 
     def _obs_from_buf(self):
+        if self.double_buffer:
+            # Shallow copy since wrappers may replace the values in the dict.
+            return dict_to_obs(dict(self.buf_obs))
         return dict_to_obs(copy_obs_dict(self.buf_obs))
 
     def get_images(self, **kwargs):
@@ -0,0 +1,112 @@
+"""
+Low latency command/ack handshake between a parent process and its workers.
+"""
+
+import ctypes
+
+from .vec_env import get_available_cpus
+
+# Command codes sent to a worker.
+CMD_STEP = 1
+CMD_PIPE_MSG = 2
+
+# Ack codes sent back to the parent.
+ACK_EMPTY = 1
+ACK_PIPE_MSG = 2
+
+# Seconds between checks that the workers being waited on are still alive.
+LIVENESS_CHECK_INTERVAL = 0.5
+
+
+class ShmemChannel:
+    """
+    Signals commands and acks through flags in shared memory instead of
+    through a pipe. Waiting first spins on the flag for `spin_iters` checks and
+    only then blocks on a semaphore, so a worker that replies within
+    microseconds never pays for a sleep and wake-up.
+
+    Each worker has a command flag and semaphore. All workers share one ack
+    semaphore so the parent can wait for any of them to finish. Payloads that
+    do not fit in a flag still go through a pipe, the flag only says that
+    there is a message waiting.
+
+    :param spin_iters: How many times to check a flag before blocking. Defaults
+        to no spinning when only one CPU is available, since the spinning
+        process would then take CPU time from the process it waits on.
+    """
+
+    def __init__(self, ctx, num_workers, spin_iters=None):
+        if spin_iters is None:
+            spin_iters = 2000 if len(get_available_cpus()) > 1 else 0
+        self.spin_iters = spin_iters
+        self._cmds = ctx.Array(ctypes.c_int32, num_workers, lock=False)
+        self._acks = ctx.Array(ctypes.c_int32, num_workers, lock=False)
+        self._cmd_sems = [ctx.Semaphore(0) for _ in range(num_workers)]
+        self._ack_sem = ctx.Semaphore(0)
+
+    def send_cmd(self, worker_idx, cmd):
+        self._cmds[worker_idx] = cmd
+        self._cmd_sems[worker_idx].release()
+
+    def wait_cmd(self, worker_idx):
+        """
+        Called from the worker. Blocks until the next command and returns it.
+        """
+        cmds = self._cmds
+        for _ in range(self.spin_iters):
+            if cmds[worker_idx] != 0:
+                break
+        self._cmd_sems[worker_idx].acquire()
+        cmd = cmds[worker_idx]
+        cmds[worker_idx] = 0
+        return cmd
+
+    def send_ack(self, worker_idx, ack):
+        """
+        Called from the worker.
+        """
+        self._acks[worker_idx] = ack
+        self._ack_sem.release()
+
+    def wait_acks(self, worker_idxs, wait_all=True, is_alive=None):
+        """
+        Wait for the workers in `worker_idxs` to ack. This must include every
+        worker that is running a command.
+
+        :param wait_all: If False, returns as soon as any worker has acked.
+        :param is_alive: Called with a worker index every
+            `LIVENESS_CHECK_INTERVAL` seconds without an ack. If a pending
+            worker is no longer alive, raises `EOFError` like reading from the
+            pipe of an exited worker does, instead of waiting forever.
+        :returns: A dict from worker index to the ack code for the workers that
+            finished.
+        """
+        acks = self._acks
+        pending = list(worker_idxs)
+        finished = {}
+        while len(pending) > 0 and (wait_all or len(finished) == 0):
+            for _ in range(self.spin_iters):
+                if any(acks[i] != 0 for i in pending):
+                    break
+            while not self._ack_sem.acquire(timeout=LIVENESS_CHECK_INTERVAL):
+                if is_alive is None:
+                    continue
+                for i in pending:
+                    # A worker may ack and then exit, as it does on "close".
+                    if acks[i] == 0 and not is_alive(i):
+                        raise EOFError(f"Worker {i} exited without replying")
+
+            # Every ack flag is set before its semaphore release, so there is
+            # at least one flag set. Acquire once for every extra flag found
+            # to keep the semaphore count in step with the flags.
+            need_acquire = False
+            for i in list(pending):
+                if acks[i] == 0:
+                    continue
+                if need_acquire:
+                    self._ack_sem.acquire()
+                need_acquire = True
+                finished[i] = acks[i]
+                acks[i] = 0
+                pending.remove(i)
+        return finished
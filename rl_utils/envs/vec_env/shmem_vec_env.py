@@ -2,66 +2,122 @@
 An interface for asynchronous vectorized environments.
 """
 
-import ctypes
-import multiprocessing as mp
+import time
 from collections.abc import Iterable
+from multiprocessing import resource_tracker, shared_memory
+from multiprocessing.connection import wait
+from multiprocessing.reduction import ForkingPickler
 
 import numpy as np
 
-from rl_utils.common.core_utils import dict_to_obs, obs_space_info, obs_to_dict
+from rl_utils.common.core_utils import (
+    ColumnarInfos,
+    dict_to_obs,
+    infer_info_schema,
+    obs_space_info,
+    obs_to_dict,
+)
 
-from .vec_env import FINAL_OBS_KEY, CloudpickleWrapper, VecEnv, clear_mpi_env_vars
+from .shmem_channel import (
+    ACK_EMPTY,
+    ACK_PIPE_MSG,
+    CMD_PIPE_MSG,
+    CMD_STEP,
+    ShmemChannel,
+)
+from .timing import timed
+from .vec_env import (
+    FINAL_OBS_KEY,
+    AsyncWorkerMixin,
+    CloudpickleWrapper,
+    VecEnv,
+    clear_mpi_env_vars,
+    get_mp_context,
+    get_worker_resources,
+    limit_thread_env_vars,
+    setup_worker_resources,
+)
 
-_NP_TO_CT = {
-    np.float32: ctypes.c_float,
-    np.float64: ctypes.c_double,
-    np.int32: ctypes.c_int32,
-    np.int8: ctypes.c_int8,
-    np.uint8: ctypes.c_char,
-    bool: ctypes.c_bool,
-}
+# Sent as raw bytes instead of a pickled command. Tells the worker to step
+# with the action in the shared action buffer.
+_STEP_CMD = b"s"
 
 
-class ShmemVecEnv(VecEnv):
+class ShmemVecEnv(AsyncWorkerMixin, VecEnv):
     """
-    Optimized version of SubprocVecEnv that uses shared variables to communicate observations.
+    Optimized version of SubprocVecEnv that uses shared variables to communicate
+    observations, rewards and dones. Actions are also passed through shared
+    memory if the action space has a fixed shape and dtype. A step then only
+    sends a one byte command to each worker, and each worker only replies
+    with a pickled payload if its info dict is not empty.
     """
 
-    def __init__(self, env_fns, spaces=None, context="spawn"):
+    def __init__(
+        self,
+        env_fns,
+        spaces=None,
+        context="spawn",
+        copy_obs=True,
+        envs_per_worker=1,
+        transport="pipe",
+        preload_modules=None,
+        worker_cpus=None,
+        worker_num_threads=None,
+        columnar_infos=False,
+    ):
         """
-        If you don't specify observation_space, we'll have to create a dummy
-        environment to get it.
+        All the workers are started at once and build their environments in
+        parallel. If you don't specify `spaces`, the first worker reports them
+        back. The shared buffers are allocated once the spaces are known.
+
+        :param copy_obs: If False, `reset` and `step_wait` return views into
+            the shared observation buffers instead of copies. The views are
+            overwritten by the next call to `step_async` or `reset`.
+        :param envs_per_worker: The number of environments each worker process
+            steps in a loop. The last worker gets fewer if `len(env_fns)` is not
+            divisible by this.
+        :param transport: How commands and acks are signalled between the
+            parent and the workers. "pipe" sends them over the worker pipes.
+            "shmem" signals them through flags in shared memory with a
+            spin-then-block wait (see `ShmemChannel`), which has lower latency
+            for environments that step in microseconds but burns CPU while
+            spinning.
+        :param preload_modules: Modules imported once by the forkserver when
+            `context` is "forkserver", so workers are forked with them already
+            imported. Defaults to `DEFAULT_PRELOAD_MODULES`.
+        :param worker_cpus: The CPUs each worker is pinned to, or "auto". See
+            `get_worker_resources` for the defaults.
+        :param worker_num_threads: Caps the torch/OpenMP/MKL threads of each
+            worker. See `get_worker_resources` for the defaults.
+        :param columnar_infos: If True, infos are returned as `ColumnarInfos`.
+            The info keys with numeric scalar or fixed shape array values are
+            found on the first `step_wait`. After that, workers write these
+            keys into shared buffers of shape `(num_envs, ...)` and only
+            pickle the other keys, like the final observation or nested dicts.
         """
-        ctx = mp.get_context(context)
-        if spaces:
-            observation_space, action_space = spaces
+        ctx = get_mp_context(context, preload_modules)
+        num_envs = len(env_fns)
+        self._init_worker_slices(num_envs, envs_per_worker)
+        if transport == "shmem":
+            self._channel = ShmemChannel(ctx, len(self.worker_slices))
+        elif transport == "pipe":
+            self._channel = None
         else:
-            dummy = env_fns[0]()
-            observation_space, action_space = (
-                dummy.observation_space,
-                dummy.action_space,
-            )
-            dummy.close()
-            del dummy
-        VecEnv.__init__(self, len(env_fns), observation_space, action_space)
-        self.obs_keys, self.obs_shapes, self.obs_dtypes = obs_space_info(
-            observation_space
+            raise ValueError(f"Unrecognized transport {transport}")
+        self._worker_acks = {}
+
+        # Workers attach to the shared buffers after they start. Start the
+        # resource tracker first so forked workers share it with the parent
+        # instead of starting their own.
+        resource_tracker.ensure_running()
+        worker_cpus, worker_num_threads = get_worker_resources(
+            len(self.worker_slices), worker_cpus, worker_num_threads
         )
-        self.obs_bufs = [
-            {
-                k: ctx.Array(
-                    _NP_TO_CT[self.obs_dtypes[k].type],
-                    int(np.prod(self.obs_shapes[k])),
-                )
-                for k in self.obs_keys
-            }
-            for _ in env_fns
-        ]
         self.parent_pipes = []
         self.procs = []
-        with clear_mpi_env_vars():
-            for env_fn, obs_buf in zip(env_fns, self.obs_bufs):
-                wrapped_fn = CloudpickleWrapper(env_fn)
+        with clear_mpi_env_vars(), limit_thread_env_vars(worker_num_threads):
+            for worker_idx, env_slice in enumerate(self.worker_slices):
+                wrapped_fn = CloudpickleWrapper(env_fns[env_slice])
                 parent_pipe, child_pipe = ctx.Pipe()
                 proc = ctx.Process(
                     target=_subproc_worker,
@@ -69,10 +125,12 @@ class ShmemVecEnv(VecEnv):
                         child_pipe,
                         parent_pipe,
                         wrapped_fn,
-                        obs_buf,
-                        self.obs_shapes,
-                        self.obs_dtypes,
-                        self.obs_keys,
+                        env_slice.start,
+                        self._channel,
+                        worker_idx,
+                        worker_idx == 0 and not spaces,
+                        worker_cpus[worker_idx],
+                        worker_num_threads,
                     ),
                 )
                 proc.daemon = True
@@ -80,42 +138,237 @@ class ShmemVecEnv(VecEnv):
                 self.parent_pipes.append(parent_pipe)
                 proc.start()
                 child_pipe.close()
+
+        if spaces:
+            observation_space, action_space = spaces
+        else:
+            observation_space, action_space = self.parent_pipes[0].recv()
+        VecEnv.__init__(self, num_envs, observation_space, action_space)
+        self.obs_keys, self.obs_shapes, self.obs_dtypes = obs_space_info(
+            observation_space
+        )
+        self.copy_obs = copy_obs
+
+        # One contiguous block of shape (num_envs, *shape) per observation
+        # key, and one for the rewards, dones and actions. Each worker writes
+        # into its own rows.
+        self._shms = []
+        buf_specs = {}
+        self._obs_views = {}
+        for k in self.obs_keys:
+            self._obs_views[k] = self._alloc_buf(
+                buf_specs, ("obs", k), self.obs_shapes[k], self.obs_dtypes[k]
+            )
+        self._rew_view = self._alloc_buf(buf_specs, "rew", (), np.float64)
+        self._done_view = self._alloc_buf(buf_specs, "done", (), np.bool_)
+        # The seconds each env spent in `env.step` and `env.reset` in the
+        # last step, reported by the workers for `get_timing_stats`.
+        self._env_time_view = self._alloc_buf(buf_specs, "env_time", (), np.float64)
+        if _is_shareable_space(action_space):
+            self._act_view = self._alloc_buf(
+                buf_specs, "act", action_space.shape, action_space.dtype
+            )
+        else:
+            self._act_view = None
+        for pipe in self.parent_pipes:
+            pipe.send(buf_specs)
         self.waiting_step = False
         self.viewer = None
 
+        self.columnar_infos = columnar_infos
+        # Dicts from info key to the shared column and the shared mask of envs
+        # with a value. None until the schema is known.
+        self._info_cols = None
+        self._info_present = None
+
+        self._init_async_state()
+
     def reset(self):
         if self.waiting_step:
             print("Called reset() while waiting for the step to complete")
             self.step_wait()
-        for pipe in self.parent_pipes:
-            pipe.send(("reset", None))
-        return self._decode_obses([pipe.recv() for pipe in self.parent_pipes])
+        for worker_idx in range(len(self.parent_pipes)):
+            self._send(worker_idx, ("reset", None))
+        self._recv_all()
+        return self._decode_obses()
 
+    @timed("step_async")
     def step_async(self, actions):
-        assert len(actions) == len(self.parent_pipes)
-        for pipe, act in zip(self.parent_pipes, actions):
-            pipe.send(("step", act))
+        assert len(actions) == self.num_envs
+        if self._act_view is not None:
+            np.copyto(
+                self._act_view,
+                np.asarray(actions).reshape(self._act_view.shape),
+                casting="unsafe",
+            )
+            for worker_idx in range(len(self.parent_pipes)):
+                self._send(worker_idx)
+        else:
+            for worker_idx, env_slice in enumerate(self.worker_slices):
+                self._send(worker_idx, ("step", actions[env_slice]))
 
+    @timed("step_wait")
     def step_wait(self):
-        outs = [pipe.recv() for pipe in self.parent_pipes]
-        obs, rews, dones, infos = zip(*outs)
-        return self._decode_obses(obs), np.array(rews), np.array(dones), infos
+        with self._time("wait"):
+            payloads = self._recv_all()
+        self._record_env_times()
+        with self._time("decode_infos"):
+            infos = []
+            for payload, env_slice in zip(payloads, self.worker_slices):
+                infos.extend(_loads_infos(payload, env_slice))
+            if self.columnar_infos:
+                if self._info_cols is None:
+                    infos = ColumnarInfos({}, {}, infos)
+                    self._set_info_schema(
+                        infer_info_schema(
+                            infos.extra_infos, ignore_keys=(FINAL_OBS_KEY,)
+                        )
+                    )
+                else:
+                    infos = ColumnarInfos(
+                        {k: np.copy(v) for k, v in self._info_cols.items()},
+                        {k: np.copy(v) for k, v in self._info_present.items()},
+                        infos,
+                    )
+            else:
+                infos = tuple(infos)
+        with self._time("decode_obs"):
+            obs = self._decode_obses()
+        return (
+            obs,
+            np.copy(self._rew_view),
+            np.copy(self._done_view),
+            infos,
+        )
+
+    def _record_env_times(self):
+        if self.timer is None:
+            return
+        self._record_worker_env_times(
+            [
+                float(self._env_time_view[env_slice].sum())
+                for env_slice in self.worker_slices
+            ]
+        )
+
+    def _set_info_schema(self, schema):
+        """
+        Allocate shared columns for the info keys in `schema` and have the
+        workers write these keys into them from now on.
+        """
+        buf_specs = {}
+        self._info_cols = {}
+        self._info_present = {}
+        for k, (shape, dtype) in schema.items():
+            self._info_cols[k] = self._alloc_buf(buf_specs, ("info", k), shape, dtype)
+            self._info_present[k] = self._alloc_buf(
+                buf_specs, ("info_present", k), (), np.bool_
+            )
+        if len(buf_specs) == 0:
+            return
+        for worker_idx in range(len(self.parent_pipes)):
+            self._send(worker_idx, ("set_info_schema", buf_specs))
+        self._recv_all()
+
+    def _send_worker_cmd(self, worker_idx, cmd):
+        if cmd == "reset":
+            self._send(worker_idx, ("reset", None))
+        elif self._act_view is not None:
+            self._send(worker_idx)
+        else:
+            env_slice = self.worker_slices[worker_idx]
+            self._send(worker_idx, ("step", self._async_actions[env_slice]))
+
+    def _store_async_actions(self, actions, env_ids):
+        if self._act_view is None:
+            super()._store_async_actions(actions, env_ids)
+        else:
+            self._act_view[env_ids] = np.asarray(actions).reshape(
+                (len(env_ids),) + self._act_view.shape[1:]
+            )
+
+    def _wait_any_worker(self, worker_idxs):
+        return self._wait_workers(worker_idxs, wait_all=False)
+
+    def _recv_worker(self, worker_idx):
+        """
+        Mark the environments of a worker that finished as ready, with their
+        infos.
+        """
+        env_slice = self.worker_slices[worker_idx]
+        payload = self._recv_payload(worker_idx)
+        if self._worker_cmds[worker_idx] == "step":
+            infos = _loads_infos(payload, env_slice)
+        else:
+            # Environments returned by `async_reset` have a reward of 0 and
+            # are not done.
+            self._rew_view[env_slice] = 0.0
+            self._done_view[env_slice] = False
+            infos = [{} for _ in range(env_slice.start, env_slice.stop)]
+        self._worker_cmds[worker_idx] = None
+        for env_id, info in zip(range(env_slice.start, env_slice.stop), infos):
+            self._ready_results[env_id] = info
+
+    def _get_ready_results(self, env_ids, infos):
+        obs = {k: v[env_ids] for k, v in self._obs_views.items()}
+        infos = tuple(infos)
+        if self._info_cols is not None:
+            infos = ColumnarInfos(
+                {k: v[env_ids] for k, v in self._info_cols.items()},
+                {k: v[env_ids] for k, v in self._info_present.items()},
+                infos,
+            )
+        return (
+            dict_to_obs(obs),
+            self._rew_view[env_ids],
+            self._done_view[env_ids],
+            infos,
+            env_ids,
+        )
 
     def close_extras(self):
-        if self.waiting_step:
-            self.step_wait()
-        for pipe in self.parent_pipes:
-            pipe.send(("close", None))
+        try:
+            if self.waiting_step:
+                self.step_wait()
+            busy_workers = [
+                worker_idx
+                for worker_idx, cmd in enumerate(self._worker_cmds)
+                if cmd is not None
+            ]
+            for worker_idx in self._wait_workers(busy_workers):
+                self._recv_payload(worker_idx)
+            for worker_idx in range(len(self.parent_pipes)):
+                self._send(worker_idx, ("close", None))
+            self._recv_all()
+        except (EOFError, OSError):
+            # A worker exited, so the others may be stuck in a command that
+            # will never be read.
+            for proc in self.procs:
+                proc.terminate()
         for pipe in self.parent_pipes:
-            pipe.recv()
             pipe.close()
         for proc in self.procs:
             proc.join()
 
+        self._obs_views = None
+        self._rew_view = None
+        self._done_view = None
+        self._env_time_view = None
+        self._act_view = None
+        self._info_cols = None
+        self._info_present = None
+        for shm in self._shms:
+            try:
+                shm.close()
+            except BufferError:
+                # A caller still holds a view from `copy_obs=False`. The
+                # memory is freed once that view is garbage collected.
+                pass
+            shm.unlink()
+
     def get_images(self, mode="human", **kwargs):
-        N = len(self.parent_pipes)
         all_pipe_kwargs = []
-        for i in range(N):
+        for i in range(self.num_envs):
             pipe_kwargs = {}
             for k, v in kwargs.items():
                 if isinstance(v, Iterable):
@@ -124,63 +377,224 @@ class ShmemVecEnv(VecEnv):
                     pipe_kwargs[k] = kwargs[k]
             all_pipe_kwargs.append(pipe_kwargs)
 
-        for pipe, p_kwargs in zip(self.parent_pipes, all_pipe_kwargs):
-            pipe.send(("render", (mode, p_kwargs)))
-        return [pipe.recv() for pipe in self.parent_pipes]
+        for worker_idx, env_slice in enumerate(self.worker_slices):
+            self._send(worker_idx, ("render", (mode, all_pipe_kwargs[env_slice])))
+        return [
+            img for payload in self._recv_all() for img in ForkingPickler.loads(payload)
+        ]
 
-    def _decode_obses(self, obs):
-        result = {}
-        for k in self.obs_keys:
-            bufs = [b[k] for b in self.obs_bufs]
-            o = [
-                np.frombuffer(b.get_obj(), dtype=self.obs_dtypes[k]).reshape(
-                    self.obs_shapes[k]
-                )
-                for b in bufs
-            ]
-            result[k] = np.array(o)
+    def _alloc_buf(self, buf_specs, key, shape, dtype):
+        """
+        Allocate a shared buffer of shape (num_envs, *shape), add how to attach
+        to it to `buf_specs` and return a view of it.
+        """
+        shape = (self.num_envs,) + tuple(shape)
+        nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        shm = shared_memory.SharedMemory(create=True, size=max(nbytes, 1))
+        self._shms.append(shm)
+        buf_specs[key] = (shm.name, shape, dtype)
+        return np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+    def _send(self, worker_idx, msg=None):
+        """
+        Send a `(cmd, data)` message to a worker. If `msg` is None, tell the
+        worker to step with the actions in the shared action buffer.
+        """
+        pipe = self.parent_pipes[worker_idx]
+        if self._channel is None:
+            if msg is None:
+                pipe.send_bytes(_STEP_CMD)
+            else:
+                pipe.send(msg)
+        elif msg is None:
+            self._channel.send_cmd(worker_idx, CMD_STEP)
+        else:
+            # Signal first so the worker is already reading when the message
+            # is larger than the pipe buffer.
+            self._channel.send_cmd(worker_idx, CMD_PIPE_MSG)
+            pipe.send(msg)
+
+    def _wait_workers(self, worker_idxs, wait_all=True):
+        """
+        Wait for replies from `worker_idxs`, which must be every worker that
+        is running a command. Returns the workers that have a reply ready.
+
+        :param wait_all: If False, returns as soon as any worker has replied.
+        """
+        if self._channel is not None:
+            acks = self._channel.wait_acks(
+                worker_idxs, wait_all, is_alive=lambda i: self.procs[i].is_alive()
+            )
+            self._worker_acks.update(acks)
+            return list(acks.keys())
+        if wait_all:
+            return list(worker_idxs)
+        pipe_to_worker = {self.parent_pipes[i]: i for i in worker_idxs}
+        return [pipe_to_worker[pipe] for pipe in wait(list(pipe_to_worker.keys()))]
+
+    def _recv_payload(self, worker_idx):
+        """
+        Read the reply of a worker that `_wait_workers` returned.
+        """
+        if self._channel is not None:
+            if self._worker_acks.pop(worker_idx) == ACK_EMPTY:
+                return b""
+        return self.parent_pipes[worker_idx].recv_bytes()
+
+    def _recv_all(self):
+        worker_idxs = range(len(self.parent_pipes))
+        self._wait_workers(worker_idxs)
+        return [self._recv_payload(worker_idx) for worker_idx in worker_idxs]
+
+    def _decode_obses(self):
+        if self.copy_obs:
+            result = {k: np.copy(v) for k, v in self._obs_views.items()}
+        else:
+            result = dict(self._obs_views)
         return dict_to_obs(result)
 
 
+def _is_shareable_space(space):
+    """
+    If actions from this space can be written to a shared buffer.
+    """
+    dtype = getattr(space, "dtype", None)
+    return dtype is not None and space.shape is not None and dtype != object
+
+
+def _loads_infos(payload, env_slice):
+    """
+    Decode the infos sent by a worker. An empty payload means all the info
+    dicts were empty.
+    """
+    if len(payload) == 0:
+        return [{} for _ in range(env_slice.start, env_slice.stop)]
+    return ForkingPickler.loads(payload)
+
+
 def _subproc_worker(
-    pipe, parent_pipe, env_fn_wrapper, obs_bufs, obs_shapes, obs_dtypes, keys
+    pipe,
+    parent_pipe,
+    env_fn_wrappers,
+    env_offset,
+    channel,
+    worker_idx,
+    report_spaces,
+    cpus,
+    num_threads,
 ):
     """
-    Control a single environment instance using IPC and
-    shared memory.
+    Control a slice of environment instances using IPC and
+    shared memory. The slice starts at `env_offset` in the shared buffers.
     """
 
-    def _write_obs(maybe_dict_obs):
-        flatdict = obs_to_dict(maybe_dict_obs)
-        for k in keys:
-            dst = obs_bufs[k].get_obj()
-            dst_np = np.frombuffer(dst, dtype=obs_dtypes[k]).reshape(
-                obs_shapes[k]
-            )  # pylint: disable=W0212
-            np.copyto(dst_np, flatdict[k])
-
-    env = env_fn_wrapper.x()
+    def _recv_cmd():
+        if channel is not None and channel.wait_cmd(worker_idx) == CMD_STEP:
+            return _STEP_CMD
+        return pipe.recv_bytes()
+
+    def _reply(payload):
+        if channel is None:
+            pipe.send_bytes(payload)
+        elif len(payload) == 0:
+            channel.send_ack(worker_idx, ACK_EMPTY)
+        else:
+            # Ack first so the parent is already reading when the payload is
+            # larger than the pipe buffer.
+            channel.send_ack(worker_idx, ACK_PIPE_MSG)
+            pipe.send_bytes(payload)
+
+    setup_worker_resources(cpus, num_threads)
+    envs = [env_fn() for env_fn in env_fn_wrappers.x]
     parent_pipe.close()
+    if report_spaces:
+        pipe.send((envs[0].observation_space, envs[0].action_space))
+
+    shms = []
+    env_slice = slice(env_offset, env_offset + len(envs))
+
+    def _attach_bufs(buf_specs):
+        bufs = {}
+        for key, (shm_name, shape, dtype) in buf_specs.items():
+            shm = shared_memory.SharedMemory(name=shm_name)
+            shms.append(shm)
+            bufs[key] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)[env_slice]
+        return bufs
+
+    bufs = _attach_bufs(pipe.recv())
+    obs_rows = {k[1]: buf for k, buf in bufs.items() if isinstance(k, tuple)}
+    rews = bufs["rew"]
+    dones = bufs["done"]
+    env_times = bufs["env_time"]
+    acts = bufs.get("act", None)
+
+    # Dict from info key to its column and present mask.
+    info_cols = {}
+
+    def _write_obs(i, maybe_dict_obs):
+        flatdict = obs_to_dict(maybe_dict_obs)
+        for k, obs_row in obs_rows.items():
+            np.copyto(obs_row[i], flatdict[k])
+
+    def _write_info_cols(i, info):
+        # Values that do not fit their column stay in the pickled info.
+        for k, (col, present) in info_cols.items():
+            present[i] = (
+                k in info
+                and np.shape(info[k]) == col.shape[1:]
+                and np.result_type(col.dtype, info[k]) == col.dtype
+            )
+            if present[i]:
+                col[i] = info.pop(k)
+
     try:
         while True:
-            cmd, data = pipe.recv()
+            msg = _recv_cmd()
+            if msg == _STEP_CMD:
+                cmd, data = "step", acts.copy()
+            else:
+                cmd, data = ForkingPickler.loads(msg)
             if cmd == "reset":
-                pipe.send(_write_obs(env.reset()))
+                for i, env in enumerate(envs):
+                    _write_obs(i, env.reset())
+                _reply(b"")
             elif cmd == "step":
-                obs, reward, done, info = env.step(data)
-                if done:
-                    final_obs = obs
-                    info[FINAL_OBS_KEY] = final_obs
-                    obs = env.reset()
-                pipe.send((_write_obs(obs), reward, done, info))
+                infos = []
+                for i, env in enumerate(envs):
+                    start = time.perf_counter()
+                    obs, rews[i], dones[i], info = env.step(data[i])
+                    if dones[i]:
+                        final_obs = obs
+                        info[FINAL_OBS_KEY] = final_obs
+                        obs = env.reset()
+                    env_times[i] = time.perf_counter() - start
+                    _write_obs(i, obs)
+                    if len(info_cols) > 0:
+                        _write_info_cols(i, info)
+                    infos.append(info)
+                _reply(ForkingPickler.dumps(infos) if any(infos) else b"")
+            elif cmd == "set_info_schema":
+                info_bufs = _attach_bufs(data)
+                info_cols = {
+                    k[1]: (buf, info_bufs[("info_present", k[1])])
+                    for k, buf in info_bufs.items()
+                    if k[0] == "info"
+                }
+                _reply(b"")
             elif cmd == "render":
-                pipe.send(env.render(mode=data[0], **data[1]))
+                mode, all_kwargs = data
+                imgs = [
+                    env.render(mode=mode, **env_kwargs)
+                    for env, env_kwargs in zip(envs, all_kwargs)
+                ]
+                _reply(ForkingPickler.dumps(imgs))
             elif cmd == "close":
-                pipe.send(None)
+                _reply(b"")
                 break
             else:
                 raise RuntimeError("Got unrecognized cmd %s" % cmd)
     except KeyboardInterrupt:
         print("ShmemVecEnv worker: got KeyboardInterrupt")
     finally:
-        env.close()
+        for env in envs:
+            env.close()
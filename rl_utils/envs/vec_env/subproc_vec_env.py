@@ -1,69 +1,119 @@
-import multiprocessing as mp
+import time
+from multiprocessing.connection import wait
+from multiprocessing.reduction import ForkingPickler
 
 import numpy as np
 
-from .vec_env import CloudpickleWrapper, VecEnv, clear_mpi_env_vars
+from .timing import timed
+from .vec_env import (
+    AsyncWorkerMixin,
+    CloudpickleWrapper,
+    VecEnv,
+    clear_mpi_env_vars,
+    get_mp_context,
+    get_worker_resources,
+    limit_thread_env_vars,
+    setup_worker_resources,
+)
 
 
-def worker(remote, parent_remote, env_fn_wrapper):
+def worker(remote, parent_remote, env_fn_wrappers, cpus=None, num_threads=None):
+    """
+    Steps all the environments created by `env_fn_wrappers` and replies with a
+    single message for all of them.
+    """
+
+    def step_env(env, action):
+        ob, reward, done, info = env.step(action)
+        if done:
+            ob = env.reset()
+        return ob, reward, done, info
+
     parent_remote.close()
-    env = env_fn_wrapper.x()
+    setup_worker_resources(cpus, num_threads)
+    envs = [env_fn() for env_fn in env_fn_wrappers.x]
     try:
         while True:
             cmd, data = remote.recv()
             if cmd == "step":
-                ob, reward, done, info = env.step(data)
-                if done:
-                    ob = env.reset()
-                remote.send((ob, reward, done, info))
+                start = time.perf_counter()
+                results = [step_env(env, action) for env, action in zip(envs, data)]
+                # Also report the time spent in the envs for `get_timing_stats`.
+                remote.send((results, time.perf_counter() - start))
             elif cmd == "reset":
-                ob = env.reset()
-                remote.send(ob)
+                remote.send([env.reset() for env in envs])
             elif cmd == "render":
-                remote.send(env.render(mode="rgb_array"))
+                remote.send([env.render(mode="rgb_array") for env in envs])
             elif cmd == "close":
                 remote.close()
                 break
             elif cmd == "get_spaces_spec":
-                remote.send((env.observation_space, env.action_space, env.spec))
+                remote.send(
+                    (envs[0].observation_space, envs[0].action_space, envs[0].spec)
+                )
             else:
                 raise NotImplementedError
     except KeyboardInterrupt:
         print("SubprocVecEnv worker: got KeyboardInterrupt")
     finally:
-        env.close()
+        for env in envs:
+            env.close()
 
 
-class SubprocVecEnv(VecEnv):
+class SubprocVecEnv(AsyncWorkerMixin, VecEnv):
     """
     VecEnv that runs multiple environments in parallel in subproceses and communicates with them via pipes.
     Recommended to use when num_envs > 1 and step() can be a bottleneck.
     """
 
-    def __init__(self, env_fns, spaces=None, context="spawn"):
+    def __init__(
+        self,
+        env_fns,
+        spaces=None,
+        context="spawn",
+        envs_per_worker=1,
+        preload_modules=None,
+        worker_cpus=None,
+        worker_num_threads=None,
+    ):
         """
         Arguments:
 
         env_fns: iterable of callables -  functions that create environments to run in subprocesses. Need to be cloud-pickleable
+        envs_per_worker: the number of environments each subprocess steps in a loop
+        preload_modules: modules the forkserver imports before forking workers when context is "forkserver"
+        worker_cpus, worker_num_threads: CPU pinning and thread cap for each worker, see `get_worker_resources`
         """
         self.waiting = False
         self.closed = False
-        nenvs = len(env_fns)
-        ctx = mp.get_context(context)
-        self.remotes, self.work_remotes = zip(*[ctx.Pipe() for _ in range(nenvs)])
+        self._init_worker_slices(len(env_fns), envs_per_worker)
+        ctx = get_mp_context(context, preload_modules)
+        worker_cpus, worker_num_threads = get_worker_resources(
+            len(self.worker_slices), worker_cpus, worker_num_threads
+        )
+        self.remotes, self.work_remotes = zip(
+            *[ctx.Pipe() for _ in range(len(self.worker_slices))]
+        )
         self.ps = [
             ctx.Process(
-                target=worker, args=(work_remote, remote, CloudpickleWrapper(env_fn))
+                target=worker,
+                args=(
+                    work_remote,
+                    remote,
+                    CloudpickleWrapper(env_fns[env_slice]),
+                    cpus,
+                    worker_num_threads,
+                ),
             )
-            for (work_remote, remote, env_fn) in zip(
-                self.work_remotes, self.remotes, env_fns
+            for (work_remote, remote, env_slice, cpus) in zip(
+                self.work_remotes, self.remotes, self.worker_slices, worker_cpus
             )
         ]
         for p in self.ps:
             p.daemon = (
                 True  # if the main process crashes, we should not cause things to hang
             )
-            with clear_mpi_env_vars():
+            with clear_mpi_env_vars(), limit_thread_env_vars(worker_num_threads):
                 p.start()
         for remote in self.work_remotes:
             remote.close()
@@ -72,31 +122,76 @@ class SubprocVecEnv(VecEnv):
         observation_space, action_space, self.spec = self.remotes[0].recv()
         self.viewer = None
         VecEnv.__init__(self, len(env_fns), observation_space, action_space)
+        self._init_async_state()
 
+    @timed("step_async")
     def step_async(self, actions):
         self._assert_not_closed()
-        for remote, action in zip(self.remotes, actions):
-            remote.send(("step", action))
+        for remote, env_slice in zip(self.remotes, self.worker_slices):
+            remote.send(("step", actions[env_slice]))
         self.waiting = True
 
+    @timed("step_wait")
     def step_wait(self):
         self._assert_not_closed()
-        results = [remote.recv() for remote in self.remotes]
+        with self._time("wait"):
+            payloads = [remote.recv_bytes() for remote in self.remotes]
+        with self._time("unpickle"):
+            replies = [ForkingPickler.loads(payload) for payload in payloads]
         self.waiting = False
-        obs, rews, dones, infos = zip(*results)
-        return _flatten_obs(obs), np.stack(rews), np.stack(dones), infos
+        if self.timer is not None:
+            self._record_worker_env_times([env_time for _, env_time in replies])
+        results = [res for worker_results, _ in replies for res in worker_results]
+        with self._time("stack_obs"):
+            obs, rews, dones, infos = zip(*results)
+            obs = _flatten_obs(obs)
+        return obs, np.stack(rews), np.stack(dones), infos
 
     def reset(self):
         self._assert_not_closed()
         for remote in self.remotes:
             remote.send(("reset", None))
-        return _flatten_obs([remote.recv() for remote in self.remotes])
+        return _flatten_obs([ob for remote in self.remotes for ob in remote.recv()])
+
+    def _send_worker_cmd(self, worker_idx, cmd):
+        self._assert_not_closed()
+        if cmd == "step":
+            data = self._async_actions[self.worker_slices[worker_idx]]
+        else:
+            data = None
+        self.remotes[worker_idx].send((cmd, data))
+
+    def _wait_any_worker(self, worker_idxs):
+        self._assert_not_closed()
+        remote_to_worker = {self.remotes[i]: i for i in worker_idxs}
+        return [remote_to_worker[remote] for remote in wait(list(remote_to_worker))]
+
+    def _get_ready_results(self, env_ids, results):
+        obs, rews, dones, infos = zip(*results)
+        return _flatten_obs(obs), np.stack(rews), np.stack(dones), infos, env_ids
+
+    def _recv_worker(self, worker_idx):
+        """
+        Store the results of a worker that finished.
+        """
+        env_slice = self.worker_slices[worker_idx]
+        results = self.remotes[worker_idx].recv()
+        if self._worker_cmds[worker_idx] == "reset":
+            results = [(ob, 0.0, False, {}) for ob in results]
+        else:
+            results, _ = results
+        self._worker_cmds[worker_idx] = None
+        for env_id, result in zip(range(env_slice.start, env_slice.stop), results):
+            self._ready_results[env_id] = result
 
     def close_extras(self):
         self.closed = True
         if self.waiting:
             for remote in self.remotes:
                 remote.recv()
+        for worker_idx, cmd in enumerate(self._worker_cmds):
+            if cmd is not None:
+                self.remotes[worker_idx].recv()
         for remote in self.remotes:
             remote.send(("close", None))
         for p in self.ps:
@@ -106,7 +201,7 @@ class SubprocVecEnv(VecEnv):
         self._assert_not_closed()
         for pipe in self.remotes:
             pipe.send(("render", None))
-        return [pipe.recv() for pipe in self.remotes]
+        return [img for pipe in self.remotes for img in pipe.recv()]
 
     def _assert_not_closed(self):
         assert (
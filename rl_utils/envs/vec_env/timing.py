@@ -0,0 +1,82 @@
+"""
+Opt-in timing of the stages of a `VecEnv` step. See `VecEnv.enable_timing`.
+"""
+
+import contextlib
+import functools
+import time
+from collections import defaultdict, deque
+from typing import Dict
+
+import numpy as np
+
+
+class StageTimer:
+    """
+    Records how long named stages take. Keeps the total time and count of
+    every stage since the last reset, and the most recent `window` durations
+    for the percentiles.
+    """
+
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self.reset()
+
+    def reset(self) -> None:
+        self._totals: Dict[str, float] = defaultdict(float)
+        self._counts: Dict[str, int] = defaultdict(int)
+        self._recent: Dict[str, deque] = defaultdict(lambda: deque(maxlen=self.window))
+
+    def add(self, stage: str, seconds: float) -> None:
+        self._totals[stage] += seconds
+        self._counts[stage] += 1
+        self._recent[stage].append(seconds)
+
+    @contextlib.contextmanager
+    def time(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def get_total(self, stage: str) -> float:
+        return self._totals.get(stage, 0.0)
+
+    def get_stats(self, prefix: str = "") -> Dict[str, float]:
+        """
+        :returns: A flat dict with the "total_s", "count", "mean_ms", "p50_ms",
+            "p90_ms" and "p99_ms" of every stage, under "<prefix><stage>.<stat>".
+        """
+        stats = {}
+        for stage, total in self._totals.items():
+            count = self._counts[stage]
+            recent_ms = np.array(self._recent[stage]) * 1000
+            p50, p90, p99 = np.percentile(recent_ms, [50, 90, 99])
+            key = prefix + stage
+            stats[f"{key}.total_s"] = total
+            stats[f"{key}.count"] = count
+            stats[f"{key}.mean_ms"] = total * 1000 / count
+            stats[f"{key}.p50_ms"] = p50
+            stats[f"{key}.p90_ms"] = p90
+            stats[f"{key}.p99_ms"] = p99
+        return stats
+
+
+def timed(stage: str):
+    """
+    Decorates a `VecEnv` method so its calls are recorded as `stage` once
+    timing is enabled.
+    """
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(self, *args, **kwargs):
+            if self.timer is None:
+                return fn(self, *args, **kwargs)
+            with self.timer.time(stage):
+                return fn(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
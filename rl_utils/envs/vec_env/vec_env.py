@@ -1,13 +1,24 @@
 import contextlib
+import multiprocessing as mp
 import os
 from abc import ABC, abstractmethod
 
 import cloudpickle
+import numpy as np
 
 from rl_utils.common.tile_images import tile_images
 
+from .timing import StageTimer, timed
+
 FINAL_OBS_KEY = "final_obs"
 
+# Imported once by the forkserver so that forked workers do not have to import
+# torch and gym again.
+DEFAULT_PRELOAD_MODULES = ["gym", "torch", "rl_utils.envs.vec_env"]
+
+# Environment variables that cap the thread pools of OpenMP, MKL and OpenBLAS.
+THREAD_ENV_VARS = ["OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"]
+
 
 class AlreadySteppingError(Exception):
     """
@@ -41,6 +52,8 @@ class VecEnv(ABC):
 
     closed = False
     viewer = None
+    # Set by `enable_timing`.
+    timer = None
 
     metadata = {"render.modes": ["human", "rgb_array"]}
 
@@ -84,6 +97,33 @@ class VecEnv(ABC):
          - infos: a sequence of info objects
         """
 
+    def async_reset(self):
+        """
+        Start resetting all the environments without waiting for them. The
+        observations are returned by the following calls to `recv()`.
+        """
+        raise NotImplementedError
+
+    def send(self, actions, env_ids):
+        """
+        Start stepping only the environments in `env_ids` with the matching
+        rows of `actions`. The environments must have been returned by a
+        previous call to `recv()`.
+        """
+        raise NotImplementedError
+
+    def recv(self, batch_size=None):
+        """
+        Wait for the first `batch_size` environments to finish their reset or
+        step, rather than for all of them.
+
+        Returns (obs, rews, dones, infos, env_ids) where each entry has
+        `batch_size` rows and `env_ids` is an array of the environment indices
+        the rows belong to. Environments returned by `async_reset` have a
+        reward of 0 and are not done.
+        """
+        raise NotImplementedError
+
     def close_extras(self):
         """
         Clean up the  extra resources, beyond what's in this base class.
@@ -107,6 +147,55 @@ class VecEnv(ABC):
         self.step_async(actions)
         return self.step_wait()
 
+    def enable_timing(self, window=1000, per_worker=False):
+        """
+        Start recording how long the stages of a step take, such as waiting
+        for the workers or decoding the observations, and the time the
+        workers spend inside the environments. Wrappers also enable timing on
+        the envs they wrap.
+
+        :param window: The number of recent durations of each stage the
+            percentiles are computed over.
+        :param per_worker: Also record the time inside the envs of every
+            worker as its own stage, not just of the slowest worker and the
+            mean over the workers. This adds stats for every worker.
+        """
+        self.timer = StageTimer(window)
+        self._time_per_worker = per_worker
+
+    def get_timing_stats(self, reset=False):
+        """
+        :param reset: Clear the recorded timings after reading them.
+        :returns: A flat dict from "<class name>.<stage>.<stat>" to the total
+            seconds, count, mean and percentiles in milliseconds of each
+            stage. Empty if timing is not enabled.
+        """
+        if self.timer is None:
+            return {}
+        stats = self.timer.get_stats(prefix=f"{type(self).__name__}.")
+        if reset:
+            self.timer.reset()
+        return stats
+
+    def _record_worker_env_times(self, worker_times):
+        """
+        Record the seconds the slowest worker, which the step waited on, and
+        the mean worker spent inside their envs in the last step.
+        """
+        if self._time_per_worker:
+            for worker_idx, worker_time in enumerate(worker_times):
+                self.timer.add(f"worker{worker_idx}.env_step", worker_time)
+        self.timer.add("slowest_worker.env_step", max(worker_times))
+        self.timer.add("mean_worker.env_step", sum(worker_times) / len(worker_times))
+
+    def _time(self, stage):
+        """
+        A context manager recording `stage` if timing is enabled.
+        """
+        if self.timer is None:
+            return contextlib.nullcontext()
+        return self.timer.time(stage)
+
     def render(self, mode="human", **kwargs):
         imgs = self.get_images(mode=mode, **kwargs)
         bigimg = tile_images(imgs)
@@ -152,12 +241,14 @@ class VecEnvWrapper(VecEnv):
             action_space=action_space or venv.action_space,
         )
 
+    @timed("step_async")
     def step_async(self, actions):
         self.venv.step_async(actions)
 
     def reset(self):
         return self.venv.reset()
 
+    @timed("step_wait")
     def step_wait(self):
         return self.venv.step_wait()
 
@@ -170,6 +261,28 @@ class VecEnvWrapper(VecEnv):
     def get_images(self, mode=None, **kwargs):
         return self.venv.get_images(mode=mode, **kwargs)
 
+    def enable_timing(self, window=1000, per_worker=False):
+        super().enable_timing(window, per_worker)
+        self.venv.enable_timing(window, per_worker)
+
+    def get_timing_stats(self, reset=False):
+        """
+        The stats of the wrapped envs and of this wrapper. Wrappers record the
+        whole of their `step_async` and `step_wait`, including the wrapped
+        env, and "step_wait.self_total_s" is the part spent in this wrapper.
+        """
+        stats = {}
+        inner_timer = self.venv.timer
+        if self.timer is not None and inner_timer is not None:
+            inner_total = inner_timer.get_total("step_wait")
+            if inner_total > 0:
+                stats[f"{type(self).__name__}.step_wait.self_total_s"] = (
+                    self.timer.get_total("step_wait") - inner_total
+                )
+        stats.update(self.venv.get_timing_stats(reset=reset))
+        stats.update(super().get_timing_stats(reset=reset))
+        return stats
+
 
 class VecEnvObservationWrapper(VecEnvWrapper):
     @abstractmethod
@@ -180,11 +293,115 @@ class VecEnvObservationWrapper(VecEnvWrapper):
         obs = self.venv.reset()
         return self.process(obs)
 
+    @timed("step_wait")
     def step_wait(self):
         obs, rews, dones, infos = self.venv.step_wait()
         return self.process(obs), rews, dones, infos
 
 
+class AsyncWorkerMixin:
+    """
+    `async_reset`, `send` and `recv` for `VecEnv`s whose worker processes
+    each step a contiguous slice of `envs_per_worker` environments. The
+    subclass calls `_init_worker_slices` before starting the workers and
+    `_init_async_state` once `num_envs` is set, and implements how a command
+    is sent to a worker, how to wait for workers and how their results are
+    read and returned.
+    """
+
+    def _init_worker_slices(self, num_envs, envs_per_worker):
+        self.envs_per_worker = envs_per_worker
+        self.worker_slices = [
+            slice(i, min(i + envs_per_worker, num_envs))
+            for i in range(0, num_envs, envs_per_worker)
+        ]
+
+    def _init_async_state(self):
+        # `_worker_cmds` is the command each worker is currently running, or
+        # None if it is idle. `_ready_results` maps the envs that finished,
+        # in the order they finished, to what `_recv_worker` stored for them.
+        self._worker_cmds = [None for _ in self.worker_slices]
+        self._worker_num_actions = [0 for _ in self.worker_slices]
+        self._async_actions = [None for _ in range(self.num_envs)]
+        self._ready_results = {}
+
+    def _send_worker_cmd(self, worker_idx, cmd):
+        """
+        Start "reset" or "step" on a worker. A step uses the actions stored
+        by `_store_async_actions`.
+        """
+        raise NotImplementedError
+
+    def _wait_any_worker(self, worker_idxs):
+        """
+        Wait until at least one of the busy `worker_idxs` finished and return
+        the ones that did.
+        """
+        raise NotImplementedError
+
+    def _recv_worker(self, worker_idx):
+        """
+        Read the results of a worker that finished into `_ready_results`.
+        """
+        raise NotImplementedError
+
+    def _get_ready_results(self, env_ids, results):
+        """
+        :returns: The (obs, rews, dones, infos, env_ids) of `recv`.
+        """
+        raise NotImplementedError
+
+    def _store_async_actions(self, actions, env_ids):
+        for env_id, action in zip(env_ids, actions):
+            self._async_actions[env_id] = action
+
+    def async_reset(self):
+        for worker_idx in range(len(self.worker_slices)):
+            self._send_worker_cmd(worker_idx, "reset")
+        self._worker_cmds = ["reset" for _ in self.worker_slices]
+        self._worker_num_actions = [0 for _ in self.worker_slices]
+        self._ready_results = {}
+
+    def send(self, actions, env_ids):
+        """
+        A worker only starts stepping once every environment in its slice has
+        been sent an action.
+        """
+        env_ids = np.asarray(env_ids)
+        self._store_async_actions(actions, env_ids)
+        for env_id in env_ids:
+            worker_idx = env_id // self.envs_per_worker
+            env_slice = self.worker_slices[worker_idx]
+            self._worker_num_actions[worker_idx] += 1
+            if self._worker_num_actions[worker_idx] < env_slice.stop - env_slice.start:
+                continue
+            self._send_worker_cmd(worker_idx, "step")
+            self._worker_cmds[worker_idx] = "step"
+            self._worker_num_actions[worker_idx] = 0
+
+    def recv(self, batch_size=None):
+        if batch_size is None:
+            batch_size = self.num_envs
+        while len(self._ready_results) < batch_size:
+            busy_workers = [
+                worker_idx
+                for worker_idx, cmd in enumerate(self._worker_cmds)
+                if cmd is not None
+            ]
+            if len(busy_workers) == 0:
+                raise RuntimeError(
+                    f"Waiting for {batch_size} environments but only {len(self._ready_results)} can finish"
+                )
+            for worker_idx in self._wait_any_worker(busy_workers):
+                self._recv_worker(worker_idx)
+
+        # Dicts keep insertion order, so the envs that finished first are
+        # returned first.
+        env_ids = np.array(list(self._ready_results.keys())[:batch_size])
+        results = [self._ready_results.pop(env_id) for env_id in env_ids]
+        return self._get_ready_results(env_ids, results)
+
+
 class CloudpickleWrapper:
     """
     Uses cloudpickle to serialize contents
@@ -217,3 +434,106 @@ def clear_mpi_env_vars():
         yield
     finally:
         os.environ.update(removed_environment)
+
+
+def get_mp_context(context, preload_modules=None):
+    """
+    Get a multiprocessing context. For the "forkserver" context, the
+    forkserver imports `preload_modules` (or `DEFAULT_PRELOAD_MODULES`) before
+    forking any worker. This only has an effect before the forkserver starts.
+    """
+    ctx = mp.get_context(context)
+    if context == "forkserver":
+        if preload_modules is None:
+            preload_modules = DEFAULT_PRELOAD_MODULES
+        ctx.set_forkserver_preload(preload_modules)
+    return ctx
+
+
+def get_available_cpus():
+    """
+    The CPUs this process is allowed to run on.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count()))
+
+
+def get_worker_resources(num_workers, worker_cpus=None, worker_num_threads=None):
+    """
+    Resolve which CPUs each worker process is pinned to and how many threads
+    it may use.
+
+    When running under a Slurm allocation (`SLURM_CPUS_PER_TASK` is set), the
+    defaults split the available CPUs evenly across the workers and cap each
+    worker to its share of `SLURM_CPUS_PER_TASK` threads. Otherwise the
+    defaults leave workers unpinned with the inherited thread settings.
+
+    :param worker_cpus: A list with the CPUs for each worker, or "auto" to
+        split the available CPUs evenly across the workers.
+    :param worker_num_threads: The number of torch/OpenMP/MKL threads each
+        worker may use.
+    :returns: A tuple (per-worker list of CPUs or None, number of threads or
+        None).
+    """
+    in_slurm = "SLURM_CPUS_PER_TASK" in os.environ
+    if worker_cpus is None and in_slurm:
+        worker_cpus = "auto"
+    if worker_cpus == "auto":
+        cpus = get_available_cpus()
+        if num_workers <= len(cpus):
+            worker_cpus = [
+                cpus[i * len(cpus) // num_workers : (i + 1) * len(cpus) // num_workers]
+                for i in range(num_workers)
+            ]
+        else:
+            worker_cpus = [[cpus[i % len(cpus)]] for i in range(num_workers)]
+    elif worker_cpus is None:
+        worker_cpus = [None for _ in range(num_workers)]
+    elif len(worker_cpus) != num_workers:
+        raise ValueError(
+            f"Got CPUs for {len(worker_cpus)} workers but there are {num_workers} workers"
+        )
+
+    if worker_num_threads is None and in_slurm:
+        worker_num_threads = max(
+            1, int(os.environ["SLURM_CPUS_PER_TASK"]) // num_workers
+        )
+    return worker_cpus, worker_num_threads
+
+
+@contextlib.contextmanager
+def limit_thread_env_vars(num_threads):
+    """
+    Temporarily set `THREAD_ENV_VARS` so processes started inside this context
+    create thread pools of at most `num_threads`. Does nothing if `num_threads`
+    is None.
+    """
+    if num_threads is None:
+        yield
+        return
+    prev_environment = {k: os.environ.get(k, None) for k in THREAD_ENV_VARS}
+    os.environ.update({k: str(num_threads) for k in THREAD_ENV_VARS})
+    try:
+        yield
+    finally:
+        for k, v in prev_environment.items():
+            if v is None:
+                del os.environ[k]
+            else:
+                os.environ[k] = v
+
+
+def setup_worker_resources(cpus, num_threads):
+    """
+    Called at the start of a worker process to apply the settings from
+    `get_worker_resources`.
+    """
+    if cpus is not None and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+    if num_threads is not None:
+        # Covers libraries the environment imports after this point.
+        os.environ.update({k: str(num_threads) for k in THREAD_ENV_VARS})
+        import torch
+
+        torch.set_num_threads(num_threads)
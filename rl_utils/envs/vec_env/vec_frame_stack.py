@@ -1,33 +1,152 @@
+from collections import deque
+
 import numpy as np
 from gym import spaces
 
+from .timing import timed
 from .vec_env import VecEnvWrapper
 
 
+class LazyFrames:
+    """
+    A batch of stacked observations that is only concatenated when converted
+    to an array. Each frame is stored once and shared between the
+    `LazyFrames` of consecutive steps, so storing these in a replay buffer does
+    not duplicate frames `nstack` times.
+
+    :param frames: The `nstack` frames, oldest first, each of shape
+        `batch_shape + obs_shape`.
+    :param num_valid: Of shape `batch_shape`. How many of the newest frames
+        belong to the current episode. Older frames read as zeros.
+    """
+
+    def __init__(self, frames, num_valid):
+        self._frames = frames
+        self._num_valid = num_valid
+
+    @property
+    def shape(self):
+        frame_shape = self._frames[0].shape
+        return frame_shape[:-1] + (frame_shape[-1] * len(self._frames),)
+
+    @property
+    def dtype(self):
+        return self._frames[0].dtype
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, idx):
+        """
+        Index into the batch dimensions, keeping the result lazy.
+        """
+        return LazyFrames([f[idx] for f in self._frames], self._num_valid[idx])
+
+    def __array__(self, dtype=None, copy=None):
+        """
+        Stack the frames into a new array. `copy=False` is not supported
+        since the frames are always concatenated.
+        """
+        if copy is False:
+            raise ValueError("LazyFrames can't be converted without a copy")
+        nstack = len(self._frames)
+        num_valid = np.asarray(self._num_valid)
+        # Of shape `batch_shape + obs_shape[:-1] + (nstack, obs_shape[-1])`.
+        stacked = np.stack(self._frames, axis=-2)
+        valid = np.arange(nstack) >= nstack - num_valid[..., None]
+        obs_ndim = stacked.ndim - num_valid.ndim - 1
+        valid = valid.reshape(num_valid.shape + (1,) * (obs_ndim - 1) + (nstack, 1))
+        out = np.where(valid, stacked, 0).astype(stacked.dtype, copy=False)
+        out = out.reshape(out.shape[:-2] + (-1,))
+        if dtype is not None:
+            out = out.astype(dtype, copy=False)
+        return out
+
+
 class VecFrameStack(VecEnvWrapper):
-    def __init__(self, venv, nstack):
+    """
+    Stacks the last `nstack` observations along the last axis. Frames are kept
+    in a ring buffer so a step only writes the newest frame.
+
+    :param copy_obs: If False, the returned observations are views into the
+        ring buffer that are overwritten by the next step.
+    :param lazy_frames: If True, return `LazyFrames` instead of arrays.
+    """
+
+    def __init__(self, venv, nstack, copy_obs=True, lazy_frames=False):
         self.venv = venv
         self.nstack = nstack
+        self.copy_obs = copy_obs
+        self.lazy_frames = lazy_frames
         wos = venv.observation_space  # wrapped ob space
         low = np.repeat(wos.low, self.nstack, axis=-1)
         high = np.repeat(wos.high, self.nstack, axis=-1)
-        self.stackedobs = np.zeros((venv.num_envs,) + low.shape, low.dtype)
+        self._frame_dim = wos.shape[-1]
+
+        # Every frame is written twice, `nstack` frames apart, so the last
+        # `nstack` frames are always a contiguous slice of the buffer.
+        # `LazyFrames` share the frames in `_frames` instead.
+        if lazy_frames:
+            self._buf = None
+        else:
+            self._buf = np.zeros(
+                (venv.num_envs,) + low.shape[:-1] + (2 * low.shape[-1],), low.dtype
+            )
+        self._idx = 0
+
+        self._frames = deque(maxlen=nstack)
+        self._num_valid = np.zeros((venv.num_envs,), dtype=np.int64)
+
         observation_space = spaces.Box(
             low=low, high=high, dtype=venv.observation_space.dtype
         )
         VecEnvWrapper.__init__(self, venv, observation_space=observation_space)
 
+    @property
+    def stackedobs(self):
+        """
+        A view of the current stacked observations, or a new array of them
+        with `lazy_frames`.
+        """
+        if self.lazy_frames:
+            return np.asarray(self._get_obs())
+        start = (self._idx + 1) * self._frame_dim
+        return self._buf[..., start : start + self.nstack * self._frame_dim]
+
+    def _write_frame(self, obs):
+        self._idx = (self._idx + 1) % self.nstack
+        d = self._frame_dim
+        for start in (self._idx * d, (self._idx + self.nstack) * d):
+            self._buf[..., start : start + d] = obs
+
+    def _get_obs(self):
+        if self.lazy_frames:
+            return LazyFrames(list(self._frames), self._num_valid.copy())
+        if self.copy_obs:
+            return self.stackedobs.copy()
+        return self.stackedobs
+
+    @timed("step_wait")
     def step_wait(self):
         obs, rews, news, infos = self.venv.step_wait()
-        self.stackedobs = np.roll(self.stackedobs, shift=-1, axis=-1)
-        for (i, new) in enumerate(news):
-            if new:
-                self.stackedobs[i] = 0
-        self.stackedobs[..., -obs.shape[-1] :] = obs
-        return self.stackedobs, rews, news, infos
+        news = np.asarray(news, dtype=bool)
+        if self.lazy_frames:
+            self._frames.append(np.array(obs))
+            self._num_valid = np.minimum(self._num_valid + 1, self.nstack)
+            self._num_valid[news] = 1
+        else:
+            self._buf[news] = 0
+            self._write_frame(obs)
+        return self._get_obs(), rews, news, infos
 
     def reset(self):
         obs = self.venv.reset()
-        self.stackedobs[...] = 0
-        self.stackedobs[..., -obs.shape[-1] :] = obs
-        return self.stackedobs
+        if self.lazy_frames:
+            obs = np.array(obs)
+            # Only the newest frame is valid so the others are never read.
+            self._frames.extend([obs] * self.nstack)
+            self._num_valid[:] = 1
+        else:
+            self._buf[...] = 0
+            self._write_frame(obs)
+        return self._get_obs()
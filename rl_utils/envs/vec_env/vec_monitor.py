@@ -1,14 +1,30 @@
 import numpy as np
 
+from rl_utils.common.core_utils import ColumnarInfos
+
 from . import VecEnvWrapper
+from .timing import timed
 
 
 class VecMonitor(VecEnvWrapper):
-    def __init__(self, venv):
+    """
+    Adds an "episode" dict with the return and length to the info of envs
+    that finished an episode.
+
+    :param episode_summary: If True, also set `self.episode_summary` every step
+        to a dict from "episode.reward" and "episode.length" to arrays of the
+        episodes that finished this step. This can be passed directly to
+        `Logger.collect_env_step_info`. Use `get_episode_summary` to read it
+        from outside other wrappers.
+    """
+
+    def __init__(self, venv, episode_summary=False):
         VecEnvWrapper.__init__(self, venv)
         self.eprets = None
         self.eplens = None
         self.epcount = 0
+        self.use_episode_summary = episode_summary
+        self.episode_summary = None
 
     def reset(self):
         self.eprets = np.zeros(self.num_envs, "f")
@@ -16,24 +32,46 @@ class VecMonitor(VecEnvWrapper):
 
         return self.venv.reset()
 
+    @timed("step_wait")
     def step_wait(self):
         obs, rews, dones, infos = self.venv.step_wait()
         self.eprets += rews
         self.eplens += 1
-        newinfos = []
-        for (i, (done, ret, eplen, info)) in enumerate(
-            zip(dones, self.eprets, self.eplens, infos)
-        ):
-            info = info.copy()
-            if done:
-                epinfo = {
-                    "reward": ret,
-                    "length": eplen,
+
+        done_ids = np.nonzero(dones)[0]
+        if self.use_episode_summary:
+            self.episode_summary = {
+                "episode.reward": self.eprets[done_ids],
+                "episode.length": self.eplens[done_ids],
+            }
+        if isinstance(infos, ColumnarInfos):
+            # Add the episode stats as columns so the infos stay columnar.
+            done_mask = np.asarray(dones, dtype=bool)
+            infos.set_column("episode.reward", self.eprets.copy(), done_mask)
+            infos.set_column("episode.length", self.eplens.copy(), done_mask)
+        elif len(done_ids) > 0:
+            infos = list(infos)
+            for i in done_ids:
+                info = infos[i].copy()
+                info["episode"] = {
+                    "reward": self.eprets[i],
+                    "length": self.eplens[i],
                 }
-                info["episode"] = epinfo
-                self.epcount += 1
-                self.eprets[i] = 0
-                self.eplens[i] = 0
-            newinfos.append(info)
+                infos[i] = info
+        self.epcount += len(done_ids)
+        self.eprets[done_ids] = 0
+        self.eplens[done_ids] = 0
+
+        return obs, rews, dones, infos
+
 
-        return obs, rews, dones, newinfos
+def get_episode_summary(venv):
+    """
+    :returns: The `episode_summary` of the `VecMonitor` in the wrappers of
+        `venv`, or None if there is none.
+    """
+    while not isinstance(venv, VecMonitor):
+        if not hasattr(venv, "venv"):
+            return None
+        venv = venv.venv
+    return venv.episode_summary
@@ -3,6 +3,7 @@ import numpy as np
 import torch
 
 import rl_utils.common.core_utils as utils
+from rl_utils.envs.vec_env.timing import timed
 from rl_utils.envs.vec_env.vec_env import VecEnvWrapper
 
 
@@ -20,48 +21,97 @@ class TimeLimitMask(gym.Wrapper):
 
 
 class VecPyTorch(VecEnvWrapper):
-    def __init__(self, venv, device):
-        super(VecPyTorch, self).__init__(venv)
-        self.device = device
+    """
+    Converts observations and rewards to float32 tensors and actions back to
+    numpy arrays. float32 observations are wrapped without copying on the
+    CPU. On CUDA, observations go through reusable pinned staging buffers and
+    are copied to the device with `non_blocking=True`.
+
+    :param inplace_convert: If True, observations that are not float32 are
+        converted on the CPU into a reusable buffer instead of a newly
+        allocated array. The returned CPU tensors are then only valid until the
+        next step.
+    """
 
-    def _data_convert(self, arr):
-        if isinstance(arr, np.ndarray) and arr.dtype == np.float64:
-            return arr.astype(np.float32)
-        return arr
+    def __init__(self, venv, device, inplace_convert=False):
+        super(VecPyTorch, self).__init__(venv)
+        self.device = torch.device(device)
+        self.inplace_convert = inplace_convert
+        self._use_pinned = self.device.type == "cuda"
+        self._staging = {}
+        self._copy_events = {}
+        self._act_staging = None
+
+    def _get_staging(self, key, shape):
+        buf = self._staging.get(key, None)
+        if buf is None or buf.shape != shape:
+            buf = torch.empty(shape, dtype=torch.float32, pin_memory=self._use_pinned)
+            self._staging[key] = buf
+        return buf
 
     def reset(self):
         obs = self.venv.reset()
         return self._trans_obs(obs)
 
+    @timed("step_async")
     def step_async(self, actions):
         if isinstance(actions, torch.LongTensor):
             # Squeeze the dimension for discrete actions
             actions = actions.squeeze(1)
-        actions = actions.cpu().numpy()
-        self.venv.step_async(actions)
+        if actions.is_cuda:
+            if self._act_staging is None or self._act_staging.shape != actions.shape:
+                self._act_staging = torch.empty(
+                    actions.shape, dtype=actions.dtype, pin_memory=True
+                )
+            self._act_staging.copy_(actions, non_blocking=True)
+            # Only wait on the copy, not on everything queued after it.
+            event = torch.cuda.Event()
+            event.record()
+            event.synchronize()
+            actions = self._act_staging
+        self.venv.step_async(actions.numpy())
+
+    def _convert_obs(self, key, x):
+        x = np.asarray(x)
+        if self._use_pinned:
+            staging = self._get_staging(key, x.shape)
+            if key in self._copy_events:
+                # The previous copy out of this buffer may still be running.
+                self._copy_events[key].synchronize()
+            np.copyto(staging.numpy(), x, casting="unsafe")
+            out = staging.to(self.device, non_blocking=True)
+            self._copy_events[key] = torch.cuda.Event()
+            self._copy_events[key].record()
+            return out
+
+        if x.dtype != np.float32:
+            if self.inplace_convert:
+                staging = self._get_staging(key, x.shape)
+                np.copyto(staging.numpy(), x, casting="unsafe")
+                return staging.to(self.device)
+            x = x.astype(np.float32)
+        elif any(stride < 0 for stride in x.strides):
+            # `torch.from_numpy` does not support negative strides.
+            x = np.ascontiguousarray(x)
+        return torch.from_numpy(x).to(self.device)
 
     def _trans_obs(self, obs):
         # Support for dict observations
-        def _convert_obs(x):
-            x = self._data_convert(x)
-            x = torch.Tensor(x)
-            return x.to(self.device)
-
         if isinstance(obs, dict):
             for k in obs:
-                obs[k] = _convert_obs(obs[k])
+                obs[k] = self._convert_obs(k, obs[k])
         else:
-            return _convert_obs(obs)
+            return self._convert_obs(None, obs)
         return obs
 
+    @timed("step_wait")
     def step_wait(self):
         obs, reward, done, info = self.venv.step_wait()
         obs = self._trans_obs(obs)
 
-        reward = torch.Tensor(reward).unsqueeze(dim=1)
         # Reward is sometimes a Double. Observation is considered to always be
         # float32
-        reward = reward.float()
+        reward = torch.as_tensor(reward, dtype=torch.float32).unsqueeze(dim=1)
         return obs, reward, done, info
 
 
@@ -89,6 +139,7 @@ class VecPyTorchFrameStack(VecEnvWrapper):
 
         VecEnvWrapper.__init__(self, venv, observation_space=new_obs_space)
 
+    @timed("step_wait")
     def step_wait(self):
         obs, rews, news, infos = self.venv.step_wait()
 
@@ -98,8 +149,7 @@ class VecPyTorchFrameStack(VecEnvWrapper):
 
     def reset(self):
         obs = self.venv.reset()
-        stacked_obs = self.stacked_obs.reset(obs)
-        return utils.set_def_obs(obs, stacked_obs)
+        return self.stacked_obs.reset(obs)
 
     def close(self):
         self.venv.close()
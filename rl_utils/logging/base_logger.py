@@ -4,13 +4,13 @@ import os.path as osp
 import string
 import time
 from collections import defaultdict, deque
-from typing import Any, Dict, List, Set, Union
+from typing import Any, Dict, List, Optional, Set, Union
 
 import numpy as np
 import torch.nn as nn
 from omegaconf import DictConfig
 
-from rl_utils.common.core_utils import compress_and_filter_dict
+from rl_utils.common.core_utils import ColumnarInfos, compress_and_filter_dict
 
 LoggerCfgType = Union[Dict[str, Any], DictConfig]
 
@@ -68,7 +68,47 @@ class Logger:
     def disable_print(self):
         self.is_printing = False
 
-    def collect_env_step_info(self, infos: List[Dict[str, Any]]) -> None:
+    def collect_env_step_info(
+        self,
+        infos: Union[List[Dict[str, Any]], ColumnarInfos, Dict[str, np.ndarray]],
+    ) -> None:
+        """
+        Logs the numeric info values of the envs that finished an episode.
+
+        :param infos: The info dicts of a step, `ColumnarInfos`, or a dict from
+            "episode.<key>" to a 1D numeric array with a value for each episode
+            that finished, such as `VecMonitor.episode_summary`. Other dicts,
+            like the batched infos of `PointMassEnv`, raise a `ValueError`.
+        """
+        if isinstance(infos, dict):
+            for k, v in infos.items():
+                if not (
+                    k.startswith("episode.")
+                    and isinstance(v, np.ndarray)
+                    and v.ndim == 1
+                    and v.dtype.kind in "biuf"
+                ):
+                    raise ValueError(
+                        "Expected a dict from 'episode.<key>' to 1D numeric "
+                        f"arrays of finished episodes, got {k!r}: {type(v)}"
+                    )
+            for k, v in infos.items():
+                self._step_log_info[k].extend(v.tolist())
+            return
+        if isinstance(infos, ColumnarInfos):
+            ep_mask = np.zeros(len(infos), dtype=bool)
+            for k, present in infos.present.items():
+                if k.startswith("episode."):
+                    ep_mask |= present
+            for k, col in infos.columns.items():
+                if col.ndim == 1 and col.dtype.kind in "biuf":
+                    values = col[ep_mask & infos.present[k]]
+                    self._step_log_info[k].extend(values.tolist())
+            infos = [infos.extra_infos[i] for i in np.nonzero(ep_mask)[0]]
+            for inf in infos:
+                for k, v in compress_and_filter_dict(inf).items():
+                    self._step_log_info[k].append(v)
+            return
         for inf in infos:
             if "episode" in inf:
                 flat_inf = compress_and_filter_dict(inf)
@@ -135,12 +175,19 @@ class Logger:
         :param model: the set of parameters to watch
         """
 
-    def interval_log(self, update_count: int, processed_env_steps: int) -> None:
+    def interval_log(
+        self,
+        update_count: int,
+        processed_env_steps: int,
+        timing_stats: Optional[Dict[str, float]] = None,
+    ) -> None:
         """
         Printed FPS is all inclusive of updates, evaluations, logging and everything.
         This is NOT the environment FPS.
         :param update_count: The number of updates.
         :param processed_env_steps: The number of environment samples processed.
+        :param timing_stats: Env step timings to log under "timing.", such as
+            from `VecEnv.get_timing_stats(reset=True)`.
         """
         end = time.time()
 
@@ -168,8 +215,15 @@ class Logger:
             for k, v in log_dat.items():
                 print(f"    - {k}: {v}")
 
+            if timing_stats:
+                print("Env step timings:")
+                for k, v in timing_stats.items():
+                    print(f"    - {k}: {v:.4g}")
+
         # Log all values
         log_dat["fps"] = fps
+        if timing_stats:
+            log_dat.update({f"timing.{k}": v for k, v in timing_stats.items()})
         self.log_vals(log_dat, processed_env_steps)
         self.start = end
 
@@ -10,7 +10,7 @@ setuptools.setup(
     install_requires=[
         "matplotlib",
         "numpy>=1.16.1",
-        "torch>=1.8.1",
+        "torch>=1.10",
         "subprocess32>=3.5.4",
         "gym>=0.17.1",
         "opencv-python",
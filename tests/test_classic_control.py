@@ -0,0 +1,123 @@
+import gym
+import numpy as np
+import pytest
+import torch
+from gym import spaces
+
+from rl_utils.envs import create_vectorized_envs
+from rl_utils.envs.classic_control import BatchedClassicControlEnv
+from rl_utils.envs.vec_env.vec_env import FINAL_OBS_KEY
+
+
+@pytest.mark.parametrize(
+    "env_id,gym_env_id",
+    [
+        ("BatchedCartPole-v1", "CartPole-v1"),
+        ("BatchedPendulum-v1", "Pendulum-v1"),
+        ("BatchedMountainCar-v0", "MountainCar-v0"),
+        ("BatchedMountainCarContinuous-v0", "MountainCarContinuous-v0"),
+        ("BatchedAcrobot-v1", "Acrobot-v1"),
+    ],
+)
+def test_gym_parity(env_id, gym_env_id):
+    """
+    Steps the batched env and one gym env per batch element from the same
+    states with the same actions.
+    """
+    num_envs = 8
+    envs = create_vectorized_envs(env_id, num_envs, seed=0, dtype=torch.float64)
+    gym_envs = [gym.make(gym_env_id).unwrapped for _ in range(num_envs)]
+    for i, gym_env in enumerate(gym_envs):
+        gym_env.reset(seed=i)
+        gym_env.action_space.seed(i)
+    assert envs.observation_space == gym_envs[0].observation_space
+    assert envs.action_space == gym_envs[0].action_space
+
+    def sync_states(env_ids):
+        for i in env_ids:
+            # Resetting clears the per episode bookkeeping of the gym env.
+            gym_envs[i].reset()
+            gym_envs[i].state = envs.state[i].numpy().copy()
+
+    obs = envs.reset()
+    sync_states(range(num_envs))
+    ep_steps = np.zeros(num_envs, dtype=np.int64)
+    num_dones = 0
+    for _ in range(250):
+        gym_actions = [gym_env.action_space.sample() for gym_env in gym_envs]
+        obs, reward, dones, infos = envs.step(torch.tensor(np.array(gym_actions)))
+        assert obs.shape == (num_envs,) + envs.observation_space.shape
+        assert reward.shape == (num_envs, 1)
+        assert obs.dtype == torch.float32
+        ep_steps += 1
+
+        for i, (gym_env, action) in enumerate(zip(gym_envs, gym_actions)):
+            gym_obs, gym_reward, terminated = gym_env.step(action)[:3]
+            truncated = ep_steps[i] >= envs.max_episode_steps
+            assert dones[i].item() == (terminated or truncated)
+            assert reward[i].item() == pytest.approx(gym_reward, abs=1e-4)
+            if dones[i]:
+                env_obs = infos[i][FINAL_OBS_KEY]
+                assert infos[i]["episode"]["length"] == ep_steps[i]
+                assert infos[i].get("bad_transition", False) == truncated
+            else:
+                env_obs = obs[i]
+            assert np.allclose(env_obs.numpy(), gym_obs, atol=1e-4)
+
+        done_ids = np.nonzero(dones.numpy())[0]
+        num_dones += len(done_ids)
+        ep_steps[done_ids] = 0
+        sync_states(done_ids)
+
+    if env_id in ("BatchedCartPole-v1", "BatchedPendulum-v1"):
+        assert num_dones > 0
+
+
+def test_discrete_action_shapes():
+    envs = create_vectorized_envs("BatchedCartPole-v1", 4, seed=0)
+    envs.reset()
+    state = envs.state.clone()
+    obs_flat = envs.step(torch.tensor([0, 1, 0, 1]))[0]
+
+    envs.state = state
+    obs_col = envs.step(torch.tensor([[0.0], [1.0], [0.0], [1.0]]))[0]
+    assert torch.equal(obs_flat, obs_col)
+
+
+@pytest.mark.parametrize("env_id", ["BatchedCartPole-v1", "BatchedPendulum-v1"])
+def test_batched_info(env_id):
+    num_envs = 16
+    envs = create_vectorized_envs(env_id, num_envs, seed=0)
+    batched_envs = create_vectorized_envs(env_id, num_envs, seed=0, batched_info=True)
+    envs.reset()
+    batched_envs.reset()
+    num_dones = 0
+    for _ in range(250):
+        actions = torch.tensor(
+            np.array([envs.action_space.sample() for _ in range(num_envs)])
+        )
+        obs, _, dones, infos = envs.step(actions)
+        batched_obs, _, batched_dones, batched_info = batched_envs.step(actions)
+        assert torch.equal(obs, batched_obs)
+        assert torch.equal(dones, batched_dones)
+        assert ("episode" in batched_info) == dones.any().item()
+        for i in np.nonzero(dones.numpy())[0]:
+            num_dones += 1
+            for k in ("reward", "length"):
+                assert batched_info["episode"][k][i].item() == pytest.approx(
+                    infos[i]["episode"][k]
+                )
+            assert torch.equal(batched_info[FINAL_OBS_KEY][i], infos[i][FINAL_OBS_KEY])
+            assert batched_info["bad_transition"][i].item() == infos[i].get(
+                "bad_transition", False
+            )
+    assert num_dones > 0
+
+
+def test_abstract_methods():
+    class IncompleteEnv(BatchedClassicControlEnv):
+        def _sample_init_states(self, n):
+            return torch.zeros(n, 1)
+
+    with pytest.raises(TypeError):
+        IncompleteEnv(2, spaces.Discrete(2), spaces.Discrete(2), state_dim=1)
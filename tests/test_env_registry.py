@@ -0,0 +1,63 @@
+import subprocess
+import sys
+from importlib import metadata
+
+import pytest
+
+from rl_utils.envs.registry import EnvRegistry
+
+
+def test_entry_point_imported_on_search():
+    registry = EnvRegistry()
+    sys.modules.pop("fractions", None)
+    registry.register_entry_point("Fraction-v0", "fractions:Fraction")
+    assert "fractions" not in sys.modules
+
+    env_cls = registry.search_env("Fraction-v0")
+    assert env_cls is sys.modules["fractions"].Fraction
+    assert registry.search_env("Fraction-v0") is env_cls
+    assert registry.search_env("Missing-v0") is None
+
+
+_TEST_ENTRY_POINTS = [
+    metadata.EntryPoint("Decimal-v0", "decimal:Decimal", "rl_utils.test_envs"),
+    metadata.EntryPoint("Other-v0", "decimal:Context", "other_group"),
+]
+
+
+def _entry_points_by_group():
+    # What `entry_points()` returns before Python 3.10.
+    groups = {}
+    for entry_point in _TEST_ENTRY_POINTS:
+        groups.setdefault(entry_point.group, []).append(entry_point)
+    return groups
+
+
+def _selectable_entry_points():
+    if not hasattr(metadata, "EntryPoints"):
+        pytest.skip("importlib.metadata.EntryPoints needs Python 3.10")
+    return metadata.EntryPoints(_TEST_ENTRY_POINTS)
+
+
+@pytest.mark.parametrize(
+    "make_entry_points", [_entry_points_by_group, _selectable_entry_points]
+)
+def test_package_entry_points(monkeypatch, make_entry_points):
+    entry_points = make_entry_points()
+    monkeypatch.setattr(metadata, "entry_points", lambda: entry_points)
+    registry = EnvRegistry("rl_utils.test_envs")
+
+    import decimal
+
+    assert registry.search_env("Decimal-v0") is decimal.Decimal
+    assert registry.search_env("Other-v0") is None
+
+
+def test_cheap_import():
+    code = (
+        "import sys\n"
+        "from rl_utils.envs import create_vectorized_envs\n"
+        "assert 'torch' not in sys.modules\n"
+        "assert 'gym' not in sys.modules\n"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)
@@ -1,3 +1,8 @@
+import numpy as np
+import pytest
+import torch
+
+from rl_utils.envs.pointmass import PointMassEnv, PointMassParams
 from rl_utils.logging import Logger
 
 
@@ -13,7 +18,28 @@ def test_base_logger():
     )
     logger.collect_info("test_val", 2.3)
     logger.collect_info("test_val2", 2.9, no_rolling_window=True)
+    logger.collect_env_step_info(
+        [{}, {"episode": {"reward": 1.0, "length": 3}}, {"other": 2.0}]
+    )
+    logger.collect_env_step_info(
+        {"episode.reward": np.array([2.0, 3.0]), "episode.length": np.array([4, 5])}
+    )
+    assert list(logger._step_log_info["episode.reward"]) == [1.0, 2.0, 3.0]
+    assert list(logger._step_log_info["episode.length"]) == [3, 4, 5]
+
+    # Batched env infos are not episode stats.
+    envs = PointMassEnv(
+        num_envs=4, params=PointMassParams(ep_horizon=1), batched_info=True
+    )
+    envs.reset()
+    _, _, _, batched_info = envs.step(torch.zeros(4, 2))
+    assert "episode" in batched_info
+    with pytest.raises(ValueError):
+        logger.collect_env_step_info(batched_info)
+    with pytest.raises(ValueError):
+        logger.collect_env_step_info({"episode.reward": np.array([[1.0]])})
 
     logger.interval_log(0, 0)
+    logger.interval_log(1, 10, timing_stats={"ShmemVecEnv.wait.mean_ms": 1.5})
 
     logger.close()
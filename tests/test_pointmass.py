@@ -1,7 +1,11 @@
+import numpy as np
+import pytest
 import torch
 
+from rl_utils.common.core_utils import CacheHelper
 from rl_utils.envs import create_vectorized_envs
 from rl_utils.envs.pointmass import (
+    CircleObstacle,
     PointMassObstacleParams,
     PointMassParams,
     SquareObstacle,
@@ -50,3 +54,243 @@ def test_examples():
         rnd_ac = torch.tensor(envs.action_space.sample())
         rnd_ac = rnd_ac.view(1, -1).repeat(32, 1)
         envs.step(rnd_ac)
+
+
+@pytest.mark.parametrize("env_id", ["PointMass-v0", "PointMassObstacle-v0"])
+def test_batched_info(env_id):
+    num_envs = 8
+
+    actions = torch.rand(12, num_envs, 2) * 2 - 1
+
+    def rollout(batched_info):
+        torch.manual_seed(0)
+        envs = create_vectorized_envs(env_id, num_envs, batched_info=batched_info)
+        envs.reset()
+        return [envs.step(action)[2:] for action in actions]
+
+    for (dones, infos), (_, batched_info) in zip(rollout(False), rollout(True)):
+        assert len(infos) == num_envs
+        for i, info in enumerate(infos):
+            assert info.keys() == batched_info.keys()
+            assert isinstance(info["dist_to_goal"], float)
+            assert info["dist_to_goal"] == pytest.approx(
+                batched_info["dist_to_goal"][i].item()
+            )
+            if "at_goal" in info:
+                assert info["at_goal"] == batched_info["at_goal"][i].item()
+            if dones[i]:
+                for k, v in info["episode"].items():
+                    assert v == pytest.approx(batched_info["episode"][k][i].item())
+                assert torch.allclose(info["final_obs"], batched_info["final_obs"][i])
+
+
+def test_staggered_episodes():
+    num_envs = 16
+    envs = create_vectorized_envs(
+        "PointMass-v0",
+        num_envs,
+        params=PointMassParams(ep_horizon=8, min_ep_horizon=2),
+    )
+    obs = envs.reset()
+    ep_returns = torch.zeros(num_envs)
+    ep_lens = torch.zeros(num_envs, dtype=torch.long)
+    all_dones = []
+    for _ in range(40):
+        action = torch.rand(num_envs, 2) * 2 - 1
+        next_obs, reward, dones, infos = envs.step(action)
+        ep_returns += reward.view(-1)
+        ep_lens += 1
+        all_dones.append(dones)
+        for i, info in enumerate(infos):
+            assert ("episode" in info) == dones[i].item()
+            assert ("final_obs" in info) == dones[i].item()
+            if dones[i]:
+                assert 2 <= ep_lens[i] <= 8
+                assert info["episode"]["r"] == pytest.approx(ep_returns[i].item())
+                assert not torch.allclose(info["final_obs"], next_obs[i])
+        ep_returns[dones] = 0.0
+        ep_lens[dones] = 0
+        obs = next_obs
+    all_dones = torch.stack(all_dones)
+    # Envs finish at different steps.
+    assert (all_dones.any(1) != all_dones.all(1)).any()
+    assert obs.shape == (num_envs, 2)
+
+
+def _loop_is_inside_obstacle(pos, square_obstacles):
+    # Reference implementation that checks one obstacle at a time.
+    inside = torch.zeros(pos.shape[0], dtype=torch.bool)
+    for obs in square_obstacles:
+        rot = obs.rot_deg * (np.pi / 180.0)
+        local_pos = pos - torch.tensor(obs.xy)
+        # Rotate into the frame of the obstacle.
+        local_x = np.cos(rot) * local_pos[:, 0] + np.sin(rot) * local_pos[:, 1]
+        local_y = -np.sin(rot) * local_pos[:, 0] + np.cos(rot) * local_pos[:, 1]
+        inside |= (local_x.abs() < obs.width / 2) & (local_y.abs() < obs.height / 2)
+    return inside
+
+
+@pytest.mark.parametrize("num_obstacles", [0, 1, 50])
+def test_obstacle_collision(num_obstacles):
+    rng = np.random.default_rng(num_obstacles)
+    square_obstacles = [
+        SquareObstacle(
+            tuple(rng.uniform(-1, 1, 2)),
+            rng.uniform(0.05, 0.5),
+            rng.uniform(0.05, 0.5),
+            rng.uniform(0, 360),
+        )
+        for _ in range(num_obstacles)
+    ]
+    envs = create_vectorized_envs(
+        "PointMassObstacle-v0",
+        32,
+        params=PointMassObstacleParams(square_obstacles=square_obstacles),
+    )
+    pos = torch.rand(1000, 2) * 3 - 1.5
+    expected = _loop_is_inside_obstacle(pos, square_obstacles)
+    assert torch.equal(envs.is_inside_obstacle(pos), expected)
+
+
+def test_circle_obstacles():
+    circles = [CircleObstacle((0.0, 0.5), 0.3), CircleObstacle((0.5, -0.5), 0.2)]
+    envs = create_vectorized_envs(
+        "PointMassObstacle-v0",
+        4,
+        params=PointMassObstacleParams(
+            circle_obstacles=circles, clip_actions=False, dt=1.0
+        ),
+    )
+    cur_pos = torch.tensor([[0.0, 0.0], [0.5, 0.0], [1.0, 1.0], [0.0, 0.0]])
+    action = torch.tensor([[0.0, 0.6], [0.1, -0.5], [0.1, 0.1], [0.5, -0.35]])
+    new_pos = envs.forward(cur_pos, action)
+
+    # Points inside a circle are moved onto its edge along the same direction.
+    assert torch.allclose(new_pos[0], torch.tensor([0.0, 0.8]))
+    assert torch.allclose(new_pos[1], torch.tensor([0.7, -0.5]))
+    assert torch.allclose(new_pos[2], torch.tensor([1.1, 1.1]))
+    assert torch.allclose(new_pos[3], torch.tensor([0.5, -0.3]))
+
+
+@pytest.mark.parametrize("bilinear", [False, True])
+def test_collision_grid(tmp_path, monkeypatch, bilinear):
+    monkeypatch.setattr(CacheHelper, "CACHE_PATH", str(tmp_path))
+    rng = np.random.default_rng(0)
+    square_obstacles = [
+        SquareObstacle(
+            tuple(rng.uniform(-1, 1, 2)),
+            rng.uniform(0.05, 0.3),
+            rng.uniform(0.05, 0.3),
+            rng.uniform(0, 360),
+        )
+        for _ in range(100)
+    ]
+    params = PointMassObstacleParams(
+        square_obstacles=square_obstacles,
+        collision_grid_size=256,
+        collision_grid_bilinear=bilinear,
+    )
+    envs = create_vectorized_envs("PointMassObstacle-v0", 32, params=params)
+    assert len(list(tmp_path.glob("pointmass_sdf/*.pickle"))) == 1
+
+    pos = torch.rand(10000, 2) * 3 - 1.5
+    sdf = envs.get_obstacle_sdf(pos)
+    assert torch.equal(sdf < 0, _loop_is_inside_obstacle(pos, square_obstacles))
+
+    # Away from the obstacle edges the grid agrees with the exact check.
+    grid_spacing = 3.0 / 255
+    far = sdf.abs() > grid_spacing
+    assert far.float().mean() > 0.5
+    assert torch.equal(envs.is_inside_obstacle(pos)[far], (sdf < 0)[far])
+
+    # The second env loads the cached grid.
+    cached_envs = create_vectorized_envs("PointMassObstacle-v0", 32, params=params)
+    assert torch.equal(cached_envs._sdf_grid, envs._sdf_grid)
+
+
+def test_compile_step():
+    actions = torch.rand(12, 16, 2) * 2 - 1
+    params = PointMassObstacleParams(
+        square_obstacles=[SquareObstacle((0.5, 0.5), 0.3, 0.3, 30.0)],
+        min_ep_horizon=2,
+    )
+
+    def rollout(compile_step):
+        torch.manual_seed(0)
+        envs = create_vectorized_envs(
+            "PointMassObstacle-v0", 16, params=params, compile_step=compile_step
+        )
+        envs.reset()
+        return [envs.step(action)[:3] for action in actions]
+
+    # The eager backend checks the step can be traced without a slow compile.
+    for expected, result in zip(rollout(False), rollout({"backend": "eager"})):
+        for exp_v, res_v in zip(expected, result):
+            assert torch.allclose(exp_v, res_v)
+
+
+def test_compile_step_old_torch(monkeypatch):
+    monkeypatch.delattr(torch, "compile")
+    with pytest.raises(ValueError, match="torch>=2.0"):
+        create_vectorized_envs("PointMass-v0", 4, compile_step=True)
+    create_vectorized_envs("PointMass-v0", 4, compile_step=False)
+
+
+def _loop_get_images(envs, img_dim):
+    # The per env rendering loop the batched renderer replaced.
+    limit = envs._params.position_limit
+
+    def convert_coordinate(coord):
+        return (((coord + limit) / (2 * limit)) * img_dim).to(torch.long)
+
+    def write_to_img(img, pos, size, color):
+        lower_x, upper_x = max(pos[0] - size, 0), min(pos[0] + size, img_dim)
+        lower_y, upper_y = max(pos[1] - size, 0), min(pos[1] + size, img_dim)
+        img[lower_x:upper_x, lower_y:upper_y] = color
+
+    agent_pos = convert_coordinate(envs.cur_pos)
+    goal_pos = convert_coordinate(envs._goal)
+    img = np.full((envs.num_envs, img_dim, img_dim, 3), 255, dtype=np.uint8)
+    for env_i in range(envs.num_envs):
+        write_to_img(img[env_i], agent_pos[env_i], img_dim // 32, [8, 143, 143])
+        write_to_img(img[env_i], goal_pos, img_dim // 32, [224, 17, 95])
+    return img
+
+
+def test_get_images():
+    envs = create_vectorized_envs("PointMass-v0", 16)
+    envs.reset()
+    for img_dim in [32, 64, 128]:
+        envs.step(torch.rand(16, 2) * 2 - 1)
+        imgs = envs.get_images(img_dim=img_dim)
+        assert imgs.dtype == np.uint8
+        assert np.array_equal(imgs, _loop_get_images(envs, img_dim))
+
+    # Squares at the edges of the arena are clipped to the image.
+    envs.cur_pos[:4] = torch.tensor(
+        [[1.5, 1.5], [-1.5, -1.5], [1.5, -1.5], [0.0, 1.49]]
+    )
+    assert np.array_equal(envs.get_images(img_dim=64), _loop_get_images(envs, 64))
+
+    imgs = envs.get_images(img_dim=64, as_tensor=True)
+    assert isinstance(imgs, torch.Tensor) and imgs.shape == (16, 64, 64, 3)
+
+
+def test_get_images_obstacles():
+    envs = create_vectorized_envs(
+        "PointMassObstacle-v0",
+        4,
+        params=PointMassObstacleParams(
+            square_obstacles=[SquareObstacle((0.0, 1.0), 0.3, 0.3, 0.0)],
+            circle_obstacles=[CircleObstacle((-1.0, 0.0), 0.2)],
+        ),
+    )
+    envs.reset()
+    imgs = envs.get_images(img_dim=64)
+    assert imgs.shape == (4, 64, 64, 3)
+    # The obstacles are away from the start positions, at pixels (32, 53) and
+    # (10, 32).
+    assert np.array_equal(imgs[:, 32, 53], np.full((4, 3), 128))
+    assert np.array_equal(imgs[:, 10, 32], np.full((4, 3), 128))
+    assert np.array_equal(imgs[:, 0, 0], np.full((4, 3), 255))
+    assert envs._get_background(64) is envs._get_background(64)
@@ -0,0 +1,558 @@
+import tracemalloc
+from functools import partial
+
+import gym
+import numpy as np
+import pytest
+import torch
+
+from rl_utils.common.core_utils import CacheHelper, ColumnarInfos, StackHelper
+from rl_utils.envs import create_vectorized_envs
+from rl_utils.envs.vec_env import (
+    DummyVecEnv,
+    LazyFrames,
+    ShmemVecEnv,
+    SubprocVecEnv,
+    ThreadVecEnv,
+    VecFrameStack,
+    VecMonitor,
+    get_episode_summary,
+    vec_env,
+)
+from rl_utils.envs.vec_env.auto_select import (
+    choose_vec_env,
+    estimate_vec_env_choices,
+    get_env_fn_key,
+)
+from rl_utils.envs.vec_env.vec_env import get_available_cpus, get_worker_resources
+from rl_utils.envs.wrappers import VecPyTorch
+from rl_utils.logging import Logger
+
+
+def _make_env(seed, env_id="CartPole-v1"):
+    env = gym.make(env_id)
+    env.seed(seed)
+    env.action_space.seed(seed)
+    return env
+
+
+def _env_fns(num_envs, env_id="CartPole-v1"):
+    return [partial(_make_env, seed=i, env_id=env_id) for i in range(num_envs)]
+
+
+def _rollout(envs, num_steps=50, has_final_obs=True):
+    all_obs = [np.copy(envs.reset())]
+    all_rews = []
+    all_dones = []
+    for step_i in range(num_steps):
+        actions = np.array([(step_i + i) % 2 for i in range(envs.num_envs)])
+        if isinstance(envs.action_space, gym.spaces.Box):
+            actions = actions.reshape(-1, 1).astype(np.float32) - 0.5
+        obs, rews, dones, infos = envs.step(actions)
+        if has_final_obs:
+            for done, info in zip(dones, infos):
+                assert done == ("final_obs" in info)
+        all_obs.append(np.copy(obs))
+        all_rews.append(np.copy(rews))
+        all_dones.append(np.copy(dones))
+    envs.close()
+    return np.stack(all_obs), np.stack(all_rews), np.stack(all_dones)
+
+
+@pytest.mark.parametrize("copy_obs", [True, False])
+@pytest.mark.parametrize("envs_per_worker", [1, 2])
+@pytest.mark.parametrize("transport", ["pipe", "shmem"])
+def test_shmem_matches_dummy(copy_obs, envs_per_worker, transport):
+    expected = _rollout(DummyVecEnv(_env_fns(3)))
+    result = _rollout(
+        ShmemVecEnv(
+            _env_fns(3),
+            context="fork",
+            copy_obs=copy_obs,
+            envs_per_worker=envs_per_worker,
+            transport=transport,
+        )
+    )
+    for exp_v, res_v in zip(expected, result):
+        assert np.allclose(exp_v, res_v)
+
+
+@pytest.mark.parametrize("envs_per_worker", [1, 2])
+def test_subproc_matches_dummy(envs_per_worker):
+    expected = _rollout(DummyVecEnv(_env_fns(3)))
+    result = _rollout(
+        SubprocVecEnv(_env_fns(3), context="fork", envs_per_worker=envs_per_worker),
+        has_final_obs=False,
+    )
+    for exp_v, res_v in zip(expected, result):
+        assert np.allclose(exp_v, res_v)
+
+
+def test_shmem_box_actions():
+    expected = _rollout(DummyVecEnv(_env_fns(2, "Pendulum-v1")))
+    result = _rollout(ShmemVecEnv(_env_fns(2, "Pendulum-v1"), context="fork"))
+    for exp_v, res_v in zip(expected, result):
+        assert np.allclose(exp_v, res_v)
+
+
+@pytest.mark.parametrize("vec_env_cls", [ShmemVecEnv, SubprocVecEnv])
+@pytest.mark.parametrize("envs_per_worker", [1, 2])
+def test_async_recv_send(vec_env_cls, envs_per_worker):
+    num_envs = 4
+    envs = vec_env_cls(
+        _env_fns(num_envs), context="fork", envs_per_worker=envs_per_worker
+    )
+    envs.async_reset()
+    env_obs = [[] for _ in range(num_envs)]
+    # Workers that start faster can be returned many times before the others.
+    while min(len(x) for x in env_obs) < 20:
+        obs, rews, dones, infos, env_ids = envs.recv(batch_size=2)
+        assert len(obs) == len(rews) == len(dones) == len(infos) == len(env_ids) == 2
+        for env_id, ob in zip(env_ids, obs):
+            env_obs[env_id].append(ob)
+        envs.send(np.ones(2, dtype=np.int64), env_ids)
+    envs.close()
+
+    for env_id in range(num_envs):
+        env = _make_env(env_id)
+        expected_obs = [env.reset()]
+        while len(expected_obs) < len(env_obs[env_id]):
+            ob, _, done, _ = env.step(1)
+            if done:
+                ob = env.reset()
+            expected_obs.append(ob)
+        assert np.allclose(np.stack(expected_obs), np.stack(env_obs[env_id]))
+
+
+class _StepErrorWrapper(gym.Wrapper):
+    def step(self, action):
+        raise RuntimeError("Env step failed")
+
+
+def _make_step_error_env(seed):
+    return _StepErrorWrapper(_make_env(seed))
+
+
+@pytest.mark.parametrize("transport", ["pipe", "shmem"])
+def test_shmem_worker_error(transport):
+    envs = ShmemVecEnv(
+        [partial(_make_step_error_env, seed=i) for i in range(2)],
+        context="fork",
+        transport=transport,
+    )
+    envs.reset()
+    with pytest.raises(EOFError):
+        envs.step(np.zeros(2, dtype=np.int64))
+    envs.close()
+
+
+@pytest.mark.parametrize("envs_per_worker", [1, 2])
+def test_async_recv_send_shmem_transport(envs_per_worker):
+    envs = ShmemVecEnv(
+        _env_fns(4),
+        context="fork",
+        envs_per_worker=envs_per_worker,
+        transport="shmem",
+    )
+    envs.async_reset()
+    num_recv = np.zeros(4)
+    while num_recv.min() < 20:
+        obs, _, _, _, env_ids = envs.recv(batch_size=2)
+        assert obs.shape == (2, 4)
+        num_recv[env_ids] += 1
+        envs.send(np.ones(2, dtype=np.int64), env_ids)
+    envs.close()
+
+
+@pytest.mark.parametrize("num_threads", [None, 2])
+def test_thread_matches_dummy(num_threads):
+    expected = _rollout(DummyVecEnv(_env_fns(3)))
+    result = _rollout(ThreadVecEnv(_env_fns(3), num_threads=num_threads))
+    for exp_v, res_v in zip(expected, result):
+        assert np.allclose(exp_v, res_v)
+
+
+@pytest.mark.parametrize("vec_env_cls", [DummyVecEnv, ThreadVecEnv])
+def test_double_buffer(vec_env_cls):
+    expected = _rollout(DummyVecEnv(_env_fns(3)))
+    result = _rollout(vec_env_cls(_env_fns(3), double_buffer=True))
+    for exp_v, res_v in zip(expected, result):
+        assert np.allclose(exp_v, res_v)
+
+    # The result of a step must survive the next step.
+    envs = vec_env_cls(_env_fns(3), double_buffer=True)
+    envs.reset()
+    prev_obs, prev_rews, _, _ = envs.step(np.zeros(3, dtype=np.int64))
+    prev_obs_copy = np.copy(prev_obs)
+    obs, rews, _, _ = envs.step(np.ones(3, dtype=np.int64))
+    assert obs is not prev_obs and rews is not prev_rews
+    assert np.allclose(prev_obs, prev_obs_copy)
+    envs.close()
+
+
+def test_shmem_forkserver_given_spaces():
+    env = _make_env(0)
+    spaces = (env.observation_space, env.action_space)
+    expected = _rollout(DummyVecEnv(_env_fns(3)))
+    result = _rollout(
+        ShmemVecEnv(_env_fns(3), spaces=spaces, context="forkserver"),
+    )
+    for exp_v, res_v in zip(expected, result):
+        assert np.allclose(exp_v, res_v)
+
+
+def test_worker_resources(monkeypatch):
+    monkeypatch.delenv("SLURM_CPUS_PER_TASK", raising=False)
+    assert get_worker_resources(2) == ([None, None], None)
+    assert get_worker_resources(2, [[0], [1]], 3) == ([[0], [1]], 3)
+
+    monkeypatch.setattr(vec_env, "get_available_cpus", lambda: [0, 1, 2, 3])
+    monkeypatch.setenv("SLURM_CPUS_PER_TASK", "4")
+    assert get_worker_resources(2) == ([[0, 1], [2, 3]], 2)
+    assert get_worker_resources(6) == ([[0], [1], [2], [3], [0], [1]], 1)
+
+
+def test_shmem_worker_resources():
+    cpus = get_available_cpus()
+    result = _rollout(
+        ShmemVecEnv(
+            _env_fns(2),
+            context="fork",
+            worker_cpus=[cpus[:1], cpus[-1:]],
+            worker_num_threads=1,
+        )
+    )
+    expected = _rollout(DummyVecEnv(_env_fns(2)))
+    for exp_v, res_v in zip(expected, result):
+        assert np.allclose(exp_v, res_v)
+
+
+def _roll_frame_stack(obs_seq, dones_seq, nstack):
+    # `np.roll` based frame stacking, shifting by whole frames.
+    frame_dim = obs_seq[0].shape[-1]
+    stackedobs = np.zeros(obs_seq[0].shape[:-1] + (frame_dim * nstack,))
+    stackedobs[..., -frame_dim:] = obs_seq[0]
+    result = [stackedobs]
+    for obs, dones in zip(obs_seq[1:], dones_seq):
+        stackedobs = np.roll(stackedobs, shift=-frame_dim, axis=-1)
+        stackedobs[dones] = 0
+        stackedobs[..., -frame_dim:] = obs
+        result.append(stackedobs)
+    return np.stack(result)
+
+
+@pytest.mark.parametrize("copy_obs", [True, False])
+@pytest.mark.parametrize("lazy_frames", [True, False])
+def test_frame_stack(copy_obs, lazy_frames):
+    nstack = 3
+    obs_seq, _, dones_seq = _rollout(DummyVecEnv(_env_fns(3)))
+    expected = _roll_frame_stack(obs_seq, dones_seq, nstack)
+
+    envs = VecFrameStack(
+        DummyVecEnv(_env_fns(3)), nstack, copy_obs=copy_obs, lazy_frames=lazy_frames
+    )
+    obs = envs.reset()
+    all_obs = [obs if lazy_frames else np.copy(obs)]
+    for step_i in range(len(dones_seq)):
+        actions = np.array([(step_i + i) % 2 for i in range(envs.num_envs)])
+        obs, _, _, _ = envs.step(actions)
+        assert np.allclose(envs.stackedobs, expected[step_i + 1])
+        if lazy_frames:
+            assert isinstance(obs, LazyFrames)
+            assert np.allclose(np.asarray(obs[1]), expected[step_i + 1, 1])
+            all_obs.append(obs)
+        else:
+            all_obs.append(np.copy(obs))
+    envs.close()
+
+    # Older lazy frames must not change as new steps come in.
+    assert np.allclose(np.stack([np.asarray(o) for o in all_obs]), expected)
+    if lazy_frames:
+        with pytest.raises(ValueError):
+            all_obs[-1].__array__(copy=False)
+
+
+def test_stack_helper():
+    n_procs, n_stack, ob_shape = 3, 3, (2, 5)
+    helper = StackHelper(ob_shape, n_stack, "cpu", n_procs)
+    rng = np.random.default_rng(0)
+
+    def frame_stack(frames):
+        # Zero pad and stack the frames of each env along the first obs axis.
+        pad = [np.zeros(ob_shape)] * (n_stack - len(frames))
+        return np.concatenate(pad + frames[-n_stack:], axis=0)
+
+    obs = rng.normal(size=(n_procs, *ob_shape))
+    env_frames = [[obs[i]] for i in range(n_procs)]
+    stacked = helper.reset(torch.tensor(obs))
+    for _ in range(10):
+        assert np.allclose(stacked, [frame_stack(f) for f in env_frames])
+
+        dones = rng.random(n_procs) < 0.3
+        final_obs = rng.normal(size=(n_procs, *ob_shape))
+        infos = [
+            {"final_obs": final_obs[i]} if dones[i] else {} for i in range(n_procs)
+        ]
+        obs = rng.normal(size=(n_procs, *ob_shape))
+        stacked, infos = helper.update_obs(torch.tensor(obs), dones, infos)
+
+        for i in range(n_procs):
+            if dones[i]:
+                expected_final = frame_stack(env_frames[i] + [final_obs[i]])
+                assert np.allclose(infos[i]["final_obs"], expected_final)
+                env_frames[i] = [obs[i]]
+            else:
+                env_frames[i].append(obs[i])
+
+
+class _LargeObsEnv(gym.Env):
+    """
+    Returns the same large observation without allocating per step.
+    """
+
+    def __init__(self, obs_dtype):
+        self.observation_space = gym.spaces.Box(-1.0, 1.0, (50_000,), obs_dtype)
+        self.action_space = gym.spaces.Discrete(2)
+        self._obs = np.zeros(self.observation_space.shape, obs_dtype)
+
+    def reset(self):
+        return self._obs
+
+    def step(self, action):
+        return self._obs, 0.0, False, {}
+
+
+@pytest.mark.parametrize("obs_dtype", [np.float32, np.float64])
+def test_vec_pytorch_allocations(obs_dtype):
+    def get_step_alloc(inplace_convert):
+        envs = VecPyTorch(
+            DummyVecEnv([partial(_LargeObsEnv, obs_dtype)] * 2, double_buffer=True),
+            "cpu",
+            inplace_convert=inplace_convert,
+        )
+        envs.reset()
+        actions = torch.zeros((2, 1), dtype=torch.long)
+        for _ in range(2):
+            envs.step(actions)
+
+        tracemalloc.start()
+        for _ in range(5):
+            obs, _, _, _ = envs.step(actions)
+            assert obs.dtype == torch.float32
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        envs.close()
+        return peak
+
+    obs_nbytes = 2 * 50_000 * 4
+    if obs_dtype == np.float32:
+        # float32 observations are wrapped without a copy.
+        assert get_step_alloc(False) < obs_nbytes
+    else:
+        assert get_step_alloc(False) >= obs_nbytes
+        assert get_step_alloc(True) < obs_nbytes
+
+
+def test_vec_monitor():
+    envs = VecMonitor(DummyVecEnv(_env_fns(3)), episode_summary=True)
+    envs.reset()
+    eprets = np.zeros(3)
+    eplens = np.zeros(3, dtype=np.int64)
+    num_eps = 0
+    for step_i in range(100):
+        actions = np.array([(step_i + i) % 2 for i in range(envs.num_envs)])
+        _, rews, dones, infos = envs.step(actions)
+        eprets += rews
+        eplens += 1
+        done_ids = np.nonzero(dones)[0]
+        assert np.allclose(envs.episode_summary["episode.reward"], eprets[done_ids])
+        assert np.array_equal(envs.episode_summary["episode.length"], eplens[done_ids])
+        assert get_episode_summary(VecPyTorch(envs, "cpu")) is envs.episode_summary
+        for i, info in enumerate(infos):
+            assert ("episode" in info) == dones[i]
+            if dones[i]:
+                assert np.isclose(info["episode"]["reward"], eprets[i])
+                assert info["episode"]["length"] == eplens[i]
+        num_eps += len(done_ids)
+        eprets[done_ids] = 0
+        eplens[done_ids] = 0
+    assert num_eps > 0 and envs.epcount == num_eps
+    envs.close()
+
+
+class _InfoWrapper(gym.Wrapper):
+    """
+    Adds info values that do and do not fit in columns.
+    """
+
+    def reset(self, **kwargs):
+        self._step_i = 0
+        return self.env.reset(**kwargs)
+
+    def step(self, action):
+        obs, rew, done, info = self.env.step(action)
+        self._step_i += 1
+        info["step"] = self._step_i
+        info["pos"] = obs[:2].astype(np.float64)
+        info["success"] = bool(obs[0] > 0)
+        info["nested"] = {"a": self._step_i}
+        if self._step_i % 7 == 0:
+            # Only sometimes present, and sometimes of a different shape.
+            info["pos"] = np.zeros(3)
+            info["sometimes"] = 1.0
+        return obs, rew, done, info
+
+
+def _make_info_env(seed):
+    return _InfoWrapper(_make_env(seed))
+
+
+@pytest.mark.parametrize("envs_per_worker", [1, 2])
+def test_shmem_columnar_infos(envs_per_worker):
+    num_envs = 3
+    env_fns = [partial(_make_info_env, seed=i) for i in range(num_envs)]
+    expected_envs = VecMonitor(DummyVecEnv(env_fns))
+    envs = VecMonitor(
+        ShmemVecEnv(
+            env_fns,
+            context="fork",
+            envs_per_worker=envs_per_worker,
+            columnar_infos=True,
+        )
+    )
+    expected_logger = _make_logger()
+    logger = _make_logger()
+    expected_envs.reset()
+    envs.reset()
+    for step_i in range(50):
+        actions = np.array([(step_i + i) % 2 for i in range(num_envs)])
+        _, _, _, expected_infos = expected_envs.step(actions)
+        _, _, _, infos = envs.step(actions)
+        assert isinstance(infos, ColumnarInfos)
+        if step_i > 0:
+            assert set(infos.columns.keys()) == {
+                "step",
+                "pos",
+                "success",
+                "episode.reward",
+                "episode.length",
+            }
+        for expected_info, info in zip(expected_infos, infos):
+            assert expected_info.keys() == info.keys()
+            for k, v in expected_info.items():
+                if k == "episode":
+                    assert np.isclose(v["reward"], info[k]["reward"])
+                    assert v["length"] == info[k]["length"]
+                elif k != "final_obs":
+                    assert np.array_equal(v, info[k])
+
+        expected_logger.collect_env_step_info(expected_infos)
+        logger.collect_env_step_info(infos)
+    expected_envs.close()
+    envs.close()
+
+    assert expected_logger._step_log_info.keys() == logger._step_log_info.keys()
+    for k, v in expected_logger._step_log_info.items():
+        assert np.allclose(v, logger._step_log_info[k])
+    expected_logger.close()
+    logger.close()
+
+
+def _make_logger():
+    return Logger(0, "", "", "", {}, smooth_len=100, run_name="test_run")
+
+
+@pytest.mark.parametrize(
+    "env_step_time,parallel_fraction,vec_env_type",
+    [(1e-6, 0.0, "dummy"), (1e-2, 0.0, "shmem"), (2e-4, 1.0, "thread")],
+)
+def test_estimate_vec_env_choices(env_step_time, parallel_fraction, vec_env_type):
+    choices = estimate_vec_env_choices(16, 8, env_step_time, parallel_fraction)
+    best = min(choices.values(), key=lambda c: c.est_step_time)
+    assert best.vec_env_type == vec_env_type
+    assert choices["shmem"].num_workers == 8
+    assert choices["shmem"].envs_per_worker == 2
+    # A single CPU can't run anything in parallel.
+    choices = estimate_vec_env_choices(16, 1, env_step_time, parallel_fraction)
+    assert min(choices.values(), key=lambda c: c.est_step_time).vec_env_type == "dummy"
+
+
+def test_choose_vec_env_cache(monkeypatch, tmp_path):
+    monkeypatch.setattr(CacheHelper, "CACHE_PATH", str(tmp_path))
+    num_created = []
+
+    def env_fn():
+        num_created.append(1)
+        return _make_env(0)
+
+    choice = choose_vec_env(env_fn, 4, cache_name="CartPole-v1", num_timing_steps=20)
+    assert len(num_created) > 0
+    num_created.clear()
+    assert choose_vec_env(env_fn, 4, cache_name="CartPole-v1") == choice
+    assert len(num_created) == 0
+
+
+def test_env_fn_key():
+    key = get_env_fn_key(partial(_make_env, env_id="CartPole-v1"))
+    assert key == get_env_fn_key(partial(_make_env, env_id="CartPole-v1"))
+    assert key != get_env_fn_key(partial(_make_env, env_id="Pendulum-v1"))
+    assert get_env_fn_key(_make_env).endswith("test_vec_env._make_env")
+
+
+def test_create_auto_vec_env(monkeypatch, tmp_path):
+    monkeypatch.setattr(CacheHelper, "CACHE_PATH", str(tmp_path))
+    envs = create_vectorized_envs("CartPole-v1", 4, vec_env_type="auto")
+    envs.reset()
+    for _ in range(10):
+        envs.step(torch.zeros(4, 1, dtype=torch.long))
+    envs.close()
+
+
+@pytest.mark.parametrize(
+    "vec_env_cls,stages",
+    [
+        (DummyVecEnv, ["env_step", "copy_results"]),
+        (ThreadVecEnv, ["env_step", "copy_results"]),
+        (partial(SubprocVecEnv, envs_per_worker=2), ["wait", "unpickle", "stack_obs"]),
+        (
+            partial(ShmemVecEnv, envs_per_worker=2),
+            ["wait", "decode_infos", "decode_obs"],
+        ),
+    ],
+)
+def test_timing_stats(vec_env_cls, stages):
+    envs = VecPyTorch(VecMonitor(vec_env_cls(_env_fns(4))), torch.device("cpu"))
+    assert envs.get_timing_stats() == {}
+    envs.enable_timing()
+    envs.reset()
+    for _ in range(10):
+        envs.step(torch.zeros(4, 1, dtype=torch.long))
+    stats = envs.get_timing_stats(reset=True)
+    envs.close()
+
+    name = type(envs.unwrapped).__name__
+    for stage in ["step_wait"] + stages:
+        assert stats[f"{name}.{stage}.count"] == 10
+    if name in ("SubprocVecEnv", "ShmemVecEnv"):
+        assert stats[f"{name}.slowest_worker.env_step.count"] == 10
+        assert stats[f"{name}.mean_worker.env_step.total_s"] > 0
+        assert not any(".worker0." in k for k in stats)
+    for wrapper_name in ["VecMonitor", "VecPyTorch"]:
+        assert stats[f"{wrapper_name}.step_wait.count"] == 10
+        assert 0 <= stats[f"{wrapper_name}.step_wait.self_total_s"]
+        assert stats[f"{wrapper_name}.step_wait.p50_ms"] <= (
+            stats[f"{wrapper_name}.step_wait.p99_ms"]
+        )
+    assert envs.get_timing_stats() == {}
+
+
+def test_per_worker_timing_stats():
+    envs = ShmemVecEnv(_env_fns(4), context="fork", envs_per_worker=2)
+    envs.enable_timing(per_worker=True)
+    envs.reset()
+    for _ in range(10):
+        envs.step(np.zeros(4, dtype=np.int64))
+    stats = envs.get_timing_stats()
+    envs.close()
+    for worker_idx in range(2):
+        assert stats[f"ShmemVecEnv.worker{worker_idx}.env_step.count"] == 10